@@ -0,0 +1,236 @@
+"""
+Almacén en disco de los archivos generados - GEIH
+
+Con bases nacionales, tener en memoria los cuatro libros (más sus Parquet) a
+la vez que la base de entrada agota la RAM del contenedor. Aquí los libros se
+escriben directamente a una carpeta de salidas y lo que circula entre
+procesos, trabajos y la sesión es solo una referencia al archivo
+(SalidaEnDisco); el contenido se lee del disco recién al descargarlo.
+
+La carpeta se depura al guardar cada archivo: se borran los archivos con más
+de VIDA_SALIDA segundos y, si aun así se pasa de MAX_BYTES_SALIDAS, los más
+antiguos primero. Los archivos de un trabajo en curso (trabajo_en_curso) no se
+borran, aunque la carpeta pase un rato del máximo: el trabajo todavía puede
+necesitarlos (p. ej. para copiarlos al ZIP).
+"""
+
+import os
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from io import BytesIO
+
+# Carpeta de salidas; REV_OCUPADOS_SALIDAS='' deja los archivos en memoria
+RUTA_SALIDAS = os.environ.get(
+    'REV_OCUPADOS_SALIDAS',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rev_ocupados_geih', 'salidas'),
+)
+# Tamaño máximo de la carpeta (bytes) y vida de cada archivo (segundos)
+MAX_BYTES_SALIDAS = 5 * 1024 ** 3
+VIDA_SALIDA = 24 * 60 * 60
+
+# Extensión de los archivos a medio escribir
+_PARCIAL = '.parcial'
+# Subcarpeta con una marca por trabajo en curso (su fecha es la de inicio)
+_EN_CURSO = '.en_curso'
+
+
+class SalidaEnDisco:
+    """Referencia a un archivo generado en el almacén (se puede enviar entre procesos)."""
+
+    def __init__(self, ruta, nbytes):
+        self.ruta = ruta
+        self.nbytes = nbytes
+
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def leer(self):
+        """Contenido del archivo; FileNotFoundError si ya se depuró."""
+        with open(self.ruta, 'rb') as f:
+            return f.read()
+
+
+def tamano_salida(salida):
+    """Bytes de una salida, en memoria (BytesIO) o en disco."""
+    if isinstance(salida, BytesIO):
+        return salida.getbuffer().nbytes
+    return salida.nbytes
+
+
+def salida_disponible(salida):
+    """False si la salida estaba en disco y ya se depuró."""
+    return not isinstance(salida, SalidaEnDisco) or salida.existe()
+
+
+class AlmacenSalidas:
+    """Carpeta de archivos generados con depuración por antigüedad y tamaño."""
+
+    def __init__(self, carpeta=RUTA_SALIDAS, max_bytes=MAX_BYTES_SALIDAS, vida=VIDA_SALIDA):
+        self.carpeta = carpeta
+        self.max_bytes = max_bytes
+        self.vida = vida
+
+    def guardar(self, extension, escribir):
+        """
+        Llama escribir(ruta) para crear un archivo nuevo en el almacén y
+        retorna su SalidaEnDisco. El archivo aparece con su nombre final solo
+        si escribir termina sin error.
+        """
+        temporal = self.reservar(extension)
+        try:
+            escribir(temporal)
+        except BaseException:
+            _borrar(temporal)
+            raise
+        return self.publicar(temporal)
+
+    def reservar(self, extension):
+        """Ruta temporal para un archivo nuevo; publicar(ruta) lo deja con su nombre final."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        self.depurar()
+        return os.path.join(self.carpeta, f'{uuid.uuid4().hex}{extension}{_PARCIAL}')
+
+    @contextmanager
+    def trabajo_en_curso(self, salidas=()):
+        """
+        Mientras dura el bloque, depurar no borra los archivos creados desde
+        que empezó ni las salidas indicadas (archivos anteriores que el trabajo
+        va a reutilizar; se marcan como recién usados). La marca queda en
+        disco, así que también la respetan los procesos del pool.
+        """
+        carpeta = os.path.join(self.carpeta, _EN_CURSO)
+        os.makedirs(carpeta, exist_ok=True)
+        marca = os.path.join(carpeta, uuid.uuid4().hex)
+        open(marca, 'w').close()
+        try:
+            for salida in salidas:
+                if isinstance(salida, SalidaEnDisco):
+                    try:
+                        os.utime(salida.ruta)
+                    except FileNotFoundError:
+                        pass
+            yield
+        finally:
+            _borrar(marca)
+
+    def _inicio_trabajos(self, ahora):
+        """Fecha de inicio del trabajo en curso más antiguo (infinito si no hay); descarta marcas abandonadas."""
+        inicio = float('inf')
+        carpeta = os.path.join(self.carpeta, _EN_CURSO)
+        if not os.path.isdir(carpeta):
+            return inicio
+        for entrada in os.scandir(carpeta):
+            try:
+                fecha = entrada.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if ahora - fecha > self.vida:
+                _borrar(entrada.path)
+            else:
+                inicio = min(inicio, fecha)
+        return inicio
+
+    @staticmethod
+    def publicar(temporal):
+        """Da su nombre final a un archivo reservado y retorna su SalidaEnDisco."""
+        ruta = temporal[:-len(_PARCIAL)]
+        os.replace(temporal, ruta)
+        return SalidaEnDisco(ruta, os.path.getsize(ruta))
+
+    def depurar(self):
+        """
+        Borra los archivos vencidos y, si se pasa del máximo, los más antiguos
+        que no sean de un trabajo en curso (ver trabajo_en_curso).
+        """
+        ahora = time.time()
+        inicio_trabajos = self._inicio_trabajos(ahora)
+        archivos = []
+        for entrada in os.scandir(self.carpeta):
+            try:
+                if entrada.is_dir():
+                    continue
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            # Los archivos a medio escribir solo se borran si quedaron abandonados
+            if ahora - info.st_mtime > self.vida:
+                _borrar(entrada.path)
+            elif not entrada.name.endswith(_PARCIAL):
+                archivos.append((info.st_mtime, info.st_size, entrada.path))
+        total = sum(nbytes for _, nbytes, _ in archivos)
+        for fecha, nbytes, ruta in sorted(archivos):
+            if total <= self.max_bytes or fecha >= inicio_trabajos:
+                break
+            _borrar(ruta)
+            total -= nbytes
+
+
+def _borrar(ruta):
+    # Otro proceso pudo haberlo borrado primero
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+class PaqueteZip:
+    """
+    ZIP con varios archivos generados, armado a medida que cada uno termina.
+    Se escribe en el almacén o en ruta (p. ej. una carpeta compartida), nunca
+    en memoria: sin almacén cada libro ya está en memoria y el ZIP lo tendría
+    dos veces. Los archivos en disco se copian al ZIP por partes, sin cargarlos
+    completos; xlsx y Parquet ya vienen comprimidos, así que se guardan sin
+    volver a comprimir.
+    """
+
+    def __init__(self, almacen=None, ruta=None):
+        self.almacen = almacen
+        self.ruta = ruta
+        if ruta is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+            self._destino = ruta + _PARCIAL
+        elif almacen is not None:
+            self._destino = almacen.reservar('.zip')
+        else:
+            raise ValueError("El ZIP necesita un almacén de salidas o una ruta")
+        self._zip = zipfile.ZipFile(self._destino, 'w', zipfile.ZIP_STORED)
+        self.n_archivos = 0
+
+    def agregar(self, nombre, salida):
+        """Agrega una salida (ruta, SalidaEnDisco o BytesIO) con ese nombre dentro del ZIP."""
+        if isinstance(salida, (str, SalidaEnDisco)):
+            self._zip.write(getattr(salida, 'ruta', salida), nombre)
+        else:
+            with self._zip.open(nombre, 'w') as f:
+                f.write(salida.getbuffer())
+        self.n_archivos += 1
+
+    def cerrar(self):
+        """Cierra el ZIP y lo retorna: la ruta o, en el almacén, una SalidaEnDisco."""
+        self._zip.close()
+        if self.ruta is not None:
+            os.replace(self._destino, self.ruta)
+            return self.ruta
+        return self.almacen.publicar(self._destino)
+
+    def descartar(self):
+        """Cierra y borra un ZIP que no se va a usar."""
+        self._zip.close()
+        _borrar(self._destino)
+
+
+_ALMACEN = {}
+
+
+def almacen_por_defecto():
+    """Almacén en RUTA_SALIDAS; None si está desactivado o la carpeta no se puede crear."""
+    if RUTA_SALIDAS not in _ALMACEN:
+        try:
+            if RUTA_SALIDAS:
+                os.makedirs(RUTA_SALIDAS, exist_ok=True)
+            _ALMACEN[RUTA_SALIDAS] = AlmacenSalidas(RUTA_SALIDAS) if RUTA_SALIDAS else None
+        except OSError:
+            _ALMACEN[RUTA_SALIDAS] = None
+    return _ALMACEN[RUTA_SALIDAS]
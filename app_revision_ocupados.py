@@ -6,13 +6,33 @@ Versión corregida que mantiene la estructura y lógica de los notebooks origina
 """
 
 import streamlit as st
-import pandas as pd
-import numpy as np
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
-from io import BytesIO
+from contextlib import nullcontext
 from datetime import datetime
+from io import BytesIO
+import hashlib
+
+from generacion import (
+    MAX_HOJAS_PARTICION,
+    PARTICIONES,
+    POSICIONES,
+    clasificar_posicion,
+    escribir_posicion,
+    escribir_parquet_posicion,
+    generar_excel_por_bloques,
+    generar_en_paralelo,
+    partir_por_posicion,
+)
+from lectura import (
+    FORMATOS_ENTRADA,
+    leer_base_proyectada,
+    leer_base_posiciones,
+    contar_posiciones_por_bloques,
+)
+from diccionarios import diccionarios_vigentes, fuente_por_defecto
+from rendimiento import Rendimiento, registrar, perfilar
+from revision_incremental import ETIQUETAS_DELTA, RondasRevision, describir_ronda, nombre_ronda
+from trabajos import FALLIDO, CacheCompartido, ColaTrabajos
+from almacen_salidas import PaqueteZip, SalidaEnDisco, almacen_por_defecto, salida_disponible
 
 # =============================================================================
 # CONFIGURACIÓN DE LA PÁGINA
@@ -24,1010 +44,369 @@ st.set_page_config(
 )
 
 # =============================================================================
-# ESTILOS Y CONSTANTES GLOBALES
+# CACHÉ POR CONTENIDO DEL ARCHIVO
 # =============================================================================
-ROJO = PatternFill('solid', fgColor='FF6B6B')
-AMARILLO = PatternFill('solid', fgColor='FFE066')
-VERDE = PatternFill('solid', fgColor='8FD14F')
-AZUL = PatternFill('solid', fgColor='87CEEB')
-
-ORDEN_RAMAS = [
-    'No informa',
-    'Agricultura, ganadería, caza, silvicultura y pesca',
-    'Explotación de Minas y Canteras',
-    'Comercio y reparación de vehículos',
-    'Alojamiento y servicios de comida',
-    'Industria manufacturera',
-    'Suministro de agua y gestión de desechos',
-    'Construcción',
-    'Transporte y almacenamiento',
-    'Información y comunicaciones',
-    'Actividades financieras y de seguros',
-    'Actividades Inmobiliarias',
-    'Actividades profesionales, científicas, técnicas y servicios administrativos',
-    'Administración pública y defensa, educación y atención de la salud',
-    'Actividades artísticas, entretenimiento, recreación y otras actividades de servicios'
-]
+# Streamlit vuelve a ejecutar todo el script en cada interacción. La lectura y
+# la clasificación quedan en caché con la huella del contenido del archivo como
+# llave (el archivo no entra en la llave). El resumen se calcula en el script
+# (st.cache_data, el argumento _archivo no entra en la llave); la base completa
+# y las posiciones clasificadas, en los trabajos, que no pueden usar st.cache_*:
+# van en cachés compartidos por todas las sesiones (ver CacheCompartido).
+
+def huella_archivo(archivo):
+    """Huella SHA-256 del contenido del archivo subido; se calcula una vez por carga."""
+    huellas = st.session_state.setdefault('huellas_archivo', {})
+    if archivo.file_id not in huellas:
+        huellas[archivo.file_id] = hashlib.sha256(archivo.getvalue()).hexdigest()
+    return huellas[archivo.file_id]
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def resumen_archivo(huella, nombre, _archivo):
+    """(registros, columnas de revisión, conteo por p6430) del archivo."""
+    _archivo.seek(0)
+    df = leer_base_proyectada(_archivo, nombre)
+    conteo = df['p6430'].value_counts().to_dict() if 'p6430' in df.columns else {}
+    return len(df), len(df.columns), conteo
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def resumen_archivo_por_bloques(huella, nombre, _archivo):
+    """Conteo por p6430 recorriendo el archivo por bloques."""
+    _archivo.seek(0)
+    return contar_posiciones_por_bloques(_archivo, nombre)
+
+
+@st.cache_resource
+def caches_trabajos():
+    """Cachés de los trabajos: base completa por posición y posiciones clasificadas."""
+    return {'bases': CacheCompartido(max_entradas=2), 'posiciones': CacheCompartido(max_entradas=8)}
+
+
+# La base completa se comparte sin copiar: cada posición es una vista de solo
+# lectura y con copy-on-write de pandas nadie puede modificarla.
+def base_posiciones(caches, huella, nombre, archivo):
+    """Todas las columnas de los registros de las cuatro posiciones revisadas, por posición."""
+    def leer():
+        archivo.seek(0)
+        df = leer_base_posiciones(archivo, nombre, [spec['p6430'] for spec in POSICIONES.values()])
+        return partir_por_posicion(df)
+    return caches['bases'].obtener((huella, nombre), leer)
+
+
+# La huella de los diccionarios entra en la llave: al publicar una versión
+# nueva se vuelve a clasificar sin reiniciar la aplicación
+def posicion_clasificada(caches, huella, nombre, tipo, diccionarios, archivo):
+    """Registros de una posición con sus columnas de clasificación."""
+    return caches['posiciones'].obtener(
+        ('clasificada', huella, nombre, tipo, diccionarios.huella),
+        lambda: clasificar_posicion(tipo, base_posiciones(caches, huella, nombre, archivo)[tipo],
+                                    diccionarios=diccionarios))
+
+
+# La ronda se guarda una vez por contenido y nombre de ronda: volver a generar
+# con el mismo archivo no lo compara consigo mismo
+def posicion_incremental(caches, huella, nombre, tipo, diccionarios, ronda, archivo):
+    """(registros clasificados, cambios frente a la ronda anterior) de una posición."""
+    return caches['posiciones'].obtener(
+        ('incremental', huella, nombre, tipo, diccionarios.huella, ronda),
+        lambda: RondasRevision(ronda).clasificar(tipo, base_posiciones(caches, huella, nombre, archivo)[tipo],
+                                                 diccionarios, nombre))
 
 # =============================================================================
-# DICCIONARIOS EMPLEADOS DEL GOBIERNO (P6430=2)
+# GENERACIÓN EN SEGUNDO PLANO
 # =============================================================================
+# El botón encola un trabajo (trabajos.py) y la página solo muestra su avance:
+# el script no queda bloqueado mientras se escriben los libros, y se puede
+# salir de la página y volver a descargar mientras el trabajo no se descarte.
 
-# Ramas donde NO debe haber empleados del gobierno
-RAMAS_PROHIBIDAS_GOBIERNO = [
-    'No informa',
-    'Agricultura, ganadería, caza, silvicultura y pesca',
-    'Explotación de Minas y Canteras',
-    'Comercio y reparación de vehículos',
-    'Construcción',
-    'Alojamiento y servicios de comida'
-]
-
-# Ramas donde operan empresas mixtas/industriales del Estado
-RAMAS_EMPRESAS_MIXTAS = [
-    'Industria manufacturera',
-    'Suministro de agua y gestión de desechos',
-    'Transporte y almacenamiento',
-    'Información y comunicaciones',
-    'Actividades financieras y de seguros'
-]
-
-# Tipo de revisión por rama para gobierno
-TIPO_REVISION_GOB = {
-    'No informa': 1,
-    'Agricultura, ganadería, caza, silvicultura y pesca': 1,
-    'Explotación de Minas y Canteras': 2,
-    'Comercio y reparación de vehículos': 1,
-    'Construcción': 2,
-    'Alojamiento y servicios de comida': 1,
-    'Industria manufacturera': 2,
-    'Suministro de agua y gestión de desechos': 2,
-    'Transporte y almacenamiento': 2,
-    'Información y comunicaciones': 2,
-    'Actividades financieras y de seguros': 2,
-    'Actividades Inmobiliarias': 1,
-    'Actividades profesionales, científicas, técnicas y servicios administrativos': 2,
-    'Administración pública y defensa, educación y atención de la salud': 0,
-    'Actividades artísticas, entretenimiento, recreación y otras actividades de servicios': 2
-}
-
-# Entidades para cambio de rama
-PALABRAS_RAMA_8412 = ['INVIAS', 'INSTITUTO NACIONAL DE VIAS', 'INVIR', 'ARCHIVO GENERAL', 'UNP', 
-                      'UNIDAD NACIONAL DE PROTECCION', 'DIAN']
-PALABRAS_RAMA_8414 = ['INSTITUTO COLOMBIANO AGROPECUARIO', ' ICA ', 'ICA-', 'AERONAUTICA CIVIL', 
-                      'AEROCIVIL', 'DIMAR', 'ANI', 'AGENCIA NACIONAL DE INFRAESTRUCTURA',
-                      'AGENCIA DE DESARROLLO RURAL', 'ADR', 'UNIDAD DE RESTITUCION', 'IGAC', 
-                      'INSTITUTO GEOGRAFICO', 'SUPERINTENDENCIA', 'TRANSITO']
-PALABRAS_RAMA_8413 = ['CORPORACION AUTONOMA', 'CAR ', 'CORPOAMAZONIA', 'CORTOLIMA', 'CORPOCALDAS',
-                      'CORPOBOYACA', 'CORPONARIÑO', 'CRQ', 'CDA ', 'PARQUE NACIONAL',
-                      'INDERVALLE', 'INDEPORTES', 'COLDEPORTES']
-PALABRAS_RAMA_8424 = ['JUZGADO', 'FISCALIA', 'RAMA JUDICIAL', 'TRIBUNAL', 'PALACIO DE JUSTICIA',
-                      'MEDICINA LEGAL', 'INPEC']
-PALABRAS_RAMA_8415 = ['DEFENSORIA DEL PUEBLO', 'REGISTRADURIA', 'PERSONERIA']
-PALABRAS_RAMA_8421 = ['MIGRACION COLOMBIA', 'CONSULADO', 'EMBAJADA', 'CANCILLERIA']
-
-# Empresas con régimen laboral privado
-EMPRESAS_REGIMEN_PRIVADO = ['ECOPETROL', 'CENIT']
-
-# Entidades privadas - NO son gobierno
-ENTIDADES_PRIVADAS_NO_GOBIERNO = ['CAMARA DE COMERCIO', 'FUNERARIA', 'NOTARIA']
-
-# Empresas mixtas/industriales del Estado
-EMPRESAS_MIXTAS = [
-    # Energía
-    'ISA ', 'ISAGEN', 'GECELCA', 'GENSA', 'CHEC', 'HIDROELECTRICA', 'ELECTRIFICADORA', 'CEELVA',
-    # Servicios públicos
-    'EMCALI', 'EPM', 'EMPRESAS PUBLICAS DE MEDELLIN', 'ACUEDUCTO', 'EAAB', 'ALCANTARILLADO',
-    'EMPRESAS PUBLICAS DE', ' ESP', ' SA ESP', ' SAS ESP', 'EMPRESA DE SERVICIOS PUBLICOS',
-    'SERVICIOS PUBLICOS DOMICILIARIOS', 'UNIDAD DE SERVICIOS PUBLICOS',
-    # Agua
-    'AGUAS DE ', 'AGUAS DEL ', 'AGUAS Y AGUAS', 'EMPAS', 'EMPOCALDAS', 'EMPOOBANDO',
-    'EMPOCHIQUINQUIRA', 'ESSMAR', 'IBAL', 'SAAAB', 'ACUAVALLE', 'ACUAOCCIDENTE', 'PLANTA DE TRATAMIENTO',
-    # Financieras
-    'BANCO AGRARIO', 'FONDO NACIONAL DEL AHORRO', 'FNA ', 'COLPENSIONES', 'POSITIVA', 
-    'FIDUPREVISORA', 'FINDETER', 'BANCOLDEX', 'FINAGRO', 'INFIBAGUE',
-    # Manufactura estatal
-    'LICORERA', 'INDUSTRIA LICORERA', 'INDUMIL', 'INDUSTRIA MILITAR', 'IMPRENTA NACIONAL', 'CIAC',
-    # Transporte
-    'METRO DE MEDELLIN', 'METRO DE BOGOTA', '472', 'SERVICIOS POSTALES', 'TERMINAL DE TRANSPORTE', 'SATENA',
-    # Telecomunicaciones
-    'ETB', 'EMPRESA DE TELECOMUNICACIONES', 'TELECARIBE', 'RTVC',
-    # Otros
-    'INNPULSA', 'SINCHI', 'LOTERIA', 'CORPOICA', 'AGROSAVIA', 'METROPARQUES', 
-    'ARTESANIAS DE COLOMBIA', 'CISA'
-]
-
-# Cargos directivos
-CARGOS_DIRECTIVOS_P6370 = ['PRESIDENTE', 'DIRECTOR', 'GERENTE', 'SUBGERENTE', 'VICEPRESIDENTE',
-                           'SUBDIRECTOR', 'JEFE DE ', 'SECRETARIO GENERAL']
-VALOR_DIRECTIVO_G_P6370S3 = 'Directores y gerentes'
-
-# Entidades privadas en Adm. Pública
-PALABRAS_PRIVADAS_ADM_PUBLICA = [
-    'EPS ', 'SAVIA SALUD', 'ASMET SALUD', 'COMFACHOCO', 'NUEVA EPS', 'SANITAS', 'COOMEVA', 
-    'SURA EPS', 'FAMISANAR', 'CLINICA ', 'HOSPITAL PRIVADO', 'FUNDACION ', 'HOGAR DE PASO', 
-    'CENTRO DE BIENESTAR', 'COOPERATIVA', 'COOP ', 'ASOTRAINFA', 'GIMNASIO ',
-    'S.A.S', ' SAS', ' LTDA', ' S.A.', ' S.A ', 'MI RED IPS'
-]
-
-# Contratantes gobierno
-CONTRATANTES_GOBIERNO = [
-    'SECRETARIA', 'MINISTERIO', 'ALCALDIA', 'GOBERNACION', 'DEPARTAMENTO', 'MUNICIPIO', 
-    'GOBIERNO', 'ESTADO', 'ICBF', 'INSTITUTO COLOMBIANO DE BIENESTAR', 'BIENESTAR FAMILIAR',
-    'SENA', 'EJERCITO', 'POLICIA', 'ARMADA', 'FUERZA AEREA', 'PROCURADURIA', 'CONTRALORIA', 
-    'DEFENSORIA', 'DIAN', 'DANE', 'DNP', 'REGISTRADURIA', 'FISCALIA'
-]
-
-# Palabras que indican contratista
-PALABRAS_CONTRATISTA = ['CONTRATISTA', 'PRESTACION DE SERVICIOS', 'PRESTACIÓN DE SERVICIOS',
-                        'OPS', 'ORDEN DE PRESTACION', 'CONTRATO DE PRESTACION']
-
-
-# =============================================================================
-# DICCIONARIOS EMPLEADOS PARTICULARES (P6430=1)
-# =============================================================================
-
-# Universidades públicas
-UNIVERSIDADES_PUBLICAS = [
-    'UNIVERSIDAD NACIONAL', 'UNIVERSIDAD DE ANTIOQUIA', 'UNIVERSIDAD DEL VALLE', 
-    'UNIVERSIDAD DE CARTAGENA', 'UNIVERSIDAD DEL CAUCA', 'UNIVERSIDAD DE CALDAS',
-    'UNIVERSIDAD DE CORDOBA', 'UNIVERSIDAD DEL ATLANTICO', 'UNIVERSIDAD DEL MAGDALENA', 
-    'UNIVERSIDAD DE NARIÑO', 'UNIVERSIDAD DEL TOLIMA', 'UNIVERSIDAD PEDAGOGICA',
-    'UNIVERSIDAD TECNOLOGICA DE PEREIRA', 'UTP ', 'UNIVERSIDAD SURCOLOMBIANA',
-    'UNIVERSIDAD DE PAMPLONA', 'UNIVERSIDAD DE LOS LLANOS', 'UNIVERSIDAD DE LA GUAJIRA',
-    'UNIVERSIDAD FRANCISCO DE PAULA', 'UFPS', 'UNIVERSIDAD DISTRITAL'
-]
-
-# Entidades del gobierno
-ENTIDADES_GOBIERNO = [
-    'MINISTERIO DE', 'MINISTERIO DEL', 'DEPARTAMENTO ADMINISTRATIVO NACIONAL DE ESTADISTICA',
-    'DEPARTAMENTO NACIONAL DE PLANEACION', 'DIRECCION DE IMPUESTOS Y ADUANAS',
-    'INSTITUTO COLOMBIANO', 'ICBF', ' SENA', 'INVIAS', 'INPEC', 'ICFES',
-    'FISCALIA', 'PROCURADURIA', 'CONTRALORIA', 'DEFENSORIA', 'REGISTRADURIA',
-    'POLICIA NACIONAL', 'EJERCITO NACIONAL', 'ARMADA NACIONAL', 'FUERZA AEREA',
-    'ALCALDIA', 'GOBERNACION', 'SECRETARIA DE', 'SECRETARIA DISTRITAL',
-    'CONCEJO', 'ASAMBLEA', 'CONGRESO', 'SENADO', 'CAMARA DE REPRESENTANTES',
-    'HOSPITAL DEPARTAMENTAL', 'HOSPITAL MUNICIPAL', 'E.S.E', 'ESE ', ' ESE',
-    'PERSONERIA', 'JUZGADO', 'TRIBUNAL'
-]
-
-# Instituciones educativas públicas
-INSTITUCIONES_EDUCATIVAS_PUBLICAS = ['INSTITUCION EDUCATIVA ', 'I.E. ', 'I.E.D.',
-                                     'COLEGIO DISTRITAL', 'COLEGIO DEPARTAMENTAL', 'COLEGIO MUNICIPAL']
-INDICADORES_IE_PRIVADA = ['CRISTIANA', 'CRISTIANO', 'EVANGELICA', 'EVANGELICO',
-                          'CATOLICA', 'CATOLICO', 'ADVENTISTA', 'BAUTISTA',
-                          'BILINGUE', 'CAMPESTRE', 'INTERNACIONAL', 'PRIVAD']
-
-# Empresas privadas
-EMPRESAS_PRIVADAS = ['S.A.S', ' SAS', 'LTDA', 'S.A.', ' SA ', 'CLINICA ', 'EPS ', 'IPS ', 
-                     'COLSANITAS', 'SANITAS', 'COOMEVA', 'SURA ', 'NUEVA EPS', 'COMPENSAR',
-                     'NOTARIA ', 'FUNERARIA']
+ICONOS = {'gobierno': '🏛️', 'particular': '🏢', 'familiar': '👨‍👩‍👧', 'otro': '❓'}
+NOMBRES = {'gobierno': 'Emp. Gobierno', 'particular': 'Emp. Particular',
+           'familiar': 'Trab. Familiar', 'otro': 'Otro, ¿cuál?'}
+ASIGNADOS = {'gobierno': 'Carolina', 'particular': 'Paula',
+             'familiar': 'Jeannette', 'otro': 'Jeannette'}
 
-# Palabras para jornalero
-PALABRAS_PRODUCCION_DIRECTA = ['ORDEÑ', 'ORDENA', 'SEMBRAR', 'SIEMBRA', 'PLANTAR',
-                               'RECOLECT', 'COSECH', 'CORTAR CAÑA', 'CORTERO',
-                               'FUMIG', 'ABON', 'FERTILIZ', 'DESHIERB', 'DESYERB', 
-                               'GUADAÑ', 'CHAPEAR', 'ROZAR', 'JORNALERO', 'PEON',
-                               'ALIMENTAR GANADO', 'ARREAR', 'PASTOREAR']
 
-PALABRAS_SUPERVISION = ['DIRIGIR', 'DIRIGE', 'DIRECCION', 'ADMINISTR', 'GERENTE', 'GERENCIA',
-                        'COORDINAR', 'COORDINADOR', 'PLANEAR', 'PLANIFICA', 'PLANEACION',
-                        'SUPERVISAR', 'SUPERVISOR', 'MAYORDOMO', 'CAPATAZ', 'ENCARGADO DE FINCA']
+@st.cache_resource
+def cola_trabajos():
+    """Cola de trabajos compartida por todas las sesiones."""
+    return ColaTrabajos()
 
-# Palabras para empleado doméstico
-PALABRAS_DOMESTICO = ['EMPLEADA DOMESTICA', 'EMPLEADO DOMESTICO', 'SERVICIO DOMESTICO',
-                      'ASEO EN CASA', 'HOGAR ', 'OFICIO DE LA CASA', 'LABORES DOMESTICAS',
-                      'NIÑERA', 'CUIDAR NIÑOS', 'CUIDADO DE NIÑOS']
 
-
-# =============================================================================
-# DICCIONARIOS TRABAJADOR FAMILIAR (P6430=6)
-# =============================================================================
-
-ENTIDADES_NO_FAMILIARES = [
-    # Entidades religiosas
-    'IGLESIA', 'PARROQUIA', 'TEMPLO', 'CAPILLA', 'CATEDRAL', 'DIOCESIS', 'ARQUIDIOCESIS', 
-    'CONGREGACION', 'COMUNIDAD RELIGIOSA',
-    # Entidades públicas
-    'ALCALDIA', 'GOBERNACION', 'MINISTERIO', 'SECRETARIA DE', 'INSTITUTO COLOMBIANO', 
-    'ICBF', 'SENA', 'POLICIA', 'EJERCITO', 'FISCALIA', 'PROCURADURIA', 'CONTRALORIA', 
-    'JUZGADO', 'TRIBUNAL', 'UNIVERSIDAD NACIONAL', 'UNIVERSIDAD DE ANTIOQUIA', 
-    'UNIVERSIDAD DEL VALLE', 'INSTITUCION EDUCATIVA', 'I.E.', 'E.S.E.', 'HOSPITAL DEPARTAMENTAL',
-    # Empresas formales
-    'S.A.S', 'SAS', 'S.A', 'LTDA', 'LIMITADA', 'E.S.P', 'ESP',
-    'BANCO', 'ALMACEN', 'SUPERMERCADO', 'EXITO', 'JUMBO', 'CARULLA', 'OLIMPICA',
-    'FUNDACION', 'CORPORACION', 'COOPERATIVA', 'ONG'
-]
-
-CARGOS_DECISION = [
-    'DUEÑO', 'DUEÑA', 'PROPIETARIO', 'PROPIETARIA', 'SOCIO', 'SOCIA', 'ACCIONISTA',
-    'GERENTE', 'DIRECTOR', 'DIRECTORA', 'ADMINISTRADOR GENERAL', 'ADMINISTRADORA GENERAL',
-    'REPRESENTANTE LEGAL', 'MI NEGOCIO', 'MI EMPRESA', 'NEGOCIO PROPIO', 'EMPRESA PROPIA',
-    'SU PROPIO NEGOCIO'
-]
-
-INDICADORES_FAMILIAR = [
-    'TIENDA ', 'MISCELANEA', 'PAPELERIA', 'PANADERIA', 'FERRETERIA', 'DROGUERIA', 
-    'PELUQUERIA', 'BARBERIA', 'RESTAURANTE ', 'CAFETERIA', 'FRUTERIA', 'CARNICERIA',
-    'TALLER ', 'SASTRERIA', 'MODISTERIA', 'LAVADERO', 'FINCA ', 'PARCELA', 'HACIENDA',
-    'DONDE ', 'DE ', 'LA ', 'EL ', 'LOS ', 'LAS '
-]
+def salidas_resultado(resultado):
+    """Archivos de un resultado (libro o {hoja: Parquet})."""
+    return list(resultado.values()) if isinstance(resultado, dict) else [resultado]
 
 
-# =============================================================================
-# DICCIONARIOS OTRO CUÁL (P6430=8)
-# =============================================================================
+def ya_generado(resultado):
+    """True si hay un resultado previo (libro o {hoja: Parquet}) y sus archivos siguen en el almacén."""
+    if resultado is None:
+        return False
+    return all(salida_disponible(salida) for salida in salidas_resultado(resultado))
 
-PALABRAS_CUENTA_PROPIA = [
-    'CONTRATISTA', 'PRESTACION DE SERVICIOS', 'PRESTACIÓN DE SERVICIOS',
-    'CONTRATO DE PRESTACION', 'CONTRATO DE PRESTACIÓN', 'PRESTA SERVICIOS',
-    'INDEPENDIENTE', 'FREELANCE', 'FREELANCER', 'POR SU CUENTA', 'TRABAJO INDEPENDIENTE'
-]
 
-PALABRAS_PATRON = ['SOCIO', 'SOCIA', 'DUEÑO', 'DUEÑA', 'PROPIETARIO', 'PROPIETARIA', 
-                   'ACCIONISTA', 'EMPRESARIO']
+def datos_descarga(salida):
+    """Datos para st.download_button: las salidas en disco se leen recién al hacer clic."""
+    return salida.leer if isinstance(salida, SalidaEnDisco) else salida
 
-PALABRAS_OTRO_VALIDO = [
-    'SUBCONTRATADO', 'SUBCONTRATADA', 'CONTRATADO POR UN ASALARIADO', 'CONTRATADA POR UN ASALARIADO',
-    'CONTRATADO POR TRABAJADOR', 'CONTRATADA POR TRABAJADOR', 'EMPLEADO DE UN INDEPENDIENTE',
-    'EMPLEADA DE UN INDEPENDIENTE', 'TRABAJA PARA UN ASALARIADO', 'TRABAJA PARA UNA ASALARIADA',
-    'CONTRATADO POR OTRA PERSONA', 'MADRE COMUNITARIA', 'AYUDANTE DE MADRE', 'OTRO PAIS', 
-    'OTRO PAÍS', 'TRABAJA EN OTRO', 'HIJO DEL MAYORDOMO', 'HIJA DEL MAYORDOMO'
-]
 
+def nombre_salida(tipo, fecha, hoja=None):
+    """Nombre del libro de la posición o, con hoja, de su Parquet."""
+    if hoja is None:
+        return f"{POSICIONES[tipo]['archivo']}_{fecha}.xlsx"
+    return f"{POSICIONES[tipo]['archivo']}_{fecha}_{hoja}.parquet"
 
-# =============================================================================
-# FUNCIONES DE CLASIFICACIÓN
-# =============================================================================
 
-def es_directivo(row):
-    """Verifica si la persona ocupa un cargo directivo."""
-    g_p6370s3 = str(row.get('g_p6370s3', '')).strip() if pd.notna(row.get('g_p6370s3')) else ''
-    if VALOR_DIRECTIVO_G_P6370S3.lower() in g_p6370s3.lower():
-        return True
-    p6370 = str(row.get('p6370', '')).upper() if pd.notna(row.get('p6370')) else ''
-    for cargo in CARGOS_DIRECTIVOS_P6370:
-        if cargo in p6370:
-            return True
-    return False
+def empaquetar(paquete, formato, tipo, resultado, fecha):
+    """Agrega al ZIP los archivos de un resultado, en la carpeta de quien revisa la posición."""
+    if paquete is None or not resultado:
+        return
+    salidas = resultado.items() if formato == 'parquet' else [(None, resultado)]
+    for hoja, salida in salidas:
+        paquete.agregar(f"{ASIGNADOS[tipo]}/{nombre_salida(tipo, fecha, hoja)}", salida)
 
 
-def clasificar_empleado_gobierno(row):
+def generar_revision(trabajo, huella, nombre, archivo, seleccion, opciones, resultados, conteo_p6430, caches):
     """
-    Clasifica empleados del gobierno (P6430=2).
-    Retorna dict con: tipo_revision, pos_corregida, rama_corregida, observacion
+    Trabajo de generación (corre fuera del script, sin st.*).
+    resultados: copia de los archivos ya generados en la sesión para este
+    contenido, {(formato, tipo): datos}; no se modifica. caches: ver caches_trabajos.
+    Retorna dict con fecha, archivos generados, Parquet, ZIP con todos, cambios,
+    mediciones, perfil y los archivos nuevos ({(formato, tipo): datos}, que
+    recoger_resultados agrega a la sesión).
     """
-    rama = str(row.get('g_p6390s2', '')) if pd.notna(row.get('g_p6390s2')) else ''
-    empresa = str(row.get('p6380', '')).upper() if pd.notna(row.get('p6380')) else ''
-    oficio = str(row.get('p6370', '')).upper() if pd.notna(row.get('p6370')) else ''
-    p6400 = row.get('p6400', None)
-    
-    resultado = {'tipo_revision': 0, 'pos_corregida': None, 'rama_corregida': None, 'observacion': ''}
-    
-    # 1. Empresas con régimen laboral privado (Ecopetrol)
-    if any(emp in empresa for emp in EMPRESAS_REGIMEN_PRIVADO):
-        resultado['tipo_revision'] = 1
-        resultado['pos_corregida'] = 1
-        resultado['observacion'] = 'CAMBIAR → Pos 1: Empresa con régimen laboral privado (Ley 1118/2006)'
-        return resultado
-    
-    # 2. Entidades privadas (Cámara de Comercio, Notarías)
-    if any(ent in empresa for ent in ENTIDADES_PRIVADAS_NO_GOBIERNO):
-        resultado['tipo_revision'] = 1
-        resultado['pos_corregida'] = 1
-        resultado['observacion'] = 'CAMBIAR → Pos 1: Entidad privada, no es gobierno'
-        return resultado
-    
-    # 3. Revisar por tipo de rama
-    tipo_rama = TIPO_REVISION_GOB.get(rama, 0)
-    
-    # Rama prohibida (tipo 1)
-    if tipo_rama == 1:
-        # Verificar si es cambio de rama en vez de posición
-        for patron in PALABRAS_RAMA_8412:
-            if patron in empresa:
-                resultado['tipo_revision'] = 2
-                resultado['rama_corregida'] = '8412'
-                resultado['observacion'] = 'CAMBIAR RAMA → 8412: Actividades ejecutivas administración pública'
-                return resultado
-        for patron in PALABRAS_RAMA_8414:
-            if patron in empresa:
-                resultado['tipo_revision'] = 2
-                resultado['rama_corregida'] = '8414'
-                resultado['observacion'] = 'CAMBIAR RAMA → 8414: Actividades reguladoras'
-                return resultado
-        for patron in PALABRAS_RAMA_8413:
-            if patron in empresa:
-                resultado['tipo_revision'] = 2
-                resultado['rama_corregida'] = '8413'
-                resultado['observacion'] = 'CAMBIAR RAMA → 8413: Programas bienestar/medio ambiente'
-                return resultado
+    fecha = datetime.now().strftime('%Y%m%d')
+    diccionarios = opciones['diccionarios']
+    archivos_generados = []
+    archivos_parquet = []
+    cambios = {}
+    # Los libros se escriben en disco (ver almacen_salidas.py); la sesión solo guarda la referencia
+    almacen = almacen_por_defecto()
+    # Mientras corre, el almacén no borra sus archivos ni los de la sesión que reutiliza
+    en_curso = nullcontext()
+    if almacen is not None:
+        en_curso = almacen.trabajo_en_curso(
+            [salida for resultado in resultados.values() for salida in salidas_resultado(resultado)])
+    # Cada archivo entra al ZIP apenas termina; del almacén se copia por partes (sin almacén no hay ZIP)
+    paquete = PaqueteZip(almacen) if opciones['zip'] and almacen is not None else None
+    nuevos = {}
+    
+    # Tiempos por etapa de esta generación (y perfil si se pidió; uno a la vez)
+    with en_curso, registrar() as rendimiento, perfilar(
+            opciones['perfil_detallado'],
+            al_esperar=lambda: trabajo.avanzar(0, "Esperando a que termine otro perfil...")) as perfil:
+        if opciones['por_bloques']:
+            n_total = max(sum(conteo_p6430.values()), 1)
+            trabajo.avanzar(0, "Procesando archivo por bloques...")
+            excels = generar_excel_por_bloques(
+                archivo, nombre, seleccion,
+                al_avanzar=lambda n: trabajo.avanzar(n / n_total, f"{n:,} registros procesados..."),
+                almacen=almacen, particion=opciones['particion'], diccionarios=diccionarios
+            )
+            for tipo in seleccion:
+                if excels[tipo]:
+                    archivos_generados.append((tipo, excels[tipo], nombre_salida(tipo, fecha)))
+                    empaquetar(paquete, 'xlsx', tipo, excels[tipo], fecha)
         
-        resultado['tipo_revision'] = 1
-        resultado['pos_corregida'] = 1
-        resultado['observacion'] = 'CAMBIAR → Pos 1: Rama prohibida para empleado gobierno'
-        return resultado
-    
-    # Empresas mixtas (tipo 2)
-    if tipo_rama == 2 or any(emp in empresa for emp in EMPRESAS_MIXTAS):
-        if es_directivo(row):
-            resultado['tipo_revision'] = 4
-            resultado['observacion'] = 'REVISAR: Directivo en empresa mixta (verificar si es EICE)'
         else:
-            resultado['tipo_revision'] = 1
-            resultado['pos_corregida'] = 1
-            resultado['observacion'] = 'CAMBIAR → Pos 1: No directivo en empresa mixta'
-        return resultado
-    
-    # Administración pública (tipo 0 o 3)
-    if rama == 'Administración pública y defensa, educación y atención de la salud':
-        # Verificar si es entidad privada
-        if any(p in empresa for p in PALABRAS_PRIVADAS_ADM_PUBLICA):
-            resultado['tipo_revision'] = 1
-            resultado['pos_corregida'] = 1
-            resultado['observacion'] = 'CAMBIAR → Pos 1: Entidad privada en rama Adm. Pública'
-            return resultado
-        
-        # Verificar contratistas
-        if any(c in oficio or c in empresa for c in PALABRAS_CONTRATISTA):
-            resultado['tipo_revision'] = 1
-            resultado['pos_corregida'] = 5
-            resultado['observacion'] = 'CAMBIAR → Pos 5: Contratista/Prestador de servicios'
-            return resultado
-        
-        # Verificar intermediación
-        try:
-            if pd.notna(p6400) and int(p6400) == 2:
-                resultado['tipo_revision'] = 4
-                resultado['observacion'] = 'REVISAR: Trabaja por intermediación (P6400=2)'
-                return resultado
-        except:
-            pass
-        
-        resultado['observacion'] = 'OK'
-        return resultado
+            # Lectura completa y clasificación (en caché por archivo y posición)
+            trabajo.avanzar(0.05, "Leyendo columnas completas...")
+            tareas = []
+            for i, tipo in enumerate(seleccion):
+                formatos = [formato for formato in (['xlsx', 'parquet'] if opciones['exportar_parquet'] else ['xlsx'])
+                            if not ya_generado(resultados.get((formato, tipo)))]
+                if opciones['incremental']:
+                    df_tipo, cambios[tipo] = posicion_incremental(caches, huella, nombre, tipo, diccionarios,
+                                                                  opciones['ronda'], archivo)
+                elif formatos:
+                    df_tipo = posicion_clasificada(caches, huella, nombre, tipo, diccionarios, archivo)
+                else:
+                    continue
+                trabajo.avanzar(0.05 + 0.45 * (i + 1) / len(seleccion), f"Clasificado: {NOMBRES[tipo]}")
+                # Cada archivo se escribe en un proceso aparte
+                if 'xlsx' in formatos:
+                    tareas.append((('xlsx', tipo), escribir_posicion, (tipo, df_tipo, None, almacen, opciones['particion'])))
+                if 'parquet' in formatos:
+                    tareas.append((('parquet', tipo), escribir_parquet_posicion, (tipo, df_tipo, almacen)))
+            
+            # Con perfil detallado todo corre en este proceso para que cProfile lo vea
+            procesos = 1 if opciones['perfil_detallado'] else None
+            for i, ((formato, tipo), resultado) in enumerate(generar_en_paralelo(tareas, procesos), 1):
+                nuevos[(formato, tipo)] = resultado
+                empaquetar(paquete, formato, tipo, resultado, fecha)
+                trabajo.avanzar(0.5 + 0.5 * i / len(tareas), f"Listo: {NOMBRES[tipo]} ({formato})")
+            
+            generados = {clave for clave, _, _ in tareas}
+            resultados = {**resultados, **nuevos}
+            for tipo in seleccion:
+                excel = resultados.get(('xlsx', tipo))
+                if excel:
+                    archivos_generados.append((tipo, excel, nombre_salida(tipo, fecha)))
+                parquets = resultados.get(('parquet', tipo)) if opciones['exportar_parquet'] else None
+                for hoja, datos in (parquets or {}).items():
+                    archivos_parquet.append((tipo, hoja, datos, nombre_salida(tipo, fecha, hoja)))
+                # Los que ya estaban generados en la sesión entran al ZIP al final
+                for formato, anterior in [('xlsx', excel), ('parquet', parquets)]:
+                    if (formato, tipo) not in generados:
+                        empaquetar(paquete, formato, tipo, anterior, fecha)
+    
+    zip_todos = None
+    if paquete is not None:
+        if paquete.n_archivos > 1:
+            zip_todos = paquete.cerrar()
+        else:
+            paquete.descartar()
     
-    # Otras ramas
-    resultado['tipo_revision'] = 4
-    resultado['observacion'] = 'REVISAR: Verificar si la entidad es pública'
-    return resultado
+    return {'fecha': fecha, 'archivos_generados': archivos_generados, 'archivos_parquet': archivos_parquet,
+            'zip': zip_todos, 'cambios': cambios, 'ronda': opciones['ronda'], 'mediciones': rendimiento.mediciones, 'perfil': perfil,
+            'nuevos': nuevos, 'llave_resultados': opciones['llave_resultados']}
 
 
-def clasificar_empleado_particular(row):
+def recoger_resultados(trabajo):
     """
-    Clasifica empleado particular (P6430=1).
-    Detecta casos que deberían ser: Gobierno (2), Doméstico (3), Jornalero (7)
+    Agrega a la sesión (desde el script) los archivos que generó un trabajo
+    terminado, una sola vez y solo si siguen valiendo para el contenido, hojas
+    y diccionarios de la sesión.
     """
-    rama = str(row.get('g_p6390s2', '')).upper() if pd.notna(row.get('g_p6390s2')) else ''
-    empresa = str(row.get('p6380', '')).upper() if pd.notna(row.get('p6380')) else ''
-    oficio = str(row.get('p6370', '')).upper() if pd.notna(row.get('p6370')) else ''
-    
-    resultado = {'tipo_revision': 0, 'pos_corregida': None, 'observacion': ''}
-    
-    # 1. Posible empleado gobierno - Universidades públicas
-    for uni in UNIVERSIDADES_PUBLICAS:
-        if uni in empresa:
-            resultado['tipo_revision'] = 1
-            resultado['pos_corregida'] = 2
-            resultado['observacion'] = 'REVISAR → Pos 2: Universidad pública'
-            return resultado
-    
-    # 2. Posible empleado gobierno - Entidades del gobierno
-    for ent in ENTIDADES_GOBIERNO:
-        if ent in empresa:
-            # Excluir si tiene indicadores de privado
-            if not any(p in empresa for p in ['CLINICA ', ' SAS', 'S.A.S', 'LTDA']):
-                resultado['tipo_revision'] = 1
-                resultado['pos_corregida'] = 2
-                resultado['observacion'] = 'REVISAR → Pos 2: Posible entidad del gobierno'
-                return resultado
-    
-    # 3. Posible empleado gobierno - Instituciones educativas públicas
-    for ie in INSTITUCIONES_EDUCATIVAS_PUBLICAS:
-        if ie in empresa:
-            if not any(priv in empresa for priv in INDICADORES_IE_PRIVADA):
-                resultado['tipo_revision'] = 1
-                resultado['pos_corregida'] = 2
-                resultado['observacion'] = 'REVISAR → Pos 2: Institución educativa pública'
-                return resultado
-    
-    # 4. Posible empleado doméstico
-    if any(d in oficio or d in empresa for d in PALABRAS_DOMESTICO):
-        resultado['tipo_revision'] = 2
-        resultado['pos_corregida'] = 3
-        resultado['observacion'] = 'REVISAR → Pos 3: Posible empleado doméstico'
-        return resultado
-    
-    # 5. Posible jornalero (solo en Agricultura)
-    if 'AGRICULTURA' in rama:
-        # Verificar si es supervisión (NO es jornalero)
-        if any(s in oficio for s in PALABRAS_SUPERVISION):
-            resultado['observacion'] = 'OK: Supervisión en agricultura'
-            return resultado
+    recogidos = st.session_state.setdefault('trabajos_recogidos', set())
+    if trabajo.activo or trabajo.resultado is None or trabajo.id in recogidos:
+        return
+    recogidos.add(trabajo.id)
+    if st.session_state.get('huella_resultados') == trabajo.resultado['llave_resultados']:
+        st.session_state.setdefault('resultados', {}).update(trabajo.resultado['nuevos'])
+
+
+def mostrar_resultado(trabajo):
+    """Descargas, cambios y rendimiento de un trabajo terminado."""
+    resultado = trabajo.resultado
+    archivos_generados = resultado['archivos_generados']
+    archivos_parquet = resultado['archivos_parquet']
+    
+    salidas = [excel for _, excel, _ in archivos_generados] + [datos for _, _, datos, _ in archivos_parquet]
+    if resultado['zip'] is not None:
+        salidas.append(resultado['zip'])
+    if not all(salida_disponible(salida) for salida in salidas):
+        st.warning("⚠️ Los archivos de esta generación ya se borraron del almacén de salidas. "
+                   "Vuelve a generarlos.")
+    elif archivos_generados:
+        st.success(f"✅ Se generaron {len(archivos_generados)} archivo(s) de revisión")
+        
+        # Mostrar descargas
+        st.subheader("📥 Descargar archivos")
+        
+        cols = st.columns(len(archivos_generados))
+        
+        for i, (tipo, excel, filename) in enumerate(archivos_generados):
+            with cols[i]:
+                st.download_button(
+                    label=f"{ICONOS.get(tipo, '📄')} {NOMBRES.get(tipo, tipo)}",
+                    data=datos_descarga(excel),
+                    file_name=filename,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key=f"{trabajo.id}-{filename}",
+                    use_container_width=True
+                )
+                st.caption(f"📌 {ASIGNADOS.get(tipo, '')}")
+        
+        if archivos_parquet:
+            st.markdown("**🗃️ Casos en Parquet**")
+            tipos_generados = [tipo for tipo, _, _ in archivos_generados]
+            cols_parquet = st.columns(len(tipos_generados))
+            for tipo, hoja, datos, filename in archivos_parquet:
+                with cols_parquet[tipos_generados.index(tipo)]:
+                    st.download_button(
+                        label=f"{ICONOS.get(tipo, '📄')} {hoja}",
+                        data=datos_descarga(datos),
+                        file_name=filename,
+                        mime="application/vnd.apache.parquet",
+                        key=f"{trabajo.id}-{filename}",
+                        use_container_width=True
+                    )
         
-        # Verificar si es producción directa (SÍ es jornalero)
-        if any(p in oficio for p in PALABRAS_PRODUCCION_DIRECTA):
-            resultado['tipo_revision'] = 3
-            resultado['pos_corregida'] = 7
-            resultado['observacion'] = 'REVISAR → Pos 7: Posible jornalero (producción directa)'
-            return resultado
-    
-    resultado['observacion'] = 'OK'
-    return resultado
-
-
-def clasificar_trabajador_familiar(row):
-    """
-    Clasifica trabajador familiar sin remuneración (P6430=6).
-    """
-    empresa = str(row.get('p6380', '')).upper() if pd.notna(row.get('p6380')) else ''
-    oficio = str(row.get('p6370', '')).upper() if pd.notna(row.get('p6370')) else ''
-    p3069 = row.get('p3069', None)
-    
-    resultado = {'tipo_revision': 0, 'pos_corregida': None, 'observacion': ''}
-    
-    # 1. Trabaja solo (P3069=1) - No puede ser trabajador familiar
-    try:
-        if pd.notna(p3069) and int(p3069) == 1:
-            resultado['tipo_revision'] = 1
-            resultado['observacion'] = 'DETALLAR: Trabaja solo (P3069=1) - No puede ser familiar'
-            return resultado
-    except:
-        pass
-    
-    # 2. Entidad no familiar
-    if any(e in empresa for e in ENTIDADES_NO_FAMILIARES):
-        resultado['tipo_revision'] = 2
-        resultado['observacion'] = 'DETALLAR: Entidad no familiar (iglesia, empresa formal, etc.)'
-        return resultado
-    
-    # 3. Cargo de decisión → posible cuenta propia
-    texto = f"{oficio} {empresa}"
-    if any(c in texto for c in CARGOS_DECISION):
-        resultado['tipo_revision'] = 3
-        resultado['pos_corregida'] = 5
-        resultado['observacion'] = 'DETALLAR → Pos 5: Cargo decisión (dueño/socio/gerente)'
-        return resultado
-    
-    # 4. Verificar si parece empresa familiar (OK)
-    if any(i in empresa for i in INDICADORES_FAMILIAR):
-        resultado['observacion'] = 'OK: Parece empresa familiar'
+        if resultado['zip'] is not None:
+            st.download_button(
+                label="📦 Descargar todo (ZIP, una carpeta por responsable)",
+                data=datos_descarga(resultado['zip']),
+                file_name=f"revision_ocupados_{resultado['fecha']}.zip",
+                mime="application/zip",
+                key=f"{trabajo.id}-zip",
+                use_container_width=True
+            )
     else:
-        resultado['tipo_revision'] = 4
-        resultado['observacion'] = 'REVISAR: Verificar si es empresa familiar'
-    
-    return resultado
-
-
-def clasificar_otro_cual(row):
-    """
-    Clasifica 'Otro, ¿cuál?' (P6430=8).
-    """
-    oficio = str(row.get('p6370', '')).upper() if pd.notna(row.get('p6370')) else ''
-    otro_cual = str(row.get('p6430s1', '')).upper() if pd.notna(row.get('p6430s1')) else ''
-    empresa = str(row.get('p6380', '')).upper() if pd.notna(row.get('p6380')) else ''
-    p3069 = row.get('p3069', None)
-    
-    texto = f"{oficio} {otro_cual} {empresa}"
-    resultado = {'tipo_revision': 0, 'pos_corregida': None, 'observacion': ''}
-    
-    # 1. Contratista/Independiente → Cuenta propia
-    if any(p in texto for p in PALABRAS_CUENTA_PROPIA):
-        resultado['tipo_revision'] = 1
-        resultado['pos_corregida'] = 5
-        resultado['observacion'] = 'CAMBIAR → Pos 5: Contratista/Independiente es cuenta propia'
-        return resultado
-    
-    # 2. Socio/Dueño → Patrón o Cuenta propia
-    if any(p in texto for p in PALABRAS_PATRON):
-        tiene_empleados = False
-        try:
-            if pd.notna(p3069) and int(p3069) > 1:
-                tiene_empleados = True
-        except:
-            pass
-        
-        if tiene_empleados:
-            resultado['tipo_revision'] = 2
-            resultado['pos_corregida'] = 4
-            resultado['observacion'] = 'CAMBIAR → Pos 4: Socio/Dueño con empleados es patrón'
+        st.warning("⚠️ No se generaron archivos. Verifica las opciones seleccionadas.")
+    
+    if resultado['cambios']:
+        st.subheader(f"🔁 Cambios frente a la ronda anterior de «{resultado['ronda']}»")
+        st.dataframe(
+            [{'Posición': NOMBRES[tipo], **{ETIQUETAS_DELTA[k]: v for k, v in delta.items()}}
+             for tipo, delta in resultado['cambios'].items()],
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    # Rendimiento por etapa: carga (si no salió del caché) y esta generación
+    with st.expander("⏱️ Rendimiento"):
+        for titulo, mediciones in [("Carga", st.session_state.get('rendimiento_carga', [])),
+                                   ("Generación", resultado['mediciones'])]:
+            tiempos = Rendimiento(mediciones)
+            st.markdown(f"**{titulo}** — {tiempos.segundos:.2f} s")
+            if mediciones:
+                st.dataframe(tiempos.tabla(), hide_index=True, use_container_width=True)
+            else:
+                st.caption("Sin mediciones: los resultados salieron del caché")
+        perfil = resultado['perfil']
+        if perfil:
+            st.markdown("**Perfil (cProfile)**")
+            st.code(perfil['texto'])
+            st.download_button(
+                label="🔬 Descargar perfil (.prof)",
+                data=perfil['datos'],
+                file_name=f"perfil_{resultado['fecha']}.prof",
+                mime="application/octet-stream",
+                key=f"{trabajo.id}-perfil",
+                help="Se abre con snakeviz o con el módulo pstats"
+            )
+
+
+@st.fragment(run_every=1)
+def avance_trabajos(ids):
+    """Barra de avance de los trabajos activos; se actualiza cada segundo."""
+    trabajos = [cola_trabajos().obtener(id_trabajo) for id_trabajo in ids]
+    for trabajo in trabajos:
+        if trabajo is not None and trabajo.activo:
+            st.progress(trabajo.progreso, f"⏳ {trabajo.descripcion} — {trabajo.mensaje}")
+        elif trabajo is not None:
+            recoger_resultados(trabajo)
+    # Al terminar se recarga la página completa para mostrar las descargas
+    if not any(trabajo is not None and trabajo.activo for trabajo in trabajos):
+        st.rerun()
+
+
+def panel_trabajos():
+    """Trabajos de esta sesión: avance de los activos y resultado de los terminados (el más reciente primero)."""
+    cola = cola_trabajos()
+    ids = [id_trabajo for id_trabajo in st.session_state.get('trabajos', []) if cola.obtener(id_trabajo)]
+    st.session_state['trabajos'] = ids
+    trabajos = [cola.obtener(id_trabajo) for id_trabajo in reversed(ids)]
+    
+    activos = [trabajo.id for trabajo in trabajos if trabajo.activo]
+    if activos:
+        avance_trabajos(activos)
+    
+    terminados = [trabajo for trabajo in trabajos if not trabajo.activo]
+    for trabajo in terminados:
+        recoger_resultados(trabajo)
+    for i, trabajo in enumerate(terminados):
+        hora = datetime.fromtimestamp(trabajo.terminado).strftime('%H:%M')
+        if trabajo.estado == FALLIDO:
+            st.error(f"Error al generar {trabajo.descripcion} ({hora}): {trabajo.error}")
+            with st.expander("Detalle del error"):
+                st.code(trabajo.detalle_error)
+        elif i == 0:
+            mostrar_resultado(trabajo)
         else:
-            resultado['tipo_revision'] = 1
-            resultado['pos_corregida'] = 5
-            resultado['observacion'] = 'CAMBIAR → Pos 5: Socio/Dueño sin empleados es cuenta propia'
-        return resultado
-    
-    # 3. Caso válido de "Otro"
-    if any(v in texto for v in PALABRAS_OTRO_VALIDO):
-        resultado['observacion'] = 'OK: Caso válido de "Otro"'
-        return resultado
-    
-    # 4. Sin clasificar - revisar descripción
-    if len(otro_cual.strip()) > 3:
-        resultado['tipo_revision'] = 3
-        resultado['observacion'] = f'DETALLAR: Verificar descripción "{otro_cual[:50]}"'
-    else:
-        resultado['tipo_revision'] = 3
-        resultado['observacion'] = 'DETALLAR: Sin descripción clara en P6430S1'
-    
-    return resultado
-
-
-# =============================================================================
-# FUNCIONES PARA GENERAR EXCEL
-# =============================================================================
-
-def generar_excel_gobierno(df_gob):
-    """Genera Excel para empleados del gobierno con estructura del notebook original."""
-    if len(df_gob) == 0:
-        return None
-    
-    # Aplicar clasificación
-    clasificaciones = df_gob.apply(clasificar_empleado_gobierno, axis=1, result_type='expand')
-    df_gob = df_gob.copy()
-    df_gob['tipo_revision'] = clasificaciones['tipo_revision']
-    df_gob['pos_corregida'] = clasificaciones['pos_corregida']
-    df_gob['rama_corregida'] = clasificaciones['rama_corregida']
-    df_gob['observacion'] = clasificaciones['observacion']
-    
-    # Crear resumen por rama
-    resumen = df_gob.groupby('g_p6390s2').agg(
-        Casos=('directorio', 'count'),
-        Cambiar_Pos=('pos_corregida', lambda x: x.notna().sum()),
-        Cambiar_Rama=('rama_corregida', lambda x: x.notna().sum())
-    ).reset_index()
-    resumen = resumen.rename(columns={'g_p6390s2': 'RAMA DE ACTIVIDAD ECONÓMICA'})
-    
-    # Contar casos a revisar (tipo 4)
-    revisar_counts = df_gob[df_gob['tipo_revision'] == 4].groupby('g_p6390s2').size()
-    resumen = resumen.merge(
-        revisar_counts.reset_index().rename(columns={'g_p6390s2': 'RAMA DE ACTIVIDAD ECONÓMICA', 0: 'Revisar'}),
-        on='RAMA DE ACTIVIDAD ECONÓMICA', how='left'
-    ).fillna(0)
-    resumen['Revisar'] = resumen['Revisar'].astype(int)
-    
-    # Ordenar por ORDEN_RAMAS
-    todas_ramas = pd.DataFrame({'RAMA DE ACTIVIDAD ECONÓMICA': ORDEN_RAMAS})
-    resumen = todas_ramas.merge(resumen, on='RAMA DE ACTIVIDAD ECONÓMICA', how='left').fillna(0)
-    for col in ['Casos', 'Cambiar_Pos', 'Cambiar_Rama', 'Revisar']:
-        resumen[col] = resumen[col].astype(int)
-    
-    # Agregar total
-    total = pd.DataFrame([{
-        'RAMA DE ACTIVIDAD ECONÓMICA': 'TOTAL',
-        'Casos': resumen['Casos'].sum(),
-        'Cambiar_Pos': resumen['Cambiar_Pos'].sum(),
-        'Cambiar_Rama': resumen['Cambiar_Rama'].sum(),
-        'Revisar': resumen['Revisar'].sum()
-    }])
-    resumen = pd.concat([resumen, total], ignore_index=True)
-    
-    # Crear cuadro de inconsistencias
-    inconsistencias = df_gob[df_gob['tipo_revision'] > 0].copy()
-    
-    # Crear Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        
-        # HOJA 1: RESUMEN CON SEMÁFORO
-        resumen.to_excel(writer, sheet_name='Resumen', index=False, startrow=4)
-        ws = writer.sheets['Resumen']
-        
-        ws['A1'] = 'DISTRIBUCIÓN DE EMPLEADOS DEL GOBIERNO (P6430=2) POR RAMA DE ACTIVIDAD'
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A2'] = 'NOTA: Cambiar_Pos = Cambio de posición ocupacional | Cambiar_Rama = Cambio de rama de actividad'
-        ws['A2'].font = Font(italic=True, size=10)
-        ws['A3'] = 'SEMÁFORO:'
-        ws['A3'].font = Font(bold=True)
-        ws['B3'] = '🔴 ROJO = Casos a cambiar'
-        ws['B3'].fill = ROJO
-        ws['C3'] = '🟡 AMARILLO = Cambio rama'
-        ws['C3'].fill = AMARILLO
-        ws['D3'] = '🔵 AZUL = Revisar'
-        ws['D3'].fill = AZUL
-        ws['E3'] = '🟢 VERDE = OK'
-        ws['E3'].fill = VERDE
-        
-        # Aplicar colores semáforo
-        for i, row in resumen.iterrows():
-            fila_excel = i + 6
-            if row['RAMA DE ACTIVIDAD ECONÓMICA'] != 'TOTAL':
-                if row['Cambiar_Pos'] > 0:
-                    color = ROJO
-                elif row['Cambiar_Rama'] > 0:
-                    color = AMARILLO
-                elif row['Revisar'] > 0:
-                    color = AZUL
-                else:
-                    color = VERDE
-                for col in range(1, 6):
-                    ws.cell(row=fila_excel, column=col).fill = color
-        
-        # Formato fila total
-        fila_total = len(resumen) + 5
-        for col in range(1, 6):
-            cell = ws.cell(row=fila_total, column=col)
-            cell.font = Font(bold=True)
-            cell.border = Border(top=Side(style='thin'), bottom=Side(style='double'))
-        
-        ws.column_dimensions['A'].width = 70
-        for col in ['B', 'C', 'D', 'E']:
-            ws.column_dimensions[col].width = 15
-        
-        # HOJA 2: INCONSISTENCIAS (cuadro resumen)
-        if len(inconsistencias) > 0:
-            # Crear cuadro pivote de inconsistencias
-            cuadro_inc = inconsistencias.groupby('g_p6390s2').agg(
-                Cambiar_Pos=('pos_corregida', lambda x: x.notna().sum()),
-                Cambiar_Rama=('rama_corregida', lambda x: x.notna().sum()),
-                Revisar=('tipo_revision', lambda x: (x == 4).sum())
-            ).reset_index()
-            cuadro_inc = cuadro_inc.rename(columns={'g_p6390s2': 'RAMA'})
-            cuadro_inc['TOTAL'] = cuadro_inc['Cambiar_Pos'] + cuadro_inc['Cambiar_Rama'] + cuadro_inc['Revisar']
-            cuadro_inc = cuadro_inc[cuadro_inc['TOTAL'] > 0]
-            
-            # Agregar fila total
-            total_inc = pd.DataFrame([{
-                'RAMA': 'TOTAL',
-                'Cambiar_Pos': cuadro_inc['Cambiar_Pos'].sum(),
-                'Cambiar_Rama': cuadro_inc['Cambiar_Rama'].sum(),
-                'Revisar': cuadro_inc['Revisar'].sum(),
-                'TOTAL': cuadro_inc['TOTAL'].sum()
-            }])
-            cuadro_inc = pd.concat([cuadro_inc, total_inc], ignore_index=True)
-            
-            cuadro_inc.to_excel(writer, sheet_name='Inconsistencias', index=False, startrow=2)
-            ws2 = writer.sheets['Inconsistencias']
-            ws2['A1'] = 'RESUMEN DE CASOS A REVISAR'
-            ws2['A1'].font = Font(bold=True, size=12)
-            ws2.column_dimensions['A'].width = 70
-        
-        # HOJA 3: CASOS PARA REVISIÓN (columnas acotadas)
-        cols_revision = ['directorio', 'secuencia_p', 'orden', 'municipio', 
-                        'p6370', 'p6380', 'g_p6390s2', 'p6400',
-                        'tipo_revision', 'pos_corregida', 'rama_corregida', 'observacion']
-        cols_disponibles = [c for c in cols_revision if c in df_gob.columns]
-        casos_rev = df_gob[df_gob['tipo_revision'] > 0][cols_disponibles].copy()
-        casos_rev.to_excel(writer, sheet_name='Casos_Revision', index=False)
-        
-        # HOJA 4: TODOS LOS CASOS (base completa)
-        df_gob.to_excel(writer, sheet_name='Casos_Completo', index=False)
-    
-    output.seek(0)
-    return output
-
-
-def generar_excel_particular(df_part):
-    """Genera Excel para empleados particulares."""
-    if len(df_part) == 0:
-        return None
-    
-    # Aplicar clasificación
-    clasificaciones = df_part.apply(clasificar_empleado_particular, axis=1, result_type='expand')
-    df_part = df_part.copy()
-    df_part['tipo_revision'] = clasificaciones['tipo_revision']
-    df_part['pos_corregida'] = clasificaciones['pos_corregida']
-    df_part['observacion'] = clasificaciones['observacion']
-    
-    # Crear resumen
-    resumen = df_part.groupby('g_p6390s2').agg(
-        Casos=('directorio', 'count'),
-        Revisar_Gobierno=('tipo_revision', lambda x: (x == 1).sum()),
-        Revisar_Domestico=('tipo_revision', lambda x: (x == 2).sum()),
-        Revisar_Jornalero=('tipo_revision', lambda x: (x == 3).sum())
-    ).reset_index()
-    resumen = resumen.rename(columns={'g_p6390s2': 'RAMA DE ACTIVIDAD ECONÓMICA'})
-    
-    # Ordenar y agregar total
-    todas_ramas = pd.DataFrame({'RAMA DE ACTIVIDAD ECONÓMICA': ORDEN_RAMAS})
-    resumen = todas_ramas.merge(resumen, on='RAMA DE ACTIVIDAD ECONÓMICA', how='left').fillna(0)
-    for col in ['Casos', 'Revisar_Gobierno', 'Revisar_Domestico', 'Revisar_Jornalero']:
-        resumen[col] = resumen[col].astype(int)
-    
-    total = pd.DataFrame([{
-        'RAMA DE ACTIVIDAD ECONÓMICA': 'TOTAL',
-        'Casos': resumen['Casos'].sum(),
-        'Revisar_Gobierno': resumen['Revisar_Gobierno'].sum(),
-        'Revisar_Domestico': resumen['Revisar_Domestico'].sum(),
-        'Revisar_Jornalero': resumen['Revisar_Jornalero'].sum()
-    }])
-    resumen = pd.concat([resumen, total], ignore_index=True)
-    
-    # Crear Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        
-        # HOJA 1: RESUMEN
-        resumen.to_excel(writer, sheet_name='Resumen', index=False, startrow=4)
-        ws = writer.sheets['Resumen']
-        
-        ws['A1'] = 'DISTRIBUCIÓN DE EMPLEADOS PARTICULARES (P6430=1) POR RAMA DE ACTIVIDAD'
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A2'] = 'Detecta posibles cambios a: Gobierno (Pos 2), Doméstico (Pos 3), Jornalero (Pos 7)'
-        ws['A2'].font = Font(italic=True, size=10)
-        ws['A3'] = 'SEMÁFORO:'
-        ws['B3'] = '🟡 AMARILLO = Casos a revisar'
-        ws['B3'].fill = AMARILLO
-        ws['C3'] = '🟢 VERDE = OK'
-        ws['C3'].fill = VERDE
-        
-        # Aplicar colores
-        for i, row in resumen.iterrows():
-            fila_excel = i + 6
-            if row['RAMA DE ACTIVIDAD ECONÓMICA'] != 'TOTAL':
-                total_revisar = row['Revisar_Gobierno'] + row['Revisar_Domestico'] + row['Revisar_Jornalero']
-                color = AMARILLO if total_revisar > 0 else VERDE
-                for col in range(1, 6):
-                    ws.cell(row=fila_excel, column=col).fill = color
-        
-        ws.column_dimensions['A'].width = 70
-        
-        # HOJA 2: CASOS REVISIÓN
-        cols_revision = ['directorio', 'secuencia_p', 'orden', 'municipio',
-                        'p6370', 'p6380', 'g_p6390s2', 'p6400',
-                        'tipo_revision', 'pos_corregida', 'observacion']
-        cols_disponibles = [c for c in cols_revision if c in df_part.columns]
-        casos_rev = df_part[df_part['tipo_revision'] > 0][cols_disponibles].copy()
-        casos_rev.to_excel(writer, sheet_name='Casos_Revision', index=False)
-        
-        # HOJA 3: TODOS LOS CASOS
-        df_part.to_excel(writer, sheet_name='Casos_Completo', index=False)
-    
-    output.seek(0)
-    return output
-
-
-def generar_excel_familiar(df_fam):
-    """Genera Excel para trabajadores familiares."""
-    if len(df_fam) == 0:
-        return None
-    
-    # Aplicar clasificación
-    clasificaciones = df_fam.apply(clasificar_trabajador_familiar, axis=1, result_type='expand')
-    df_fam = df_fam.copy()
-    df_fam['tipo_revision'] = clasificaciones['tipo_revision']
-    df_fam['pos_corregida'] = clasificaciones['pos_corregida']
-    df_fam['observacion'] = clasificaciones['observacion']
-    
-    # Crear resumen
-    resumen = df_fam.groupby('g_p6390s2').agg(
-        Casos=('directorio', 'count'),
-        Detallar=('tipo_revision', lambda x: (x.isin([1, 2, 3])).sum()),
-        Revisar=('tipo_revision', lambda x: (x == 4).sum())
-    ).reset_index()
-    resumen = resumen.rename(columns={'g_p6390s2': 'RAMA DE ACTIVIDAD ECONÓMICA'})
-    
-    # Ordenar y agregar total
-    todas_ramas = pd.DataFrame({'RAMA DE ACTIVIDAD ECONÓMICA': ORDEN_RAMAS})
-    resumen = todas_ramas.merge(resumen, on='RAMA DE ACTIVIDAD ECONÓMICA', how='left').fillna(0)
-    for col in ['Casos', 'Detallar', 'Revisar']:
-        resumen[col] = resumen[col].astype(int)
-    
-    total = pd.DataFrame([{
-        'RAMA DE ACTIVIDAD ECONÓMICA': 'TOTAL',
-        'Casos': resumen['Casos'].sum(),
-        'Detallar': resumen['Detallar'].sum(),
-        'Revisar': resumen['Revisar'].sum()
-    }])
-    resumen = pd.concat([resumen, total], ignore_index=True)
-    
-    # Crear Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        
-        # HOJA 1: RESUMEN
-        resumen.to_excel(writer, sheet_name='Resumen', index=False, startrow=4)
-        ws = writer.sheets['Resumen']
-        
-        ws['A1'] = 'DISTRIBUCIÓN DE TRABAJADORES FAMILIARES SIN REMUNERACIÓN (P6430=6) POR RAMA'
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A2'] = 'NOTA: Los casos a DETALLAR deben devolverse a campo (flujo diferente al de asalariados)'
-        ws['A2'].font = Font(italic=True, size=10)
-        ws['A3'] = 'SEMÁFORO:'
-        ws['B3'] = '🔴 ROJO = Casos a detallar'
-        ws['B3'].fill = ROJO
-        ws['C3'] = '🟡 AMARILLO = Casos a revisar'
-        ws['C3'].fill = AMARILLO
-        ws['D3'] = '🟢 VERDE = OK'
-        ws['D3'].fill = VERDE
-        
-        # Aplicar colores
-        for i, row in resumen.iterrows():
-            fila_excel = i + 6
-            if row['RAMA DE ACTIVIDAD ECONÓMICA'] != 'TOTAL':
-                if row['Detallar'] > 0:
-                    color = ROJO
-                elif row['Revisar'] > 0:
-                    color = AMARILLO
-                else:
-                    color = VERDE
-                for col in range(1, 5):
-                    ws.cell(row=fila_excel, column=col).fill = color
-        
-        ws.column_dimensions['A'].width = 70
-        
-        # HOJA 2: CUADRO INCONSISTENCIAS
-        inconsistencias = df_fam[df_fam['tipo_revision'] > 0].copy()
-        if len(inconsistencias) > 0:
-            def categorizar(row):
-                tipos = {1: 'TRABAJA_SOLO', 2: 'ENTIDAD_NO_FAMILIAR', 
-                        3: 'CARGO_DECISION', 4: 'REVISAR'}
-                return tipos.get(row['tipo_revision'], 'OTRO')
-            
-            inconsistencias['categoria'] = inconsistencias.apply(categorizar, axis=1)
-            cuadro_inc = inconsistencias.groupby(['g_p6390s2', 'categoria']).size().unstack(fill_value=0)
-            cuadro_inc = cuadro_inc.reset_index().rename(columns={'g_p6390s2': 'RAMA'})
-            
-            for col in ['TRABAJA_SOLO', 'ENTIDAD_NO_FAMILIAR', 'CARGO_DECISION', 'REVISAR']:
-                if col not in cuadro_inc.columns:
-                    cuadro_inc[col] = 0
-            
-            cols_orden = ['RAMA', 'TRABAJA_SOLO', 'ENTIDAD_NO_FAMILIAR', 'CARGO_DECISION', 'REVISAR']
-            cuadro_inc = cuadro_inc[cols_orden]
-            cuadro_inc['TOTAL'] = cuadro_inc[['TRABAJA_SOLO', 'ENTIDAD_NO_FAMILIAR', 'CARGO_DECISION', 'REVISAR']].sum(axis=1)
-            
-            # Agregar total
-            total_inc = pd.DataFrame([{
-                'RAMA': 'TOTAL',
-                'TRABAJA_SOLO': cuadro_inc['TRABAJA_SOLO'].sum(),
-                'ENTIDAD_NO_FAMILIAR': cuadro_inc['ENTIDAD_NO_FAMILIAR'].sum(),
-                'CARGO_DECISION': cuadro_inc['CARGO_DECISION'].sum(),
-                'REVISAR': cuadro_inc['REVISAR'].sum(),
-                'TOTAL': cuadro_inc['TOTAL'].sum()
-            }])
-            cuadro_inc = pd.concat([cuadro_inc, total_inc], ignore_index=True)
-            
-            cuadro_inc.to_excel(writer, sheet_name='Inconsistencias', index=False, startrow=2)
-            ws2 = writer.sheets['Inconsistencias']
-            ws2['A1'] = 'DISTRIBUCIÓN DE INCONSISTENCIAS POR RAMA Y TIPO'
-            ws2['A1'].font = Font(bold=True, size=12)
-            ws2.column_dimensions['A'].width = 60
-        
-        # HOJA 3: CASOS REVISIÓN
-        cols_revision = ['directorio', 'secuencia_p', 'orden', 'municipio',
-                        'p6370', 'p6380', 'p3069', 'g_p6390s2',
-                        'tipo_revision', 'pos_corregida', 'observacion']
-        cols_disponibles = [c for c in cols_revision if c in df_fam.columns]
-        casos_rev = df_fam[df_fam['tipo_revision'] > 0][cols_disponibles].copy()
-        casos_rev.to_excel(writer, sheet_name='Casos_Revision', index=False)
-        
-        # HOJA 4: TODOS LOS CASOS
-        df_fam.to_excel(writer, sheet_name='Casos_Completo', index=False)
-    
-    output.seek(0)
-    return output
-
-
-def generar_excel_otro(df_otro):
-    """Genera Excel para 'Otro, ¿cuál?'."""
-    if len(df_otro) == 0:
-        return None
-    
-    # Aplicar clasificación
-    clasificaciones = df_otro.apply(clasificar_otro_cual, axis=1, result_type='expand')
-    df_otro = df_otro.copy()
-    df_otro['tipo_revision'] = clasificaciones['tipo_revision']
-    df_otro['pos_corregida'] = clasificaciones['pos_corregida']
-    df_otro['observacion'] = clasificaciones['observacion']
-    
-    # Crear resumen
-    resumen = df_otro.groupby('g_p6390s2').agg(
-        Casos=('directorio', 'count'),
-        Cambiar=('tipo_revision', lambda x: (x.isin([1, 2])).sum()),
-        Detallar=('tipo_revision', lambda x: (x == 3).sum()),
-        Revisar=('tipo_revision', lambda x: (x == 4).sum())
-    ).reset_index()
-    resumen = resumen.rename(columns={'g_p6390s2': 'RAMA DE ACTIVIDAD ECONÓMICA'})
-    
-    # Ordenar y agregar total
-    todas_ramas = pd.DataFrame({'RAMA DE ACTIVIDAD ECONÓMICA': ORDEN_RAMAS})
-    resumen = todas_ramas.merge(resumen, on='RAMA DE ACTIVIDAD ECONÓMICA', how='left').fillna(0)
-    for col in ['Casos', 'Cambiar', 'Detallar', 'Revisar']:
-        resumen[col] = resumen[col].astype(int)
-    
-    total = pd.DataFrame([{
-        'RAMA DE ACTIVIDAD ECONÓMICA': 'TOTAL',
-        'Casos': resumen['Casos'].sum(),
-        'Cambiar': resumen['Cambiar'].sum(),
-        'Detallar': resumen['Detallar'].sum(),
-        'Revisar': resumen['Revisar'].sum()
-    }])
-    resumen = pd.concat([resumen, total], ignore_index=True)
-    
-    # Crear Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        
-        # HOJA 1: RESUMEN
-        resumen.to_excel(writer, sheet_name='Resumen', index=False, startrow=4)
-        ws = writer.sheets['Resumen']
-        
-        ws['A1'] = 'DISTRIBUCIÓN DE "OTRO, ¿CUÁL?" (P6430=8) POR RAMA DE ACTIVIDAD'
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A2'] = 'Cambiar = A cuenta propia (5) o patrón (4) | Detallar = Caso ambiguo | Revisar = Posiblemente válido'
-        ws['A2'].font = Font(italic=True, size=10)
-        ws['A3'] = 'SEMÁFORO:'
-        ws['B3'] = '🔴 ROJO = Cambiar posición'
-        ws['B3'].fill = ROJO
-        ws['C3'] = '🟡 AMARILLO = Detallar'
-        ws['C3'].fill = AMARILLO
-        ws['D3'] = '🔵 AZUL = Revisar'
-        ws['D3'].fill = AZUL
-        ws['E3'] = '🟢 VERDE = OK'
-        ws['E3'].fill = VERDE
-        
-        # Aplicar colores
-        for i, row in resumen.iterrows():
-            fila_excel = i + 6
-            if row['RAMA DE ACTIVIDAD ECONÓMICA'] != 'TOTAL':
-                if row['Cambiar'] > 0:
-                    color = ROJO
-                elif row['Detallar'] > 0:
-                    color = AMARILLO
-                elif row['Revisar'] > 0:
-                    color = AZUL
-                else:
-                    color = VERDE
-                for col in range(1, 6):
-                    ws.cell(row=fila_excel, column=col).fill = color
-        
-        ws.column_dimensions['A'].width = 70
-        
-        # HOJA 2: CUADRO INCONSISTENCIAS
-        inconsistencias = df_otro[df_otro['tipo_revision'] > 0].copy()
-        if len(inconsistencias) > 0:
-            def categorizar(row):
-                if row['tipo_revision'] == 1:
-                    return 'CUENTA_PROPIA'
-                elif row['tipo_revision'] == 2:
-                    return 'PATRON'
-                elif row['tipo_revision'] == 3:
-                    return 'DETALLAR'
-                else:
-                    return 'REVISAR'
-            
-            inconsistencias['categoria'] = inconsistencias.apply(categorizar, axis=1)
-            cuadro_inc = inconsistencias.groupby(['g_p6390s2', 'categoria']).size().unstack(fill_value=0)
-            cuadro_inc = cuadro_inc.reset_index().rename(columns={'g_p6390s2': 'RAMA'})
-            
-            for col in ['CUENTA_PROPIA', 'PATRON', 'DETALLAR', 'REVISAR']:
-                if col not in cuadro_inc.columns:
-                    cuadro_inc[col] = 0
-            
-            cols_orden = ['RAMA', 'CUENTA_PROPIA', 'PATRON', 'DETALLAR', 'REVISAR']
-            cuadro_inc = cuadro_inc[cols_orden]
-            cuadro_inc['TOTAL'] = cuadro_inc[['CUENTA_PROPIA', 'PATRON', 'DETALLAR', 'REVISAR']].sum(axis=1)
-            
-            total_inc = pd.DataFrame([{
-                'RAMA': 'TOTAL',
-                'CUENTA_PROPIA': cuadro_inc['CUENTA_PROPIA'].sum(),
-                'PATRON': cuadro_inc['PATRON'].sum(),
-                'DETALLAR': cuadro_inc['DETALLAR'].sum(),
-                'REVISAR': cuadro_inc['REVISAR'].sum(),
-                'TOTAL': cuadro_inc['TOTAL'].sum()
-            }])
-            cuadro_inc = pd.concat([cuadro_inc, total_inc], ignore_index=True)
-            
-            cuadro_inc.to_excel(writer, sheet_name='Inconsistencias', index=False, startrow=2)
-            ws2 = writer.sheets['Inconsistencias']
-            ws2['A1'] = 'DISTRIBUCIÓN DE INCONSISTENCIAS POR RAMA Y TIPO'
-            ws2['A1'].font = Font(bold=True, size=12)
-            ws2.column_dimensions['A'].width = 60
-        
-        # HOJA 3: CASOS REVISIÓN
-        cols_revision = ['directorio', 'secuencia_p', 'orden', 'municipio',
-                        'p6370', 'p6380', 'p6430s1', 'p3069', 'g_p6390s2',
-                        'tipo_revision', 'pos_corregida', 'observacion']
-        cols_disponibles = [c for c in cols_revision if c in df_otro.columns]
-        casos_rev = df_otro[df_otro['tipo_revision'] > 0][cols_disponibles].copy()
-        casos_rev.to_excel(writer, sheet_name='Casos_Revision', index=False)
-        
-        # HOJA 4: TODOS LOS CASOS
-        df_otro.to_excel(writer, sheet_name='Casos_Completo', index=False)
-    
-    output.seek(0)
-    return output
-
+            with st.expander(f"📦 Generación anterior: {trabajo.descripcion} ({hora})"):
+                mostrar_resultado(trabajo)
 
 # =============================================================================
 # INTERFAZ STREAMLIT
@@ -1042,27 +421,48 @@ st.divider()
 # Subir archivo
 uploaded_file = st.file_uploader(
     "📁 Sube el archivo de revisión de ocupados",
-    type=['xlsx', 'xls'],
-    help="Archivo Excel con la base de ocupados para revisión"
+    type=FORMATOS_ENTRADA,
+    help="Archivo Excel, CSV, Parquet o Feather/Arrow con la base de ocupados para revisión"
+)
+
+por_bloques = st.checkbox(
+    "🧱 Procesar por bloques (archivos muy grandes)",
+    help="Lee la base por partes y no la guarda completa en memoria"
 )
 
 if uploaded_file:
-    with st.spinner("Cargando archivo..."):
-        try:
-            df = pd.read_excel(uploaded_file)
-            st.success(f"✅ Archivo cargado: {len(df):,} registros | {len(df.columns)} columnas")
-        except Exception as e:
-            st.error(f"Error al cargar el archivo: {e}")
-            st.stop()
+    huella = huella_archivo(uploaded_file)
+    if por_bloques:
+        with st.spinner("Recorriendo archivo por bloques..."):
+            try:
+                with registrar() as rendimiento_carga:
+                    conteo_p6430 = resumen_archivo_por_bloques(huella, uploaded_file.name, uploaded_file)
+                st.success(f"✅ Archivo recorrido por bloques: {sum(conteo_p6430.values()):,} registros")
+            except Exception as e:
+                st.error(f"Error al cargar el archivo: {e}")
+                st.stop()
+    else:
+        with st.spinner("Cargando archivo..."):
+            try:
+                with registrar() as rendimiento_carga:
+                    n_registros, n_columnas, conteo_p6430 = resumen_archivo(huella, uploaded_file.name, uploaded_file)
+                st.success(f"✅ Archivo cargado: {n_registros:,} registros | "
+                           f"{n_columnas} columnas de revisión")
+            except Exception as e:
+                st.error(f"Error al cargar el archivo: {e}")
+                st.stop()
+    # Tiempos de la última carga que no salió del caché
+    if rendimiento_carga.mediciones:
+        st.session_state['rendimiento_carga'] = rendimiento_carga.mediciones
     
     # Mostrar resumen
     st.subheader("📈 Resumen de casos por posición ocupacional")
     col1, col2, col3, col4 = st.columns(4)
     
-    n_gobierno = len(df[df['p6430'] == 2]) if 'p6430' in df.columns else 0
-    n_particular = len(df[df['p6430'] == 1]) if 'p6430' in df.columns else 0
-    n_familiar = len(df[df['p6430'] == 6]) if 'p6430' in df.columns else 0
-    n_otro = len(df[df['p6430'] == 8]) if 'p6430' in df.columns else 0
+    n_gobierno = conteo_p6430.get(2, 0)
+    n_particular = conteo_p6430.get(1, 0)
+    n_familiar = conteo_p6430.get(6, 0)
+    n_otro = conteo_p6430.get(8, 0)
     
     col1.metric("🏛️ Emp. Gobierno (2)", f"{n_gobierno:,}")
     col2.metric("🏢 Emp. Particular (1)", f"{n_particular:,}")
@@ -1080,80 +480,94 @@ if uploaded_file:
     gen_familiar = col_opts[2].checkbox("Trabajador Familiar", value=n_familiar > 0, disabled=n_familiar == 0)
     gen_otro = col_opts[3].checkbox("Otro, ¿cuál?", value=n_otro > 0, disabled=n_otro == 0)
     
+    exportar_parquet = st.checkbox(
+        "🗃️ Exportar también Casos_Revision y Casos_Completo en Parquet",
+        disabled=por_bloques,
+        help="Disponible cuando la base se carga completa (sin procesar por bloques)"
+    )
+    
+    incremental = st.checkbox(
+        "🔁 Revisión incremental (comparar con la ronda anterior)",
+        disabled=por_bloques,
+        help="Solo reclasifica los registros nuevos o modificados desde la última ronda "
+             "y reporta los casos resueltos, nuevos y pendientes"
+    )
+    ronda = st.text_input(
+        "Nombre de la ronda",
+        value=nombre_ronda(uploaded_file.name),
+        disabled=not incremental or por_bloques,
+        help="Cada revisión (base o periodo) guarda sus rondas con su propio nombre; usa el mismo nombre "
+             "en todas las rondas de una revisión aunque el archivo cambie de nombre"
+    ).strip() or nombre_ronda(uploaded_file.name)
+    if incremental and not por_bloques:
+        rondas = RondasRevision(ronda)
+        previas = {}
+        for tipo, nombre_tipo in NOMBRES.items():
+            previas.setdefault(describir_ronda(rondas.previa(tipo)), []).append(nombre_tipo)
+        st.caption("Se compara con: " + " | ".join(f"{texto} ({', '.join(tipos)})" for texto, tipos in previas.items()))
+    
+    particion = st.selectbox(
+        "📑 Hoja Casos_Completo",
+        [None] + PARTICIONES,
+        format_func=lambda p: {None: "Una hoja (se continúa en otra al llegar al límite de Excel)",
+                               'departamento': "Una hoja por departamento",
+                               'municipio': f"Una hoja por municipio (por departamento si pasan de {MAX_HOJAS_PARTICION})"}[p],
+        help="Excel admite 1.048.576 filas por hoja; las bases nacionales pueden acercarse a ese límite"
+    )
+    
+    sin_almacen = almacen_por_defecto() is None
+    zip_todos = st.checkbox(
+        "📦 Preparar también un ZIP con todos los archivos",
+        value=not sin_almacen,
+        disabled=sin_almacen,
+        help="Un solo archivo con una carpeta por responsable de revisión"
+             + (" (requiere la carpeta de salidas en disco, REV_OCUPADOS_SALIDAS)" if sin_almacen else "")
+    )
+    
+    perfil_detallado = st.checkbox(
+        "🔬 Generar perfil detallado (cProfile)",
+        help="Perfila la generación en un solo proceso; tarda más, pero muestra qué funciones consumen el tiempo"
+    )
+    
     st.divider()
     
     # Botón para generar
     if st.button("🚀 Generar archivos de revisión", type="primary", use_container_width=True):
         
-        fecha = datetime.now().strftime('%Y%m%d')
-        archivos_generados = []
-        
-        with st.spinner("Procesando archivos..."):
-            progress = st.progress(0)
-            
-            # Empleados del gobierno
-            if gen_gobierno and n_gobierno > 0:
-                progress.progress(10, "Procesando Empleados del Gobierno...")
-                df_gob = df[df['p6430'] == 2].copy()
-                excel_gob = generar_excel_gobierno(df_gob)
-                if excel_gob:
-                    archivos_generados.append(('gobierno', excel_gob, f"rev_empleados_gobierno_{fecha}.xlsx"))
-            
-            # Empleados particulares
-            if gen_particular and n_particular > 0:
-                progress.progress(35, "Procesando Empleados Particulares...")
-                df_part = df[df['p6430'] == 1].copy()
-                excel_part = generar_excel_particular(df_part)
-                if excel_part:
-                    archivos_generados.append(('particular', excel_part, f"rev_emp_particular_{fecha}.xlsx"))
-            
-            # Trabajador familiar
-            if gen_familiar and n_familiar > 0:
-                progress.progress(60, "Procesando Trabajadores Familiares...")
-                df_fam = df[df['p6430'] == 6].copy()
-                excel_fam = generar_excel_familiar(df_fam)
-                if excel_fam:
-                    archivos_generados.append(('familiar', excel_fam, f"rev_trabajador_familiar_{fecha}.xlsx"))
-            
-            # Otro, ¿cuál?
-            if gen_otro and n_otro > 0:
-                progress.progress(85, "Procesando 'Otro, ¿cuál?'...")
-                df_otro = df[df['p6430'] == 8].copy()
-                excel_otro = generar_excel_otro(df_otro)
-                if excel_otro:
-                    archivos_generados.append(('otro', excel_otro, f"rev_otro_cual_{fecha}.xlsx"))
-            
-            progress.progress(100, "¡Completado!")
-        
-        if archivos_generados:
-            st.success(f"✅ Se generaron {len(archivos_generados)} archivo(s) de revisión")
-            
-            # Mostrar descargas
-            st.subheader("📥 Descargar archivos")
-            
-            cols = st.columns(len(archivos_generados))
-            
-            iconos = {'gobierno': '🏛️', 'particular': '🏢', 'familiar': '👨‍👩‍👧', 'otro': '❓'}
-            nombres = {'gobierno': 'Emp. Gobierno', 'particular': 'Emp. Particular', 
-                       'familiar': 'Trab. Familiar', 'otro': 'Otro, ¿cuál?'}
-            asignados = {'gobierno': 'Carolina', 'particular': 'Paula', 
-                         'familiar': 'Jeannette', 'otro': 'Jeannette'}
-            
-            for i, (tipo, excel, filename) in enumerate(archivos_generados):
-                with cols[i]:
-                    st.download_button(
-                        label=f"{iconos.get(tipo, '📄')} {nombres.get(tipo, tipo)}",
-                        data=excel,
-                        file_name=filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
-                    )
-                    st.caption(f"📌 {asignados.get(tipo, '')}")
-        else:
-            st.warning("⚠️ No se generaron archivos. Verifica las opciones seleccionadas.")
+        seleccion = [tipo for tipo, generar, n in [('gobierno', gen_gobierno, n_gobierno),
+                                                   ('particular', gen_particular, n_particular),
+                                                   ('familiar', gen_familiar, n_familiar),
+                                                   ('otro', gen_otro, n_otro)]
+                     if generar and n > 0]
+        
+        # Toda la generación usa la versión de los diccionarios vigente al hacer clic
+        diccionarios = diccionarios_vigentes()
+        
+        # Archivos ya generados en esta sesión para el mismo contenido, hojas y diccionarios
+        llave_resultados = (huella, particion, diccionarios.huella)
+        if st.session_state.get('huella_resultados') != llave_resultados:
+            st.session_state['huella_resultados'] = llave_resultados
+            st.session_state['resultados'] = {}
+        
+        # El trabajo lee su propia copia del archivo: la página puede recargarse
+        # o el archivo quitarse mientras se genera
+        trabajo = cola_trabajos().enviar(
+            f"{uploaded_file.name} · {', '.join(NOMBRES[tipo] for tipo in seleccion) or 'sin posiciones'}",
+            generar_revision,
+            huella, uploaded_file.name, BytesIO(uploaded_file.getvalue()), seleccion,
+            {'por_bloques': por_bloques, 'exportar_parquet': exportar_parquet,
+             'incremental': incremental, 'perfil_detallado': perfil_detallado, 'zip': zip_todos,
+             'particion': particion, 'diccionarios': diccionarios, 'ronda': ronda,
+             'llave_resultados': llave_resultados},
+            dict(st.session_state['resultados']), conteo_p6430, caches_trabajos(),
+        )
+        st.session_state.setdefault('trabajos', []).append(trabajo.id)
+    
+    panel_trabajos()
 
 else:
-    st.info("👆 Sube un archivo Excel para comenzar")
+    panel_trabajos()
+    st.info("👆 Sube un archivo (Excel, CSV, Parquet o Feather) para comenzar")
     
     with st.expander("ℹ️ ¿Cómo funciona?"):
         st.markdown("""
@@ -1162,7 +576,7 @@ else:
         2. **Revisa** el resumen de casos por posición ocupacional
         3. **Selecciona** qué posiciones quieres generar
         4. **Genera** los archivos de validación
-        5. **Descarga** cada archivo y distribúyelo al equipo
+        5. **Descarga** cada archivo y distribúyelo al equipo (o todos en un ZIP, con una carpeta por responsable)
         
         ### Estructura de los archivos generados
         Cada archivo Excel contiene:
@@ -1212,3 +626,7 @@ else:
 st.divider()
 st.caption("DANE • DIMPE • Equipo de Validación GEIH")
 st.caption("Versión 2.0 - Diciembre 2024")
+vigentes = diccionarios_vigentes()
+st.caption(f"Diccionarios: versión {vigentes.version} ({vigentes.huella})")
+if fuente_por_defecto().error:
+    st.warning(f"⚠️ {fuente_por_defecto().error}. Se siguen usando los diccionarios anteriores.")
@@ -0,0 +1,122 @@
+"""
+Generador de bases sintéticas con la forma de la base de ocupados - GEIH
+
+Produce una mezcla de posiciones (p6430) parecida a la de la encuesta, ramas
+tomadas de ORDEN_RAMAS y textos de empresa/oficio armados con las palabras de
+los diccionarios más ruido (nombres propios, minúsculas, nulos). Los textos se
+repiten con frecuencias tipo Zipf, como en la base real, donde unos pocos
+empleadores ("ALCALDIA DE ...", "SECRETARIA DE EDUCACION") concentran muchos
+registros.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import diccionarios as d
+
+# Proporción aproximada de ocupados por posición ocupacional (P6430)
+MEZCLA_P6430 = {1: 0.40, 2: 0.04, 3: 0.03, 4: 0.03, 5: 0.41, 6: 0.03, 7: 0.04, 8: 0.02}
+
+MUNICIPIOS = ['11001', '05001', '76001', '08001', '13001', '68001', '54001', '66001',
+              '17001', '73001', '52001', '50001', '23001', '41001', '63001', '20001']
+
+GRUPOS_OCUPACION = [
+    'Directores y gerentes',
+    'Profesionales, científicos e intelectuales',
+    'Técnicos y profesionales del nivel medio',
+    'Personal de apoyo administrativo',
+    'Trabajadores de los servicios y vendedores de comercios y mercados',
+    'Agricultores y trabajadores calificados agropecuarios, forestales y pesqueros',
+    'Oficiales, operarios, artesanos y oficios relacionados',
+    'Operadores de instalaciones y máquinas y ensambladores',
+    'Ocupaciones elementales',
+]
+
+# Palabras de la versión vigente de diccionarios.json
+_P = d.diccionarios_vigentes().palabras
+PALABRAS_EMPRESA = (_P['EMPRESAS_REGIMEN_PRIVADO'] + _P['ENTIDADES_PRIVADAS_NO_GOBIERNO'] + _P['EMPRESAS_MIXTAS']
+                    + _P['PALABRAS_RAMA_8412'] + _P['PALABRAS_RAMA_8414'] + _P['PALABRAS_RAMA_8413']
+                    + _P['PALABRAS_PRIVADAS_ADM_PUBLICA'] + _P['CONTRATANTES_GOBIERNO'] + _P['UNIVERSIDADES_PUBLICAS']
+                    + _P['ENTIDADES_GOBIERNO'] + _P['INSTITUCIONES_EDUCATIVAS_PUBLICAS'] + _P['EMPRESAS_PRIVADAS']
+                    + _P['ENTIDADES_NO_FAMILIARES'] + _P['INDICADORES_FAMILIAR'])
+PALABRAS_OFICIO = (_P['CARGOS_DIRECTIVOS_P6370'] + _P['PALABRAS_CONTRATISTA'] + _P['PALABRAS_DOMESTICO']
+                   + _P['PALABRAS_PRODUCCION_DIRECTA'] + _P['PALABRAS_SUPERVISION'] + _P['CARGOS_DECISION'])
+PALABRAS_OTRO = _P['PALABRAS_OTRO_VALIDO'] + _P['PALABRAS_CUENTA_PROPIA'] + _P['PALABRAS_PATRON']
+
+RUIDO_EMPRESA = ['TIENDA DON JOSE', 'CASA DE FAMILIA', 'INDEPENDIENTE', 'ALMACEN EL TRIUNFO',
+                 'DISTRIBUIDORA LA 14', 'CONSTRUCTORA BOLIVAR', 'FINCA LA ESPERANZA', 'NO SABE',
+                 'PARTICULAR', 'VARIOS', 'COMPAÑIA DE SEGURIDAD', 'SUPERMERCADO OLIMPICA']
+RUIDO_OFICIO = ['VENDEDOR', 'CONDUCTOR', 'AUXILIAR ADMINISTRATIVO', 'DOCENTE', 'ENFERMERA', 'MESERO',
+                'OPERARIO', 'VIGILANTE', 'CAJERA', 'ASESOR COMERCIAL', 'MENSAJERO', 'COCINERA']
+APELLIDOS = ['PEREZ', 'GOMEZ', 'RODRIGUEZ', 'MARTINEZ', 'LOPEZ', 'GARCIA', 'DE ANTIOQUIA', 'DEL VALLE',
+             'DE BOGOTA', 'DE CALI', 'NACIONAL', 'DEL ATLANTICO', 'S.A.S', 'LTDA', 'ESP']
+
+
+def _vocabulario(rng, palabras, ruido, tamano):
+    """Textos distintos: palabra de diccionario o ruido, con complementos y variaciones de formato."""
+    bases = np.array(palabras + ruido, dtype=object)
+    es_diccionario = rng.random(tamano) < 0.6
+    base = np.where(es_diccionario,
+                    bases[rng.integers(0, len(palabras), tamano)],
+                    bases[len(palabras) + rng.integers(0, len(ruido), tamano)])
+    complemento = np.array(APELLIDOS, dtype=object)[rng.integers(0, len(APELLIDOS), tamano)]
+    numero = rng.integers(1, 1000, tamano).astype(str)
+    textos = base + ' ' + complemento + ' ' + numero
+    minusculas = rng.random(tamano) < 0.1
+    textos[minusculas] = [t.lower() for t in textos[minusculas]]
+    return textos
+
+
+def _muestra_zipf(rng, vocabulario, n, exponente=1.1):
+    """n textos del vocabulario con frecuencias tipo Zipf."""
+    pesos = 1.0 / np.arange(1, len(vocabulario) + 1) ** exponente
+    return vocabulario[rng.choice(len(vocabulario), size=n, p=pesos / pesos.sum())]
+
+
+def _con_nulos(rng, valores, proporcion):
+    valores = valores.astype(object)
+    valores[rng.random(len(valores)) < proporcion] = np.nan
+    return valores
+
+
+def generar_base(n_filas, semilla=0):
+    """Base sintética de ocupados con n_filas registros."""
+    rng = np.random.default_rng(semilla)
+    # Los textos distintos crecen más despacio que la base, como en la encuesta
+    tamano = max(200, int(40 * np.sqrt(n_filas)))
+
+    p6430 = rng.choice(list(MEZCLA_P6430), size=n_filas, p=list(MEZCLA_P6430.values()))
+    asalariado = np.isin(p6430, [1, 2])
+    municipio = np.array(MUNICIPIOS, dtype=object)[rng.integers(0, len(MUNICIPIOS), n_filas)]
+
+    pesos_rama = rng.dirichlet(np.ones(len(d.ORDEN_RAMAS)))
+    rama = np.array(d.ORDEN_RAMAS, dtype=object)[rng.choice(len(d.ORDEN_RAMAS), size=n_filas, p=pesos_rama)]
+
+    p6430s1 = _muestra_zipf(rng, _vocabulario(rng, PALABRAS_OTRO, RUIDO_OFICIO, max(50, tamano // 10)), n_filas)
+    p6430s1 = np.where(p6430 == 8, p6430s1, np.nan)
+
+    return pd.DataFrame({
+        'directorio': np.arange(n_filas) // 3 + 7_000_000,
+        'secuencia_p': np.ones(n_filas, dtype='int64'),
+        'orden': np.arange(n_filas) % 3 + 1,
+        'mes': rng.integers(1, 13, n_filas),
+        'dpto': [m[:2] for m in municipio],
+        'municipio': municipio,
+        'p6430': p6430,
+        'p6370': _con_nulos(rng, _muestra_zipf(rng, _vocabulario(rng, PALABRAS_OFICIO, RUIDO_OFICIO, tamano),
+                                               n_filas), 0.02),
+        'p6380': _con_nulos(rng, _muestra_zipf(rng, _vocabulario(rng, PALABRAS_EMPRESA, RUIDO_EMPRESA, tamano),
+                                               n_filas), 0.05),
+        'p6430s1': p6430s1,
+        'g_p6390s2': _con_nulos(rng, rama, 0.01),
+        'g_p6370s3': np.array(GRUPOS_OCUPACION, dtype=object)[rng.integers(0, len(GRUPOS_OCUPACION), n_filas)],
+        'p6400': np.where(asalariado, rng.choice([1, 2], size=n_filas, p=[0.9, 0.1]), np.nan),
+        'p3069': rng.integers(1, 11, n_filas),
+        'p6500': np.where(asalariado, rng.lognormal(14, 0.6, n_filas).round(-3), np.nan),
+        'fex_c18': rng.uniform(50, 400, n_filas).round(4),
+    })
@@ -0,0 +1,184 @@
+"""
+Benchmark de la generación de archivos de revisión - GEIH
+
+Genera bases sintéticas (datos_sinteticos.py) de varios tamaños y mide por
+separado cada etapa: carga, clasificación, agregación y escritura del libro.
+Reporta tiempo, registros por segundo y memoria pico (tracemalloc) y guarda
+todo en JSON para comparar entre versiones.
+
+tracemalloc sigue la memoria de Python y NumPy (no la de Arrow) y hace más
+lentas las etapas; para comparar tiempos conviene correr con --sin-memoria.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/medir.py                                  # 10k, 100k y 1M registros
+    python benchmarks/medir.py --filas 10000 -o antes.json
+    python benchmarks/medir.py --filas 10000 -o despues.json --comparar antes.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datos_sinteticos import generar_base
+from generacion import (POSICIONES, partir_por_posicion, clasificar_posicion, contar_por_rama, resumir_posicion,
+                        escribir_excel)
+from escritura import MOTOR_EXCEL, MOTORES_EXCEL
+from lectura import leer_base_posiciones
+
+ETAPAS = ['carga', 'clasificacion', 'agregacion', 'escritura']
+
+
+def _version():
+    """Commit actual del repositorio, si está disponible."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _medir(funcion, *argumentos, memoria=True):
+    """Ejecuta funcion(*argumentos). Retorna (resultado, segundos, memoria pico en MB)."""
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion(*argumentos)
+    segundos = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return resultado, segundos, pico
+
+
+def _acumular(etapa, filas, segundos, pico):
+    etapa['filas'] += filas
+    etapa['segundos'] += segundos
+    if pico is not None:
+        etapa['memoria_pico_mb'] = max(etapa['memoria_pico_mb'] or 0, pico)
+
+
+def medir_tamano(n_filas, formato='parquet', motor=None, usar_cache=False, memoria=True, semilla=0):
+    """Mide las cuatro etapas sobre una base sintética de n_filas. Retorna dict por etapa y posición."""
+    df = generar_base(n_filas, semilla)
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, f'base.{formato}')
+        if formato == 'parquet':
+            df.to_parquet(ruta, index=False)
+        elif formato == 'csv':
+            df.to_csv(ruta, index=False)
+        else:
+            df.to_excel(ruta, index=False)
+        del df
+
+        etapas = {etapa: {'filas': 0, 'segundos': 0.0, 'memoria_pico_mb': None} for etapa in ETAPAS}
+        posiciones = {}
+
+        with open(ruta, 'rb') as archivo:
+            base, segundos, pico = _medir(leer_base_posiciones, archivo, os.path.basename(ruta),
+                                          [spec['p6430'] for spec in POSICIONES.values()], memoria=memoria)
+        _acumular(etapas['carga'], n_filas, segundos, pico)
+
+        for tipo, df_tipo in partir_por_posicion(base).items():
+            spec = POSICIONES[tipo]
+            n = len(df_tipo)
+            detalle = posiciones[tipo] = {'filas': n}
+
+            df_tipo, segundos, pico = _medir(clasificar_posicion, tipo, df_tipo, usar_cache, memoria=memoria)
+            _acumular(etapas['clasificacion'], n, segundos, pico)
+            detalle['clasificacion'] = segundos
+
+            (resumen, inconsistencias), segundos, pico = _medir(
+                lambda: resumir_posicion(tipo, contar_por_rama(df_tipo)), memoria=memoria)
+            _acumular(etapas['agregacion'], n, segundos, pico)
+            detalle['agregacion'] = segundos
+
+            excel, segundos, pico = _medir(escribir_excel, spec, resumen, inconsistencias, df_tipo, motor,
+                                           memoria=memoria)
+            _acumular(etapas['escritura'], n, segundos, pico)
+            detalle['escritura'] = segundos
+            detalle['bytes_excel'] = excel.getbuffer().nbytes
+
+    for etapa in etapas.values():
+        etapa['filas_por_segundo'] = etapa['filas'] / etapa['segundos'] if etapa['segundos'] else None
+    return {'filas': n_filas, 'etapas': etapas, 'posiciones': posiciones}
+
+
+def _imprimir(resultado):
+    print(f"\n{resultado['filas']:,} registros")
+    for nombre, etapa in resultado['etapas'].items():
+        memoria = f"{etapa['memoria_pico_mb']:9.1f} MB" if etapa['memoria_pico_mb'] is not None else ''
+        print(f"  {nombre:<14} {etapa['segundos']:9.2f} s {etapa['filas_por_segundo'] or 0:14,.0f} reg/s {memoria}")
+
+
+def _comparar(actual, anterior):
+    """Imprime la razón de tiempos (actual / anterior) por tamaño y etapa."""
+    previos = {r['filas']: r for r in anterior['resultados']}
+    print(f"\nComparación con {anterior.get('version') or 'versión anterior'} (tiempo actual / anterior)")
+    for resultado in actual['resultados']:
+        previo = previos.get(resultado['filas'])
+        if previo is None:
+            continue
+        razones = []
+        for nombre, etapa in resultado['etapas'].items():
+            antes = previo['etapas'].get(nombre, {}).get('segundos')
+            if antes:
+                razones.append(f"{nombre} {etapa['segundos'] / antes:.2f}x")
+        print(f"  {resultado['filas']:>10,}: " + ' | '.join(razones))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark por etapas con bases sintéticas.')
+    parser.add_argument('--filas', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+                        help='Tamaños de base a medir')
+    parser.add_argument('--formato', choices=['parquet', 'csv', 'xlsx'], default='parquet',
+                        help='Formato del archivo de entrada para medir la carga')
+    parser.add_argument('--motor', choices=MOTORES_EXCEL, default=None, help='Motor de escritura del Excel')
+    parser.add_argument('--con-cache', action='store_true', help='Usar el caché persistente de clasificaciones')
+    parser.add_argument('--sin-memoria', action='store_true',
+                        help='No medir memoria (tracemalloc hace más lentas las etapas)')
+    parser.add_argument('-o', '--salida', default='resultados_benchmark.json', help='Archivo JSON de resultados')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para comparar tiempos')
+    args = parser.parse_args(argv)
+
+    informe = {
+        'version': _version(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'formato': args.formato,
+        'motor': args.motor or MOTOR_EXCEL,
+        'con_cache': args.con_cache,
+        'memoria_medida': not args.sin_memoria,
+        'resultados': [],
+    }
+    for n_filas in args.filas:
+        resultado = medir_tamano(n_filas, args.formato, args.motor, args.con_cache, not args.sin_memoria)
+        informe['resultados'].append(resultado)
+        _imprimir(resultado)
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            _comparar(informe, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Verificación de la normalización de textos contra la búsqueda anterior - GEIH
+
+Antes de normalizacion.py las reglas buscaban cada palabra de los diccionarios
+tal cual como subcadena del texto en mayúsculas. Con textos que ya vienen en
+mayúsculas y sin tildes, la normalización no debe cambiar ninguna
+clasificación, salvo por dos cambios buscados:
+  - el borde del texto cuenta como límite de palabra (' SENA' coincide con
+    'SENA LOPEZ'), y
+  - las siglas se comparan por sus letras, con o sin puntos ('E.S.E.' con
+    'ESE DE CALI' y con 'E.S.E PEREZ').
+Este script clasifica bases sintéticas (datos_sinteticos.py) con las mismas
+tablas de reglas de las dos formas y reporta los registros que difieren.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/verificar_normalizacion.py
+    python benchmarks/verificar_normalizacion.py --filas 200000 --semillas 0 1 2
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datos_sinteticos import generar_base
+from buscador import BuscadorPalabras
+from clasificacion import REGLAS_FAMILIAR, REGLAS_GOBIERNO, REGLAS_OTRO, REGLAS_PARTICULAR, TablaReglas
+from diccionarios import diccionarios_vigentes
+from generacion import partir_por_posicion
+from normalizacion import _SIGLA, plegar_acentos
+
+TABLAS = {'gobierno': REGLAS_GOBIERNO, 'particular': REGLAS_PARTICULAR,
+          'familiar': REGLAS_FAMILIAR, 'otro': REGLAS_OTRO}
+COLUMNAS_TEXTO = ['p6380', 'p6370', 'p6430s1']
+_BORDES = '_bordes'
+
+
+def _sin_puntos(sigla):
+    return sigla.group(0).replace('.', '').replace(' ', '')
+
+
+def _buscador_anterior(diccionarios):
+    """Palabras tal cual (subcadena); las que tienen siglas con puntos, sin ellos y como palabra completa."""
+    palabras = {}
+    for nombre, lista in diccionarios.palabras.items():
+        palabras[nombre] = [f" {_SIGLA.sub(_sin_puntos, p).strip(' .')} " if _SIGLA.search(p) else p
+                            for p in lista]
+    return BuscadorPalabras(palabras)
+
+
+def _columnas(columnas):
+    return [columnas] if isinstance(columnas, str) else columnas
+
+
+def _tabla_anterior(tabla):
+    """La misma tabla leyendo en mayúsculas, sin normalizar, copias de los textos con un espacio a cada lado."""
+    campos = {}
+    for nombre, (columnas, forma) in tabla['campos'].items():
+        if forma == 'busqueda':
+            columnas, forma = [c + _BORDES for c in _columnas(columnas)], 'mayusculas'
+        campos[nombre] = (columnas, forma)
+    return dict(tabla, campos=campos)
+
+
+def _con_bordes(df):
+    """df con una copia de cada texto con las siglas sin puntos y un espacio a cada lado (sufijo _BORDES)."""
+    return df.assign(**{c + _BORDES: ' ' + df[c].fillna('').astype(str).str.replace(_SIGLA, _sin_puntos, regex=True)
+                        + ' ' for c in COLUMNAS_TEXTO})
+
+
+def textos_anteriores(df):
+    """Textos como llegaban antes: en mayúsculas y sin tildes (la Ñ se conserva)."""
+    df = df.copy()
+    for columna in COLUMNAS_TEXTO:
+        df[columna] = df[columna].map(lambda t: plegar_acentos(t.upper()) if isinstance(t, str) else t)
+    return df
+
+
+def comparar(df, diccionarios=None):
+    """Retorna {posición: DataFrame de registros con observación distinta} (vacío si todo coincide)."""
+    diccionarios = diccionarios or diccionarios_vigentes()
+    anterior = _buscador_anterior(diccionarios)
+    diferencias = {}
+    for tipo, df_tipo in partir_por_posicion(textos_anteriores(df)).items():
+        tabla = TABLAS[tipo]
+        esperado = TablaReglas(_tabla_anterior(tabla), buscador=anterior)(_con_bordes(df_tipo))
+        actual = TablaReglas(tabla)(df_tipo, diccionarios)
+        distinto = esperado['observacion'] != actual['observacion']
+        diferencias[tipo] = pd.concat([df_tipo[COLUMNAS_TEXTO],
+                                       esperado['observacion'].rename('antes'),
+                                       actual['observacion'].rename('ahora')], axis=1)[distinto]
+    return diferencias
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara la búsqueda normalizada con la anterior.')
+    parser.add_argument('--filas', type=int, default=100_000, help='Registros de cada base sintética')
+    parser.add_argument('--semillas', nargs='+', type=int, default=[0, 1], help='Semillas de las bases')
+    args = parser.parse_args(argv)
+
+    total = 0
+    for semilla in args.semillas:
+        for tipo, distintos in comparar(generar_base(args.filas, semilla)).items():
+            total += len(distintos)
+            print(f"semilla {semilla} {tipo:<11} {len(distintos):>6,} registros distintos")
+            if len(distintos):
+                print(distintos.drop_duplicates(['antes', 'ahora']).head(10).to_string())
+    return 1 if total else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Buscador de palabras clave para los diccionarios de validación - GEIH
+
+Compila cada diccionario (lista de palabras) una sola vez en una expresión
+regular con forma de árbol de prefijos. Así, saber si un texto contiene alguna
+palabra de la lista cuesta una pasada sobre el texto, sin importar cuántas
+palabras tenga el diccionario. Para revisar un texto contra varios
+diccionarios a la vez (analizar, mascaras), se combinan en una sola expresión
+que reporta todos los que coinciden en la misma pasada.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def _patron_arbol(palabras):
+    """Construye una expresión regular de árbol de prefijos para las palabras."""
+    arbol = {}
+    for palabra in palabras:
+        nodo = arbol
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = {}
+
+    def construir(nodo):
+        # Si una palabra termina aquí, basta con ella: no hace falta seguir
+        if '' in nodo:
+            return ''
+        ramas = [re.escape(c) + construir(hijo) for c, hijo in sorted(nodo.items())]
+        if len(ramas) == 1:
+            return ramas[0]
+        return '(?:' + '|'.join(ramas) + ')'
+
+    return re.compile(construir(arbol))
+
+
+class BuscadorPalabras:
+    """
+    Conjunto de diccionarios compilados.
+    Recibe un dict {nombre: lista de palabras} y compila todos al crearse.
+    patrones: {nombre: expresión} ya construidas (índice precompilado), para
+    no volver a armar los árboles.
+    """
+
+    def __init__(self, diccionarios, patrones=None):
+        self.diccionarios = {nombre: list(palabras) for nombre, palabras in diccionarios.items()}
+        if patrones is None:
+            self.patrones = {nombre: _patron_arbol(palabras) for nombre, palabras in self.diccionarios.items()}
+        else:
+            self.patrones = {nombre: re.compile(patrones[nombre]) for nombre in self.diccionarios}
+        self._combinados = {}
+
+    def _combinado(self, nombres):
+        """
+        (puerta, grupos) para revisar varios diccionarios a la vez. La puerta
+        es el árbol con todas sus palabras: solo se detiene donde empieza
+        alguna. grupos es de ancho cero: en esa posición captura, en un grupo
+        por diccionario, la palabra que coincide (o nada).
+        """
+        if nombres not in self._combinados:
+            puerta = _patron_arbol([p for nombre in nombres for p in self.diccionarios[nombre]])
+            grupos = ''.join(f'(?=(?P<d{i}>{self.patrones[nombre].pattern})|)' for i, nombre in enumerate(nombres))
+            self._combinados[nombres] = (puerta, re.compile(grupos))
+        return self._combinados[nombres]
+
+    def _coincidencias(self, texto, nombres):
+        """{índice en nombres: primera palabra encontrada} en una pasada sobre el texto."""
+        puerta, grupos = self._combinado(nombres)
+        encontradas = {}
+        inicio = puerta.search(texto)
+        while inicio is not None:
+            for i, palabra in enumerate(grupos.match(texto, inicio.start()).groups()):
+                if palabra is not None and i not in encontradas:
+                    encontradas[i] = palabra
+            if len(encontradas) == len(nombres):
+                break
+            inicio = puerta.search(texto, inicio.start() + 1)
+        return encontradas
+
+    def analizar(self, texto, nombres=None):
+        """
+        Revisa el texto contra todos los diccionarios (o los indicados) en una
+        sola pasada. Retorna dict {nombre: primera palabra encontrada} solo con
+        los que coinciden.
+        """
+        nombres = tuple(nombres or self.patrones)
+        encontradas = self._coincidencias(texto, nombres)
+        return {nombre: encontradas[i] for i, nombre in enumerate(nombres) if i in encontradas}
+
+    @staticmethod
+    def _contiene(serie, patron):
+        return serie.str.contains(patron, na=False).to_numpy(dtype=bool)
+
+    def mascara(self, serie, nombre):
+        """Máscara booleana por columna: la serie de texto contiene alguna palabra."""
+        return self._contiene(serie, self.patrones[nombre])
+
+    def mascaras(self, serie, nombres):
+        """
+        {nombre: máscara booleana} de varios diccionarios sobre la misma serie
+        de texto. Cada valor distinto se revisa una vez: la puerta (ver
+        _combinado) descarta en una pasada por columna los que no tienen
+        ninguna palabra y a los demás se les revisan todos los diccionarios en
+        una pasada (ver analizar), en vez de una búsqueda por diccionario.
+        """
+        nombres = tuple(nombres)
+        codigos, unicos = pd.factorize(serie)
+        unicos = pd.Series(unicos)
+        # Columna final: valores nulos (código -1)
+        encontradas = np.zeros((len(nombres), len(unicos) + 1), dtype=bool)
+        if len(nombres) == 1:
+            encontradas[0, :-1] = self.mascara(unicos, nombres[0])
+        else:
+            puerta, _ = self._combinado(nombres)
+            for j in np.flatnonzero(self._contiene(unicos, puerta)):
+                for i in self._coincidencias(unicos[j], nombres):
+                    encontradas[i, j] = True
+        return {nombre: encontradas[i][codigos] for i, nombre in enumerate(nombres)}
@@ -0,0 +1,130 @@
+"""
+Caché persistente de clasificaciones - GEIH
+
+Los mismos nombres de empresa y oficios ("ALCALDIA DE ...", "SECRETARIA DE
+EDUCACION") se repiten miles de veces dentro de una base y de un mes a otro.
+Este caché guarda en SQLite el resultado del clasificador para cada
+combinación de entradas normalizadas, así solo se evalúan las combinaciones
+que no se han visto antes.
+
+La versión del caché combina la huella de los diccionarios con VERSION_REGLAS:
+al editar cualquier lista de palabras (aun con la aplicación corriendo) las
+entradas anteriores dejan de valer, y se borran al abrir el caché.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from diccionarios import diccionarios_vigentes
+from clasificacion import VERSION_REGLAS, combinaciones_unicas
+from rendimiento import contar
+
+# Ruta del caché; REV_OCUPADOS_CACHE='' lo desactiva
+RUTA_CACHE = os.environ.get(
+    'REV_OCUPADOS_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rev_ocupados_geih', 'clasificaciones.sqlite'),
+)
+
+
+def version_cache(diccionarios=None):
+    """Versión de las clasificaciones con unos diccionarios (por defecto, los vigentes)."""
+    return f'{(diccionarios or diccionarios_vigentes()).huella}-{VERSION_REGLAS}'
+
+
+# Tipos de las columnas de resultado (las demás quedan como texto)
+TIPOS_RESULTADO = {'tipo_revision': 'int64', 'pos_corregida': 'float64'}
+
+# Llaves por consulta (SQLite admite hasta 999 parámetros)
+LOTE_CONSULTA = 900
+
+
+class CacheClasificacion:
+    """
+    Tabla SQLite {(tipo, versión, llave de entradas): resultado del clasificador}.
+    Sin version, cada consulta usa la de los diccionarios vigentes.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, version=None):
+        if ruta != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.version = version
+        # Streamlit ejecuta cada recarga en un hilo distinto
+        self._candado = threading.Lock()
+        self.conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+        with self._candado, self.conexion:
+            self.conexion.execute('PRAGMA journal_mode=WAL')
+            self.conexion.execute(
+                'CREATE TABLE IF NOT EXISTS clasificaciones ('
+                'tipo TEXT, version TEXT, llave TEXT, resultado TEXT, '
+                'PRIMARY KEY (tipo, version, llave))'
+            )
+            self.conexion.execute('DELETE FROM clasificaciones WHERE version != ?', (version or version_cache(),))
+
+    def consultar(self, tipo, llaves, version=None):
+        """Retorna {llave: resultado} de las llaves que ya están en el caché."""
+        version = version or self.version or version_cache()
+        llaves = list(llaves)
+        encontrados = {}
+        with self._candado:
+            for inicio in range(0, len(llaves), LOTE_CONSULTA):
+                lote = llaves[inicio:inicio + LOTE_CONSULTA]
+                consulta = ('SELECT llave, resultado FROM clasificaciones '
+                            f'WHERE tipo = ? AND version = ? AND llave IN ({",".join("?" * len(lote))})')
+                for llave, resultado in self.conexion.execute(consulta, [tipo, version] + lote):
+                    encontrados[llave] = json.loads(resultado)
+        return encontrados
+
+    def guardar(self, tipo, resultados, version=None):
+        """Guarda {llave: resultado} para el tipo de posición."""
+        version = version or self.version or version_cache()
+        filas = [(tipo, version, llave, json.dumps(resultado, ensure_ascii=False))
+                 for llave, resultado in resultados.items()]
+        with self._candado, self.conexion:
+            self.conexion.executemany('INSERT OR REPLACE INTO clasificaciones VALUES (?, ?, ?, ?)', filas)
+
+    def clasificar(self, tipo, df, clasificador, entradas, diccionarios=None):
+        """
+        Aplica clasificador una vez por combinación de entradas que no está en
+        el caché y arma el resultado completo con el índice de df.
+        diccionarios: versión con que clasifica el clasificador (define la versión del caché).
+        """
+        if len(df) == 0:
+            return clasificador(df)
+        version = self.version or version_cache(diccionarios)
+        codigos, unicas, primeros = combinaciones_unicas(df, entradas)
+        conocidos = self.consultar(tipo, unicas, version)
+
+        faltan = np.array([llave not in conocidos for llave in unicas])
+        contar('combinaciones', len(unicas))
+        contar('en_cache', int((~faltan).sum()))
+        contar('evaluadas', int(faltan.sum()))
+        if faltan.any():
+            nuevos = clasificador(df.iloc[primeros[faltan]]).astype(object)
+            nuevos = nuevos.where(nuevos.notna(), None)
+            por_llave = dict(zip(unicas[faltan], nuevos.to_dict('records')))
+            self.guardar(tipo, por_llave, version)
+            conocidos.update(por_llave)
+
+        resultados = [conocidos[llave] for llave in unicas]
+        return pd.DataFrame({
+            col: np.array([r[col] for r in resultados], dtype=TIPOS_RESULTADO.get(col, object))[codigos]
+            for col in resultados[0]
+        }, index=df.index)
+
+
+_CACHE = {}
+
+
+def cache_por_defecto():
+    """Caché en RUTA_CACHE, abierto una vez por proceso; None si está desactivado o no se puede abrir."""
+    if RUTA_CACHE not in _CACHE:
+        try:
+            _CACHE[RUTA_CACHE] = CacheClasificacion(RUTA_CACHE) if RUTA_CACHE else None
+        except (OSError, sqlite3.Error):
+            _CACHE[RUTA_CACHE] = None
+    return _CACHE[RUTA_CACHE]
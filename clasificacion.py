@@ -0,0 +1,446 @@
+"""
+Funciones de clasificación por posición ocupacional - GEIH
+Tablas de reglas evaluadas por columna
+"""
+
+import operator
+import string
+from functools import reduce
+
+import pandas as pd
+import numpy as np
+
+from diccionarios import TIPO_REVISION_GOB, VALOR_DIRECTIVO_G_P6370S3, diccionarios_vigentes
+from normalizacion import texto_busqueda
+from rendimiento import contar
+
+# Subir al cambiar la lógica de las reglas (invalida el caché de clasificaciones)
+VERSION_REGLAS = 3
+
+
+# =============================================================================
+# CLASIFICACIÓN VECTORIZADA (por columna)
+# =============================================================================
+
+def _texto_columna(df, columna, mayusculas=True):
+    """Equivalente por columna de str(valor).upper(), con '' para los nulos."""
+    if columna not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    serie = df[columna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se convierte cada categoría una vez; el código -1 (nulo) cae en el '' final
+        categorias = serie.cat.categories.astype(str)
+        if mayusculas:
+            categorias = categorias.str.upper()
+        texto = np.append(categorias.to_numpy(dtype=object), '')[serie.cat.codes.to_numpy()]
+        return pd.Series(texto, index=df.index, dtype=object)
+    texto = serie.astype(str)
+    if mayusculas:
+        texto = texto.str.upper()
+    return texto.where(serie.notna(), '').astype(object)
+
+
+def _mapear_columna(df, columna, valores, defecto=0):
+    """
+    Equivalente por columna de valores.get(str(valor), defecto), con '' para los
+    nulos. En columnas categóricas se busca una vez por categoría.
+    """
+    serie = df[columna] if columna in df.columns else None
+    if serie is not None and isinstance(serie.dtype, pd.CategoricalDtype):
+        por_categoria = [valores.get(str(c), defecto) for c in serie.cat.categories] + [valores.get('', defecto)]
+        return np.array(por_categoria)[serie.cat.codes.to_numpy()]
+    return _texto_columna(df, columna, mayusculas=False).map(valores).fillna(defecto).to_numpy()
+
+
+def _entero_columna(df, columna):
+    """Equivalente por columna de int(valor); NaN si es nulo o no convertible."""
+    if columna not in df.columns:
+        return np.full(len(df), np.nan)
+
+    def convertir(valor):
+        try:
+            return int(valor) if pd.notna(valor) else np.nan
+        except Exception:
+            return np.nan
+
+    # La conversión se hace una vez por valor único
+    codigos, unicos = pd.factorize(df[columna])
+    convertidos = np.array([convertir(v) for v in unicos], dtype=float)
+    return np.where(codigos >= 0, convertidos[codigos] if len(unicos) else np.nan, np.nan)
+
+
+def _busqueda_columna(df, columna):
+    """Equivalente por columna de texto_busqueda(str(valor)); se normaliza una vez por valor distinto."""
+    codigos, unicos = pd.factorize(_texto_columna(df, columna, mayusculas=False))
+    normalizados = np.array([texto_busqueda(valor) for valor in unicos] + [texto_busqueda('')], dtype=object)
+    return pd.Series(normalizados[codigos], index=df.index, dtype=object)
+
+
+def _columna_normalizada(df, columna, forma):
+    """
+    Columna normalizada como la leen las reglas: forma 'texto', 'mayusculas',
+    'minusculas' (sin espacios a los lados), 'busqueda' (ver normalizacion.py)
+    o 'entero' (arreglo con NaN).
+    """
+    if forma == 'entero':
+        return _entero_columna(df, columna)
+    if forma == 'busqueda':
+        return _busqueda_columna(df, columna)
+    valores = _texto_columna(df, columna, mayusculas=forma == 'mayusculas')
+    if forma == 'minusculas':
+        valores = valores.str.strip().str.lower()
+    return valores
+
+
+# =============================================================================
+# TABLAS DE REGLAS
+# =============================================================================
+# Cada posición se describe con una tabla:
+#   'campos': {nombre: (columna o lista de columnas unidas con espacio, forma)};
+#             la forma es 'texto', 'mayusculas', 'minusculas', 'busqueda'
+#             (normalizado para buscar palabras de los diccionarios), 'entero'
+#             o un dict {texto: valor} (p. ej. el tipo de rama).
+#   'banderas': {nombre: condición} reutilizables en varias reglas.
+#   'reglas': lista en orden de prioridad de (condiciones, salida); gana la
+#             primera cuyas condiciones se cumplen todas. Sin condiciones
+#             aplica siempre (regla por defecto).
+# Una condición es el nombre de una bandera, (campo, operador, valor) o
+# ('alguna', [condiciones]). Operadores: 'contiene'/'no_contiene' (diccionario
+# de diccionarios.json), 'incluye' (texto literal), 'largo_mayor' (largo sin espacios a
+# los lados) y comparaciones ('==', '!=', '>', '>=', '<', '<=').
+# La observación puede citar campos de texto: '{campo:.50}'.
+
+ADM_PUBLICA = 'Administración pública y defensa, educación y atención de la salud'
+
+REGLAS_GOBIERNO = {
+    'campos': {
+        'rama': ('g_p6390s2', 'texto'),
+        'tipo_rama': ('g_p6390s2', TIPO_REVISION_GOB),
+        'empresa': ('p6380', 'busqueda'),
+        'oficio': ('p6370', 'busqueda'),
+        'cargo': ('g_p6370s3', 'minusculas'),
+        'p6400': ('p6400', 'entero'),
+    },
+    'banderas': {
+        'rama_prohibida': ('tipo_rama', '==', 1),
+        'empresa_mixta': ('alguna', [('tipo_rama', '==', 2), ('empresa', 'contiene', 'EMPRESAS_MIXTAS')]),
+        'directivo': ('alguna', [('cargo', 'incluye', VALOR_DIRECTIVO_G_P6370S3.lower()),
+                                 ('oficio', 'contiene', 'CARGOS_DIRECTIVOS_P6370')]),
+        'adm_publica': ('rama', '==', ADM_PUBLICA),
+    },
+    'salidas': ['tipo_revision', 'pos_corregida', 'rama_corregida', 'observacion'],
+    'reglas': [
+        ([('empresa', 'contiene', 'EMPRESAS_REGIMEN_PRIVADO')],
+         {'tipo_revision': 1, 'pos_corregida': 1,
+          'observacion': 'CAMBIAR → Pos 1: Empresa con régimen laboral privado (Ley 1118/2006)'}),
+        ([('empresa', 'contiene', 'ENTIDADES_PRIVADAS_NO_GOBIERNO')],
+         {'tipo_revision': 1, 'pos_corregida': 1, 'observacion': 'CAMBIAR → Pos 1: Entidad privada, no es gobierno'}),
+        (['rama_prohibida', ('empresa', 'contiene', 'PALABRAS_RAMA_8412')],
+         {'tipo_revision': 2, 'rama_corregida': '8412',
+          'observacion': 'CAMBIAR RAMA → 8412: Actividades ejecutivas administración pública'}),
+        (['rama_prohibida', ('empresa', 'contiene', 'PALABRAS_RAMA_8414')],
+         {'tipo_revision': 2, 'rama_corregida': '8414', 'observacion': 'CAMBIAR RAMA → 8414: Actividades reguladoras'}),
+        (['rama_prohibida', ('empresa', 'contiene', 'PALABRAS_RAMA_8413')],
+         {'tipo_revision': 2, 'rama_corregida': '8413',
+          'observacion': 'CAMBIAR RAMA → 8413: Programas bienestar/medio ambiente'}),
+        (['rama_prohibida'],
+         {'tipo_revision': 1, 'pos_corregida': 1, 'observacion': 'CAMBIAR → Pos 1: Rama prohibida para empleado gobierno'}),
+        (['empresa_mixta', 'directivo'],
+         {'tipo_revision': 4, 'observacion': 'REVISAR: Directivo en empresa mixta (verificar si es EICE)'}),
+        (['empresa_mixta'],
+         {'tipo_revision': 1, 'pos_corregida': 1, 'observacion': 'CAMBIAR → Pos 1: No directivo en empresa mixta'}),
+        (['adm_publica', ('empresa', 'contiene', 'PALABRAS_PRIVADAS_ADM_PUBLICA')],
+         {'tipo_revision': 1, 'pos_corregida': 1, 'observacion': 'CAMBIAR → Pos 1: Entidad privada en rama Adm. Pública'}),
+        (['adm_publica', ('alguna', [('oficio', 'contiene', 'PALABRAS_CONTRATISTA'),
+                                     ('empresa', 'contiene', 'PALABRAS_CONTRATISTA')])],
+         {'tipo_revision': 1, 'pos_corregida': 5, 'observacion': 'CAMBIAR → Pos 5: Contratista/Prestador de servicios'}),
+        (['adm_publica', ('p6400', '==', 2)],
+         {'tipo_revision': 4, 'observacion': 'REVISAR: Trabaja por intermediación (P6400=2)'}),
+        (['adm_publica'], {'tipo_revision': 0, 'observacion': 'OK'}),
+        ([], {'tipo_revision': 4, 'observacion': 'REVISAR: Verificar si la entidad es pública'}),
+    ],
+}
+
+REGLAS_PARTICULAR = {
+    'campos': {
+        'rama': ('g_p6390s2', 'mayusculas'),
+        'empresa': ('p6380', 'busqueda'),
+        'oficio': ('p6370', 'busqueda'),
+    },
+    'banderas': {
+        'agricultura': ('rama', 'incluye', 'AGRICULTURA'),
+    },
+    'salidas': ['tipo_revision', 'pos_corregida', 'observacion'],
+    'reglas': [
+        ([('empresa', 'contiene', 'UNIVERSIDADES_PUBLICAS')],
+         {'tipo_revision': 1, 'pos_corregida': 2, 'observacion': 'REVISAR → Pos 2: Universidad pública'}),
+        ([('empresa', 'contiene', 'ENTIDADES_GOBIERNO'), ('empresa', 'no_contiene', 'INDICADORES_PRIVADO_ENTIDAD')],
+         {'tipo_revision': 1, 'pos_corregida': 2, 'observacion': 'REVISAR → Pos 2: Posible entidad del gobierno'}),
+        ([('empresa', 'contiene', 'INSTITUCIONES_EDUCATIVAS_PUBLICAS'),
+          ('empresa', 'no_contiene', 'INDICADORES_IE_PRIVADA')],
+         {'tipo_revision': 1, 'pos_corregida': 2, 'observacion': 'REVISAR → Pos 2: Institución educativa pública'}),
+        ([('alguna', [('oficio', 'contiene', 'PALABRAS_DOMESTICO'), ('empresa', 'contiene', 'PALABRAS_DOMESTICO')])],
+         {'tipo_revision': 2, 'pos_corregida': 3, 'observacion': 'REVISAR → Pos 3: Posible empleado doméstico'}),
+        (['agricultura', ('oficio', 'contiene', 'PALABRAS_SUPERVISION')],
+         {'tipo_revision': 0, 'observacion': 'OK: Supervisión en agricultura'}),
+        (['agricultura', ('oficio', 'contiene', 'PALABRAS_PRODUCCION_DIRECTA')],
+         {'tipo_revision': 3, 'pos_corregida': 7, 'observacion': 'REVISAR → Pos 7: Posible jornalero (producción directa)'}),
+        ([], {'tipo_revision': 0, 'observacion': 'OK'}),
+    ],
+}
+
+REGLAS_FAMILIAR = {
+    'campos': {
+        'empresa': ('p6380', 'busqueda'),
+        'oficio_empresa': (['p6370', 'p6380'], 'busqueda'),
+        'p3069': ('p3069', 'entero'),
+    },
+    'banderas': {},
+    'salidas': ['tipo_revision', 'pos_corregida', 'observacion'],
+    'reglas': [
+        ([('p3069', '==', 1)],
+         {'tipo_revision': 1, 'observacion': 'DETALLAR: Trabaja solo (P3069=1) - No puede ser familiar'}),
+        ([('empresa', 'contiene', 'ENTIDADES_NO_FAMILIARES')],
+         {'tipo_revision': 2, 'observacion': 'DETALLAR: Entidad no familiar (iglesia, empresa formal, etc.)'}),
+        ([('oficio_empresa', 'contiene', 'CARGOS_DECISION')],
+         {'tipo_revision': 3, 'pos_corregida': 5, 'observacion': 'DETALLAR → Pos 5: Cargo decisión (dueño/socio/gerente)'}),
+        ([('empresa', 'contiene', 'INDICADORES_FAMILIAR')],
+         {'tipo_revision': 0, 'observacion': 'OK: Parece empresa familiar'}),
+        ([], {'tipo_revision': 4, 'observacion': 'REVISAR: Verificar si es empresa familiar'}),
+    ],
+}
+
+REGLAS_OTRO = {
+    'campos': {
+        'texto': (['p6370', 'p6430s1', 'p6380'], 'busqueda'),
+        'otro_cual': ('p6430s1', 'mayusculas'),
+        'p3069': ('p3069', 'entero'),
+    },
+    'banderas': {
+        'patron': ('texto', 'contiene', 'PALABRAS_PATRON'),
+    },
+    'salidas': ['tipo_revision', 'pos_corregida', 'observacion'],
+    'reglas': [
+        ([('texto', 'contiene', 'PALABRAS_CUENTA_PROPIA')],
+         {'tipo_revision': 1, 'pos_corregida': 5,
+          'observacion': 'CAMBIAR → Pos 5: Contratista/Independiente es cuenta propia'}),
+        (['patron', ('p3069', '>', 1)],
+         {'tipo_revision': 2, 'pos_corregida': 4, 'observacion': 'CAMBIAR → Pos 4: Socio/Dueño con empleados es patrón'}),
+        (['patron'],
+         {'tipo_revision': 1, 'pos_corregida': 5,
+          'observacion': 'CAMBIAR → Pos 5: Socio/Dueño sin empleados es cuenta propia'}),
+        ([('texto', 'contiene', 'PALABRAS_OTRO_VALIDO')],
+         {'tipo_revision': 0, 'observacion': 'OK: Caso válido de "Otro"'}),
+        ([('otro_cual', 'largo_mayor', 3)],
+         {'tipo_revision': 3, 'observacion': 'DETALLAR: Verificar descripción "{otro_cual:.50}"'}),
+        ([], {'tipo_revision': 3, 'observacion': 'DETALLAR: Sin descripción clara en P6430S1'}),
+    ],
+}
+
+
+# =============================================================================
+# MOTOR DE TABLAS DE REGLAS
+# =============================================================================
+
+_COMPARACIONES = {'==': operator.eq, '!=': operator.ne, '>': operator.gt,
+                  '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+_OPERADORES_TEXTO = {'contiene', 'no_contiene', 'incluye', 'largo_mayor'}
+
+# Valor de cada salida cuando ninguna regla aplica y tipo con que se entrega
+_SALIDA_DEFECTO = {'tipo_revision': 0, 'observacion': ''}
+_TIPOS_SALIDA = {'tipo_revision': 'int64', 'pos_corregida': float}
+
+
+class TablaReglas:
+    """
+    Tabla de reglas compilada: al crearse valida la tabla y resuelve las
+    banderas; al llamarla con un DataFrame evalúa cada condición distinta una
+    sola vez como máscara por columna y resuelve la prioridad con np.select.
+    entradas: columnas que lee y su forma (combinaciones únicas y caché).
+    Sin buscador, usa el de los diccionarios vigentes en cada llamada.
+    """
+
+    def __init__(self, tabla, buscador=None):
+        self.buscador = buscador
+        self.campos = dict(tabla['campos'])
+        self.salidas = list(tabla['salidas'])
+        banderas = tabla.get('banderas', {})
+        # Diccionarios que se buscan en cada campo: todos se revisan en una pasada (ver BuscadorPalabras.mascaras)
+        self.diccionarios_campo = {}
+        self.reglas = [tuple(self._compilar(c, banderas) for c in condiciones) for condiciones, _ in tabla['reglas']]
+
+        # Una fila por regla más la de "ninguna regla aplica"
+        filas = [salida for _, salida in tabla['reglas']] + [{}]
+        for salida in filas:
+            desconocidas = set(salida) - set(self.salidas)
+            if desconocidas:
+                raise ValueError(f"Salidas no declaradas: {sorted(desconocidas)}")
+        self._valores = {
+            nombre: np.array([salida.get(nombre, _SALIDA_DEFECTO.get(nombre)) for salida in filas],
+                             dtype=_TIPOS_SALIDA.get(nombre, object))
+            for nombre in self.salidas
+        }
+        # Observaciones que citan campos: {índice de la regla: (plantilla, campos citados)}
+        self._plantillas = {}
+        for i, salida in enumerate(filas):
+            citados = [campo for _, campo, _, _ in string.Formatter().parse(salida.get('observacion', '')) if campo]
+            for campo in citados:
+                self._campo(campo, texto=True)
+            if citados:
+                self._plantillas[i] = (salida['observacion'], list(dict.fromkeys(citados)))
+
+        self.entradas = []
+        for columnas, forma in self.campos.values():
+            forma = forma if isinstance(forma, str) else 'texto'
+            for columna in [columnas] if isinstance(columnas, str) else columnas:
+                if (columna, forma) not in self.entradas:
+                    self.entradas.append((columna, forma))
+
+    def _campo(self, nombre, texto):
+        if nombre not in self.campos:
+            raise ValueError(f"Campo desconocido en la tabla de reglas: {nombre!r}")
+        forma = self.campos[nombre][1]
+        if texto and (forma == 'entero' or isinstance(forma, dict)):
+            raise ValueError(f"El campo {nombre!r} no es de texto")
+
+    def _compilar(self, condicion, banderas):
+        """Condición en forma canónica (tupla, se puede usar de llave); las banderas se reemplazan."""
+        if isinstance(condicion, str):
+            if condicion not in banderas:
+                raise ValueError(f"Bandera desconocida en la tabla de reglas: {condicion!r}")
+            return self._compilar(banderas[condicion], banderas)
+        if condicion[0] == 'alguna':
+            return ('alguna', tuple(self._compilar(c, banderas) for c in condicion[1]))
+        campo, operador, valor = condicion
+        if operador in _OPERADORES_TEXTO:
+            self._campo(campo, texto=True)
+            nombres = (self.buscador or diccionarios_vigentes().buscador).patrones
+            if operador in ('contiene', 'no_contiene'):
+                if valor not in nombres:
+                    raise ValueError(f"Diccionario desconocido en la tabla de reglas: {valor!r}")
+                diccionarios = self.diccionarios_campo.setdefault(campo, [])
+                if valor not in diccionarios:
+                    diccionarios.append(valor)
+        elif operador in _COMPARACIONES:
+            self._campo(campo, texto=False)
+        else:
+            raise ValueError(f"Operador desconocido en la tabla de reglas: {operador!r}")
+        return (campo, operador, valor)
+
+    def __call__(self, df, diccionarios=None):
+        """
+        Retorna DataFrame con las salidas de la tabla, con el índice de df.
+        diccionarios: versión a usar (por defecto, la vigente al llamar).
+        """
+        buscador = self.buscador or (diccionarios or diccionarios_vigentes()).buscador
+        valores = {}
+        mascaras = {}
+        encontrados = {}
+
+        def valor(campo):
+            if campo not in valores:
+                columnas, forma = self.campos[campo]
+                if isinstance(forma, dict):
+                    valores[campo] = _mapear_columna(df, columnas, forma)
+                elif isinstance(columnas, str):
+                    valores[campo] = _columna_normalizada(df, columnas, forma)
+                else:
+                    partes = [_columna_normalizada(df, c, forma) for c in columnas]
+                    valores[campo] = reduce(lambda a, b: a + ' ' + b, partes)
+            return valores[campo]
+
+        def mascara(condicion):
+            if condicion not in mascaras:
+                if condicion[0] == 'alguna':
+                    resultado = np.zeros(len(df), dtype=bool)
+                    for c in condicion[1]:
+                        resultado |= mascara(c)
+                else:
+                    campo, operador, dato = condicion
+                    serie = valor(campo)
+                    if operador in ('contiene', 'no_contiene') and campo not in encontrados:
+                        encontrados[campo] = buscador.mascaras(serie, self.diccionarios_campo[campo])
+                    if operador == 'contiene':
+                        resultado = encontrados[campo][dato]
+                    elif operador == 'no_contiene':
+                        resultado = ~encontrados[campo][dato]
+                    elif operador == 'incluye':
+                        resultado = serie.str.contains(dato, regex=False).to_numpy(dtype=bool)
+                    elif operador == 'largo_mayor':
+                        resultado = (serie.str.strip().str.len() > dato).to_numpy(dtype=bool)
+                    else:
+                        resultado = np.asarray(_COMPARACIONES[operador](serie, dato), dtype=bool)
+                mascaras[condicion] = resultado
+            return mascaras[condicion]
+
+        condiciones = []
+        for regla in self.reglas:
+            cumple = np.ones(len(df), dtype=bool)
+            for condicion in regla:
+                cumple = cumple & mascara(condicion)
+            condiciones.append(cumple)
+        regla = np.select(condiciones, np.arange(len(self.reglas)), default=len(self.reglas))
+
+        resultado = pd.DataFrame({nombre: valores_salida[regla] for nombre, valores_salida in self._valores.items()},
+                                 index=df.index)
+        for i, (plantilla, citados) in self._plantillas.items():
+            filas = np.flatnonzero(regla == i)
+            if len(filas) and 'observacion' in resultado:
+                textos = zip(*(np.asarray(valor(campo), dtype=object)[filas] for campo in citados))
+                observaciones = resultado['observacion'].to_numpy(dtype=object, copy=True)
+                observaciones[filas] = [plantilla.format(**dict(zip(citados, t))) for t in textos]
+                resultado['observacion'] = observaciones
+        return resultado
+
+
+# Clasificadores por columna de cada posición
+CLASIFICADOR_GOBIERNO = TablaReglas(REGLAS_GOBIERNO)
+CLASIFICADOR_PARTICULAR = TablaReglas(REGLAS_PARTICULAR)
+CLASIFICADOR_FAMILIAR = TablaReglas(REGLAS_FAMILIAR)
+CLASIFICADOR_OTRO = TablaReglas(REGLAS_OTRO)
+
+
+# =============================================================================
+# CLASIFICACIÓN POR COMBINACIONES ÚNICAS
+# =============================================================================
+
+def llaves_entradas(df, entradas):
+    """
+    Llave de texto por registro con las entradas del clasificador normalizadas
+    como él las lee. entradas: lista de (columna, forma) con forma 'texto',
+    'mayusculas', 'minusculas', 'busqueda' o 'entero'.
+    """
+    llave = None
+    for columna, forma in entradas:
+        valores = _columna_normalizada(df, columna, forma)
+        if forma == 'entero':
+            valores = pd.Series(np.where(np.isnan(valores), '', valores.astype(str)), index=df.index)
+        else:
+            valores = valores.astype(str)
+        llave = valores if llave is None else llave + '\x1f' + valores
+    return llave
+
+
+def combinaciones_unicas(df, entradas):
+    """
+    Factoriza las entradas del clasificador.
+    Retorna (codigos por registro, llaves únicas, posición del primer registro de cada llave).
+    """
+    codigos, unicas = pd.factorize(llaves_entradas(df, entradas))
+    primeros = np.unique(codigos, return_index=True)[1]
+    return codigos, unicas, primeros
+
+
+def clasificar_por_combinaciones(df, clasificador, entradas):
+    """
+    Aplica clasificador(df) una vez por combinación única de entradas (sobre el
+    primer registro de cada una) y reparte el resultado a todos los registros.
+    """
+    if len(df) == 0:
+        return clasificador(df)
+    codigos, _, primeros = combinaciones_unicas(df, entradas)
+    contar('combinaciones', len(primeros))
+    contar('evaluadas', len(primeros))
+    resultado = clasificador(df.iloc[primeros]).take(codigos)
+    resultado.index = df.index
+    return resultado
@@ -0,0 +1,325 @@
+"""
+Diccionarios de validación para la Revisión de Ocupados - GEIH
+Ramas de actividad y palabras clave que usan las reglas de cada posición ocupacional
+(las palabras clave se cargan de diccionarios.json y se recargan al editarlo)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+from buscador import BuscadorPalabras
+from normalizacion import normalizar_palabras, normalizar_texto
+
+# =============================================================================
+# RAMAS DE ACTIVIDAD
+# =============================================================================
+ORDEN_RAMAS = [
+    'No informa',
+    'Agricultura, ganadería, caza, silvicultura y pesca',
+    'Explotación de Minas y Canteras',
+    'Comercio y reparación de vehículos',
+    'Alojamiento y servicios de comida',
+    'Industria manufacturera',
+    'Suministro de agua y gestión de desechos',
+    'Construcción',
+    'Transporte y almacenamiento',
+    'Información y comunicaciones',
+    'Actividades financieras y de seguros',
+    'Actividades Inmobiliarias',
+    'Actividades profesionales, científicas, técnicas y servicios administrativos',
+    'Administración pública y defensa, educación y atención de la salud',
+    'Actividades artísticas, entretenimiento, recreación y otras actividades de servicios'
+]
+
+# =============================================================================
+# DICCIONARIOS EMPLEADOS DEL GOBIERNO (P6430=2)
+# =============================================================================
+
+# Ramas donde NO debe haber empleados del gobierno
+RAMAS_PROHIBIDAS_GOBIERNO = [
+    'No informa',
+    'Agricultura, ganadería, caza, silvicultura y pesca',
+    'Explotación de Minas y Canteras',
+    'Comercio y reparación de vehículos',
+    'Construcción',
+    'Alojamiento y servicios de comida'
+]
+
+# Ramas donde operan empresas mixtas/industriales del Estado
+RAMAS_EMPRESAS_MIXTAS = [
+    'Industria manufacturera',
+    'Suministro de agua y gestión de desechos',
+    'Transporte y almacenamiento',
+    'Información y comunicaciones',
+    'Actividades financieras y de seguros'
+]
+
+# Tipo de revisión por rama para gobierno
+TIPO_REVISION_GOB = {
+    'No informa': 1,
+    'Agricultura, ganadería, caza, silvicultura y pesca': 1,
+    'Explotación de Minas y Canteras': 2,
+    'Comercio y reparación de vehículos': 1,
+    'Construcción': 2,
+    'Alojamiento y servicios de comida': 1,
+    'Industria manufacturera': 2,
+    'Suministro de agua y gestión de desechos': 2,
+    'Transporte y almacenamiento': 2,
+    'Información y comunicaciones': 2,
+    'Actividades financieras y de seguros': 2,
+    'Actividades Inmobiliarias': 1,
+    'Actividades profesionales, científicas, técnicas y servicios administrativos': 2,
+    'Administración pública y defensa, educación y atención de la salud': 0,
+    'Actividades artísticas, entretenimiento, recreación y otras actividades de servicios': 2
+}
+
+VALOR_DIRECTIVO_G_P6370S3 = 'Directores y gerentes'
+
+
+# =============================================================================
+# PALABRAS CLAVE (diccionarios.json)
+# =============================================================================
+# Las listas de palabras están en un JSON versionado que se edita sin tocar el
+# código. `python diccionarios.py` lo compila en un índice (en RUTA_INDICES,
+# fuera de la carpeta del código) con los patrones del buscador ya
+# construidos; al cargar, el índice se usa si corresponde exactamente al JSON
+# y a las tablas de ramas de este módulo, y si no se reconstruye. Si el índice
+# no se puede escribir, los diccionarios se usan igual, compilados en memoria.
+
+RUTA_DICCIONARIOS = os.environ.get(
+    'REV_OCUPADOS_DICCIONARIOS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diccionarios.json'),
+)
+# Carpeta de los índices precompilados; REV_OCUPADOS_INDICES='' no usa índice
+RUTA_INDICES = os.environ.get(
+    'REV_OCUPADOS_INDICES',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rev_ocupados_geih', 'indices'),
+)
+# Segundos entre revisiones del archivo para detectar una versión nueva
+INTERVALO_REVISION = 2
+# Subir si cambia el contenido del índice
+FORMATO_INDICE = 3
+
+
+def leer_diccionarios(ruta=RUTA_DICCIONARIOS):
+    """
+    Lee y valida el JSON de diccionarios.
+    Retorna (versión, {nombre: lista de palabras}); ValueError si el formato no es válido.
+    """
+    with open(ruta, encoding='utf-8') as f:
+        contenido = json.load(f)
+    entradas = contenido.get('diccionarios') if isinstance(contenido, dict) else None
+    if not isinstance(entradas, dict) or not entradas:
+        raise ValueError(f"{ruta}: falta el objeto 'diccionarios'")
+    palabras = {}
+    for nombre, entrada in entradas.items():
+        # Las palabras van en una lista o repartidas en grupos con nombre
+        if isinstance(entrada, dict) and isinstance(entrada.get('grupos'), dict):
+            lista = [p for grupo in entrada['grupos'].values() for p in grupo]
+        else:
+            lista = entrada.get('palabras') if isinstance(entrada, dict) else None
+        # Una lista vacía o una palabra vacía (o solo puntuación) coincidirían con cualquier texto
+        if (not isinstance(lista, list) or not lista
+                or not all(isinstance(p, str) and normalizar_texto(p) for p in lista)):
+            raise ValueError(f"{ruta}: el diccionario {nombre} debe tener una lista de palabras no vacías")
+        palabras[nombre] = lista
+    return str(contenido.get('version', '')), palabras
+
+
+def _huella_tablas():
+    """Huella de las ramas y valores de referencia de este módulo."""
+    contenido = {nombre: valor for nombre, valor in globals().items()
+                 if nombre.isupper() and not nombre.startswith(('_', 'RUTA_')) and isinstance(valor, (list, dict, str))}
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class Diccionarios:
+    """
+    Una versión cargada de los diccionarios: versión del JSON, palabras tal
+    como están en el JSON, buscador compilado con las palabras normalizadas
+    (ver normalizacion.py) y huella (cambia sola al editar cualquier palabra,
+    rama o valor de referencia). No se modifica: una recarga crea otra.
+    """
+
+    def __init__(self, version, palabras, patrones=None):
+        self.version = version
+        self.palabras = palabras
+        texto = json.dumps([_huella_tablas(), palabras], ensure_ascii=False)
+        self.huella = hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+        self.buscador = BuscadorPalabras({nombre: normalizar_palabras(lista) for nombre, lista in palabras.items()},
+                                         patrones)
+
+
+def ruta_indice(ruta=RUTA_DICCIONARIOS, carpeta=None):
+    """
+    Ruta del índice precompilado de un JSON de diccionarios en la carpeta de
+    índices (por defecto RUTA_INDICES); None si está desactivada. El nombre
+    lleva la huella de la ruta del JSON: dos JSON con el mismo nombre no
+    comparten índice.
+    """
+    carpeta = RUTA_INDICES if carpeta is None else carpeta
+    if not carpeta:
+        return None
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    llave = hashlib.sha256(os.path.abspath(ruta).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(carpeta, f'{nombre}-{llave}.idx')
+
+
+def _huella_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compilar_indice(ruta=RUTA_DICCIONARIOS, destino=None):
+    """
+    Compila el JSON y guarda su índice en destino (por defecto
+    ruta_indice(ruta)) con escritura atómica. Retorna los Diccionarios.
+    """
+    destino = destino or ruta_indice(ruta)
+    if not destino:
+        raise ValueError("no hay carpeta de índices (REV_OCUPADOS_INDICES está vacío)")
+    huella_archivo = _huella_archivo(ruta)
+    diccionarios = Diccionarios(*leer_diccionarios(ruta))
+    # Solo datos (textos de los patrones), para no depender de las clases al leerlo
+    indice = {
+        'formato': FORMATO_INDICE,
+        'archivo': huella_archivo,
+        'tablas': _huella_tablas(),
+        'version': diccionarios.version,
+        'palabras': diccionarios.palabras,
+        'patrones': {nombre: patron.pattern for nombre, patron in diccionarios.buscador.patrones.items()},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    temporal = f'{destino}.{os.getpid()}.tmp'
+    try:
+        with open(temporal, 'wb') as f:
+            pickle.dump(indice, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return diccionarios
+
+
+def cargar_diccionarios(ruta=RUTA_DICCIONARIOS):
+    """
+    Diccionarios del JSON. Usa el índice si corresponde a este contenido; si
+    no, compila el JSON e intenta dejar el índice al día.
+    """
+    destino = ruta_indice(ruta)
+    if destino is None:
+        return Diccionarios(*leer_diccionarios(ruta))
+    try:
+        with open(destino, 'rb') as f:
+            indice = pickle.load(f)
+        if (indice.get('formato') == FORMATO_INDICE and indice.get('archivo') == _huella_archivo(ruta)
+                and indice.get('tablas') == _huella_tablas()):
+            return Diccionarios(indice['version'], indice['palabras'], indice['patrones'])
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError):
+        pass
+    try:
+        return compilar_indice(ruta, destino)
+    except OSError:
+        # Carpeta de solo lectura, llena, etc.: se usa sin índice
+        return Diccionarios(*leer_diccionarios(ruta))
+
+
+def _firma(ruta):
+    """(fecha de modificación, tamaño) del archivo; None si no existe."""
+    try:
+        info = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+class FuenteDiccionarios:
+    """
+    Diccionarios vigentes de un JSON, con recarga en caliente.
+    actuales() revisa el archivo a lo sumo cada `intervalo` segundos; si
+    cambió, carga la versión nueva completa y la deja vigente de una vez
+    (quien ya tenía la anterior la sigue usando hasta terminar). Si la versión
+    nueva no se puede cargar se mantiene la anterior y el motivo queda en error.
+    """
+
+    def __init__(self, ruta=RUTA_DICCIONARIOS, intervalo=INTERVALO_REVISION):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.error = None
+        self._candado = threading.Lock()
+        self._firma = _firma(ruta)
+        self._revisado = time.monotonic()
+        self.vigentes = cargar_diccionarios(ruta)
+
+    def actuales(self):
+        """Diccionarios vigentes (revisa antes si pasó el intervalo)."""
+        if time.monotonic() - self._revisado >= self.intervalo:
+            self.revisar()
+        return self.vigentes
+
+    def revisar(self):
+        """Carga el archivo si cambió desde la última revisión; retorna True si cambió la versión vigente."""
+        with self._candado:
+            self._revisado = time.monotonic()
+            firma = _firma(self.ruta)
+            if firma == self._firma:
+                return False
+            self._firma = firma
+            try:
+                nuevos = cargar_diccionarios(self.ruta)
+                # Las reglas buscan los diccionarios por nombre
+                faltan = set(self.vigentes.palabras) - set(nuevos.palabras)
+                if faltan:
+                    raise ValueError(f"faltan diccionarios que usan las reglas: {', '.join(sorted(faltan))}")
+            except (OSError, ValueError) as e:
+                self.error = f"No se cargó la versión nueva de los diccionarios: {e}"
+                return False
+            self.error = None
+            cambio = nuevos.huella != self.vigentes.huella
+            self.vigentes = nuevos
+            return cambio
+
+
+_FUENTE = {}
+
+
+def fuente_por_defecto():
+    """Fuente de RUTA_DICCIONARIOS, creada una vez por proceso."""
+    if RUTA_DICCIONARIOS not in _FUENTE:
+        _FUENTE[RUTA_DICCIONARIOS] = FuenteDiccionarios(RUTA_DICCIONARIOS)
+    return _FUENTE[RUTA_DICCIONARIOS]
+
+
+def diccionarios_vigentes():
+    """Diccionarios vigentes; quien clasifica un lote lo toma una vez y usa esa versión hasta terminar."""
+    return fuente_por_defecto().actuales()
+
+
+# =============================================================================
+# PASO DE CONSTRUCCIÓN
+# =============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compila el JSON de diccionarios en el índice que cargan la aplicación y procesar_lote.')
+    parser.add_argument('json', nargs='?', default=RUTA_DICCIONARIOS, help='JSON de diccionarios')
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    try:
+        diccionarios = compilar_indice(args.json)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Error: {e}\n")
+    print(f"Versión {diccionarios.version} ({diccionarios.huella}): {len(diccionarios.palabras)} diccionarios, "
+          f"{sum(len(p) for p in diccionarios.palabras.values()):,} palabras")
+    print(f"  → {ruta_indice(args.json)} en {time.perf_counter() - inicio:.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Escritores de libros Excel para los archivos de revisión - GEIH
+
+Los libros se escriben fila por fila, en orden, con dos motores intercambiables:
+- xlsxwriter en modo constant_memory (por defecto): cada fila se vuelca a disco
+  al pasar a la siguiente, es el más rápido y su memoria no crece con la hoja.
+- openpyxl en modo write_only.
+
+Los estilos se describen con dicts independientes del motor:
+{'negrita': bool, 'cursiva': bool, 'tamano': int, 'relleno': 'RRGGBB', 'borde_total': bool}
+
+Los colores que dependen de los datos (semáforo) no se asignan celda por
+celda: formato_condicional agrega reglas de formato condicional sobre un
+rango completo, que ocupan lo mismo en el archivo sin importar las filas.
+"""
+
+from datetime import datetime
+from itertools import zip_longest
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Font, PatternFill, Border, Side
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+MOTORES_EXCEL = ['xlsxwriter', 'openpyxl']
+MOTOR_EXCEL = 'xlsxwriter' if xlsxwriter is not None else 'openpyxl'
+
+# Filas que se convierten a valores de Python a la vez al escribir una tabla
+FILAS_POR_TANDA = 10_000
+
+
+def filas_tabla(df):
+    """Itera las filas de un DataFrame con valores nativos de Python (nulos como None)."""
+    for inicio in range(0, len(df), FILAS_POR_TANDA):
+        tanda = df.iloc[inicio:inicio + FILAS_POR_TANDA].astype(object)
+        yield from tanda.where(tanda.notna(), None).itertuples(index=False, name=None)
+
+
+def _clave_estilo(estilo):
+    return tuple(sorted(estilo.items()))
+
+
+class EscritorOpenpyxl:
+    """Libro openpyxl en modo write_only."""
+
+    def __init__(self, destino):
+        self.destino = destino
+        self.wb = Workbook(write_only=True)
+        self._estilos = {}
+
+    def agregar_hoja(self, nombre, anchos=None):
+        """Crea una hoja; anchos: {letra de columna: ancho}."""
+        hoja = self.wb.create_sheet(nombre)
+        for col, ancho in (anchos or {}).items():
+            hoja.column_dimensions[col].width = ancho
+        return hoja
+
+    def _estilo(self, estilo):
+        clave = _clave_estilo(estilo)
+        if clave not in self._estilos:
+            partes = {}
+            if estilo.get('negrita') or estilo.get('cursiva') or estilo.get('tamano'):
+                partes['font'] = Font(bold=estilo.get('negrita', False),
+                                      italic=estilo.get('cursiva', False),
+                                      size=estilo.get('tamano'))
+            if estilo.get('relleno'):
+                partes['fill'] = PatternFill('solid', fgColor=estilo['relleno'])
+            if estilo.get('borde_total'):
+                partes['border'] = Border(top=Side(style='thin'), bottom=Side(style='double'))
+            self._estilos[clave] = partes
+        return self._estilos[clave]
+
+    def escribir_fila(self, hoja, valores, estilos=None):
+        """Agrega una fila; estilos: lista paralela a valores (dict o None por celda)."""
+        if not estilos:
+            hoja.append(valores)
+            return
+        fila = []
+        for valor, estilo in zip_longest(valores, estilos):
+            if estilo:
+                celda = WriteOnlyCell(hoja, value=valor)
+                for atributo, objeto in self._estilo(estilo).items():
+                    setattr(celda, atributo, objeto)
+                fila.append(celda)
+            else:
+                fila.append(valor)
+        hoja.append(fila)
+
+    def formato_condicional(self, hoja, rango, reglas):
+        """
+        Reglas de formato condicional sobre rango ('A6:E20'); reglas: lista de
+        (fórmula de Excel sin '=', estilo). Gana la primera regla que se cumple.
+        """
+        for formula, estilo in reglas:
+            relleno = estilo.get('relleno')
+            hoja.conditional_formatting.add(rango, FormulaRule(
+                formula=[formula],
+                font=Font(bold=True) if estilo.get('negrita') else None,
+                fill=PatternFill('solid', start_color=relleno, end_color=relleno) if relleno else None,
+                stopIfTrue=True,
+            ))
+
+    def cerrar(self):
+        self.wb.save(self.destino)
+
+
+class EscritorXlsxwriter:
+    """Libro xlsxwriter en modo constant_memory."""
+
+    def __init__(self, destino):
+        self.wb = xlsxwriter.Workbook(destino, {
+            'constant_memory': True,
+            'in_memory': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'nan_inf_to_errors': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        })
+        self._estilos = {}
+        self._estilos_condicionales = {}
+        self._filas = {}
+
+    def agregar_hoja(self, nombre, anchos=None):
+        """Crea una hoja; anchos: {letra de columna: ancho}."""
+        hoja = self.wb.add_worksheet(nombre)
+        for col, ancho in (anchos or {}).items():
+            hoja.set_column(f'{col}:{col}', ancho)
+        self._filas[nombre] = 0
+        return hoja
+
+    def _estilo(self, estilo):
+        clave = _clave_estilo(estilo)
+        if clave not in self._estilos:
+            propiedades = {}
+            if estilo.get('negrita'):
+                propiedades['bold'] = True
+            if estilo.get('cursiva'):
+                propiedades['italic'] = True
+            if estilo.get('tamano'):
+                propiedades['font_size'] = estilo['tamano']
+            if estilo.get('relleno'):
+                propiedades.update(pattern=1, bg_color=f"#{estilo['relleno']}")
+            if estilo.get('borde_total'):
+                propiedades.update(top=1, bottom=6)
+            self._estilos[clave] = self.wb.add_format(propiedades)
+        return self._estilos[clave]
+
+    def escribir_fila(self, hoja, valores, estilos=None):
+        """Agrega una fila; estilos: lista paralela a valores (dict o None por celda)."""
+        fila = self._filas[hoja.name]
+        self._filas[hoja.name] = fila + 1
+        if not estilos:
+            hoja.write_row(fila, 0, valores)
+            return
+        for col, (valor, estilo) in enumerate(zip_longest(valores, estilos)):
+            formato = self._estilo(estilo) if estilo else None
+            if isinstance(valor, datetime) and valor.tzinfo is not None:
+                valor = valor.replace(tzinfo=None)
+            hoja.write(fila, col, valor, formato)
+
+    def formato_condicional(self, hoja, rango, reglas):
+        """
+        Reglas de formato condicional sobre rango ('A6:E20'); reglas: lista de
+        (fórmula de Excel sin '=', estilo). Gana la primera regla que se cumple.
+        """
+        for formula, estilo in reglas:
+            clave = _clave_estilo(estilo)
+            if clave not in self._estilos_condicionales:
+                propiedades = {}
+                if estilo.get('negrita'):
+                    propiedades['bold'] = True
+                if estilo.get('relleno'):
+                    propiedades.update(pattern=1, bg_color=f"#{estilo['relleno']}")
+                self._estilos_condicionales[clave] = self.wb.add_format(propiedades)
+            hoja.conditional_format(rango, {
+                'type': 'formula',
+                'criteria': f'={formula}',
+                'format': self._estilos_condicionales[clave],
+                'stop_if_true': True,
+            })
+
+    def cerrar(self):
+        self.wb.close()
+
+
+def crear_escritor(destino, motor=None):
+    """Escritor del motor indicado (por defecto MOTOR_EXCEL) sobre un archivo o BytesIO."""
+    motor = motor or MOTOR_EXCEL
+    if motor == 'xlsxwriter':
+        if xlsxwriter is None:
+            raise ImportError("El motor 'xlsxwriter' requiere instalar el paquete xlsxwriter")
+        return EscritorXlsxwriter(destino)
+    if motor == 'openpyxl':
+        return EscritorOpenpyxl(destino)
+    raise ValueError(f"Motor de Excel desconocido: {motor}")
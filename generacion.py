@@ -0,0 +1,880 @@
+"""
+Generación de los archivos de revisión por posición ocupacional - GEIH
+Resúmenes por rama, estructura de cada libro y escritura en Excel/Parquet
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from io import BytesIO
+from openpyxl.utils import get_column_letter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+import itertools
+import multiprocessing
+import os
+import pickle
+import tempfile
+import warnings
+
+from diccionarios import ORDEN_RAMAS, diccionarios_vigentes
+from clasificacion import (
+    clasificar_por_combinaciones,
+    CLASIFICADOR_GOBIERNO,
+    CLASIFICADOR_PARTICULAR,
+    CLASIFICADOR_FAMILIAR,
+    CLASIFICADOR_OTRO,
+)
+from lectura import TAMANO_BLOQUE, leer_en_bloques
+from escritura import crear_escritor, filas_tabla
+from cache_clasificacion import cache_por_defecto
+from almacen_salidas import tamano_salida
+from rendimiento import etapa, contar, medir_iterable, ejecutar_registrando, incorporar
+
+# =============================================================================
+# ESTILOS (colores del semáforo, RRGGBB)
+# =============================================================================
+ROJO = 'FF6B6B'
+AMARILLO = 'FFE066'
+VERDE = '8FD14F'
+AZUL = '87CEEB'
+
+
+# =============================================================================
+# RESÚMENES POR RAMA
+# =============================================================================
+
+# Columnas de conteo por rama con que se arman las hojas Resumen e Inconsistencias
+COLUMNAS_CONTEO = ['casos', 'revision', 'tipo_1', 'tipo_2', 'tipo_3', 'tipo_4', 'con_pos', 'con_rama']
+
+# Cada registro se resume en un estado: tipo_revision (0 a 4) y tres indicadores
+# (casos, con_pos, con_rama) en un entero de 0 a 39. _CONTEO_POR_ESTADO dice a
+# qué columnas de conteo suma cada estado.
+_N_ESTADOS = 5 * 8
+_ESTADOS = np.arange(_N_ESTADOS)
+_CONTEO_POR_ESTADO = np.column_stack([
+    _ESTADOS & 1,
+    _ESTADOS // 8 > 0,
+    _ESTADOS // 8 == 1,
+    _ESTADOS // 8 == 2,
+    _ESTADOS // 8 == 3,
+    _ESTADOS // 8 == 4,
+    (_ESTADOS >> 1) & 1,
+    (_ESTADOS >> 2) & 1,
+]).astype('int64')
+
+
+def contar_por_rama(df):
+    """
+    Conteos por rama (g_p6390s2) necesarios para las hojas Resumen e Inconsistencias.
+    Se calculan en una sola pasada: un np.bincount sobre (código de rama, estado)
+    da el histograma completo y de ahí salen todas las columnas. Las ramas quedan
+    en el orden de ORDEN_RAMAS, luego las que no están en la lista y al final los
+    nulos. Los conteos de varios bloques se acumulan sumándolos (ver acumular_conteos).
+    """
+    rama = df['g_p6390s2']
+    if isinstance(rama.dtype, pd.CategoricalDtype):
+        codigos, ramas = rama.cat.codes.to_numpy(dtype='int64'), rama.cat.categories
+    else:
+        codigos, ramas = pd.factorize(rama)
+    con_rama = df['rama_corregida'].notna().to_numpy() if 'rama_corregida' in df.columns else 0
+    estado = (df['directorio'].notna().to_numpy()
+              | df['pos_corregida'].notna().to_numpy() << 1
+              | con_rama << 2
+              | df['tipo_revision'].to_numpy(dtype='int64') * 8)
+
+    # Fila 0 del histograma: rama nula (código -1)
+    histograma = np.bincount((codigos + 1) * _N_ESTADOS + estado,
+                             minlength=(len(ramas) + 1) * _N_ESTADOS).reshape(-1, _N_ESTADOS)
+    conteos = pd.DataFrame(histograma @ _CONTEO_POR_ESTADO, columns=COLUMNAS_CONTEO,
+                           index=pd.Index([np.nan] + list(ramas), name='rama'))
+    conteos = conteos[histograma.sum(axis=1) > 0]
+
+    orden = {rama: i for i, rama in enumerate(ORDEN_RAMAS)}
+    claves = [(orden.get(rama, len(orden)), str(rama)) if pd.notna(rama) else (len(orden) + 1, '')
+              for rama in conteos.index]
+    return conteos.iloc[sorted(range(len(claves)), key=claves.__getitem__)]
+
+
+def acumular_conteos(acumulado, conteos):
+    """Suma los conteos de un bloque a los ya acumulados."""
+    if acumulado is None:
+        return conteos
+    return pd.concat([acumulado, conteos]).groupby(level=0, dropna=False).sum()
+
+
+def _tabla_por_rama(conteos, columnas):
+    """Suma columnas de conteo por rama. columnas: {nombre en el Excel: [columnas de conteo]}"""
+    conteos = conteos[conteos.index.notna()]
+    return pd.DataFrame({nombre: conteos[cols].sum(axis=1) for nombre, cols in columnas.items()},
+                        index=conteos.index).astype(int)
+
+
+def _agregar_total(tabla, col_rama):
+    """Agrega la fila TOTAL al final de la tabla."""
+    total = {col_rama: 'TOTAL'}
+    total.update({col: tabla[col].sum() for col in tabla.columns if col != col_rama})
+    return pd.concat([tabla, pd.DataFrame([total])], ignore_index=True)
+
+
+def armar_resumen(conteos, columnas):
+    """Hoja Resumen: todas las ramas en el orden de ORDEN_RAMAS más la fila TOTAL."""
+    resumen = _tabla_por_rama(conteos, columnas).reindex(ORDEN_RAMAS, fill_value=0)
+    resumen = resumen.rename_axis('RAMA DE ACTIVIDAD ECONÓMICA').reset_index()
+    return _agregar_total(resumen, 'RAMA DE ACTIVIDAD ECONÓMICA')
+
+
+def armar_inconsistencias(conteos, columnas):
+    """Hoja Inconsistencias: solo ramas con casos a revisar, más la fila TOTAL."""
+    if conteos['revision'].sum() == 0:
+        return None
+    cuadro_inc = _tabla_por_rama(conteos, columnas)
+    cuadro_inc['TOTAL'] = cuadro_inc.sum(axis=1)
+    # Orden alfabético por rama, como en los cuadros originales
+    cuadro_inc = cuadro_inc[cuadro_inc['TOTAL'] > 0].sort_index()
+    cuadro_inc = cuadro_inc.rename_axis('RAMA').reset_index()
+    return _agregar_total(cuadro_inc, 'RAMA')
+
+
+# =============================================================================
+# ESPECIFICACIÓN DE LOS ARCHIVOS POR POSICIÓN
+# =============================================================================
+
+POSICIONES = {
+    'gobierno': {
+        'archivo': 'rev_empleados_gobierno',
+        'p6430': 2,
+        # Tabla de reglas compilada (clasificacion.py)
+        'clasificar': CLASIFICADOR_GOBIERNO,
+        # Columnas que lee el clasificador y cómo las normaliza (combinaciones únicas y caché)
+        'entradas': CLASIFICADOR_GOBIERNO.entradas,
+        'resumen': {'Casos': ['casos'], 'Cambiar_Pos': ['con_pos'],
+                    'Cambiar_Rama': ['con_rama'], 'Revisar': ['tipo_4']},
+        'inconsistencias': {'Cambiar_Pos': ['con_pos'], 'Cambiar_Rama': ['con_rama'],
+                            'Revisar': ['tipo_4']},
+        'titulo': 'DISTRIBUCIÓN DE EMPLEADOS DEL GOBIERNO (P6430=2) POR RAMA DE ACTIVIDAD',
+        'nota': 'NOTA: Cambiar_Pos = Cambio de posición ocupacional | Cambiar_Rama = Cambio de rama de actividad',
+        'semaforo_negrita': True,
+        'leyenda': [('🔴 ROJO = Casos a cambiar', ROJO), ('🟡 AMARILLO = Cambio rama', AMARILLO),
+                    ('🔵 AZUL = Revisar', AZUL), ('🟢 VERDE = OK', VERDE)],
+        # Primer grupo de columnas con casos > 0 define el color; si ninguno, VERDE
+        'colores': [(['Cambiar_Pos'], ROJO), (['Cambiar_Rama'], AMARILLO), (['Revisar'], AZUL)],
+        'columnas_color': 5,
+        'formato_total': True,
+        'anchos': {'A': 70, 'B': 15, 'C': 15, 'D': 15, 'E': 15},
+        'titulo_inconsistencias': 'RESUMEN DE CASOS A REVISAR',
+        'ancho_inconsistencias': 70,
+        'cols_revision': ['directorio', 'secuencia_p', 'orden', 'municipio',
+                          'p6370', 'p6380', 'g_p6390s2', 'p6400',
+                          'tipo_revision', 'pos_corregida', 'rama_corregida', 'observacion'],
+    },
+    'particular': {
+        'archivo': 'rev_emp_particular',
+        'p6430': 1,
+        'clasificar': CLASIFICADOR_PARTICULAR,
+        'entradas': CLASIFICADOR_PARTICULAR.entradas,
+        'resumen': {'Casos': ['casos'], 'Revisar_Gobierno': ['tipo_1'],
+                    'Revisar_Domestico': ['tipo_2'], 'Revisar_Jornalero': ['tipo_3']},
+        'inconsistencias': None,
+        'titulo': 'DISTRIBUCIÓN DE EMPLEADOS PARTICULARES (P6430=1) POR RAMA DE ACTIVIDAD',
+        'nota': 'Detecta posibles cambios a: Gobierno (Pos 2), Doméstico (Pos 3), Jornalero (Pos 7)',
+        'semaforo_negrita': False,
+        'leyenda': [('🟡 AMARILLO = Casos a revisar', AMARILLO), ('🟢 VERDE = OK', VERDE)],
+        'colores': [(['Revisar_Gobierno', 'Revisar_Domestico', 'Revisar_Jornalero'], AMARILLO)],
+        'columnas_color': 5,
+        'formato_total': False,
+        'anchos': {'A': 70},
+        'cols_revision': ['directorio', 'secuencia_p', 'orden', 'municipio',
+                          'p6370', 'p6380', 'g_p6390s2', 'p6400',
+                          'tipo_revision', 'pos_corregida', 'observacion'],
+    },
+    'familiar': {
+        'archivo': 'rev_trabajador_familiar',
+        'p6430': 6,
+        'clasificar': CLASIFICADOR_FAMILIAR,
+        'entradas': CLASIFICADOR_FAMILIAR.entradas,
+        'resumen': {'Casos': ['casos'], 'Detallar': ['tipo_1', 'tipo_2', 'tipo_3'],
+                    'Revisar': ['tipo_4']},
+        'inconsistencias': {'TRABAJA_SOLO': ['tipo_1'], 'ENTIDAD_NO_FAMILIAR': ['tipo_2'],
+                            'CARGO_DECISION': ['tipo_3'], 'REVISAR': ['tipo_4']},
+        'titulo': 'DISTRIBUCIÓN DE TRABAJADORES FAMILIARES SIN REMUNERACIÓN (P6430=6) POR RAMA',
+        'nota': 'NOTA: Los casos a DETALLAR deben devolverse a campo (flujo diferente al de asalariados)',
+        'semaforo_negrita': False,
+        'leyenda': [('🔴 ROJO = Casos a detallar', ROJO), ('🟡 AMARILLO = Casos a revisar', AMARILLO),
+                    ('🟢 VERDE = OK', VERDE)],
+        'colores': [(['Detallar'], ROJO), (['Revisar'], AMARILLO)],
+        'columnas_color': 4,
+        'formato_total': False,
+        'anchos': {'A': 70},
+        'titulo_inconsistencias': 'DISTRIBUCIÓN DE INCONSISTENCIAS POR RAMA Y TIPO',
+        'ancho_inconsistencias': 60,
+        'cols_revision': ['directorio', 'secuencia_p', 'orden', 'municipio',
+                          'p6370', 'p6380', 'p3069', 'g_p6390s2',
+                          'tipo_revision', 'pos_corregida', 'observacion'],
+    },
+    'otro': {
+        'archivo': 'rev_otro_cual',
+        'p6430': 8,
+        'clasificar': CLASIFICADOR_OTRO,
+        'entradas': CLASIFICADOR_OTRO.entradas,
+        'resumen': {'Casos': ['casos'], 'Cambiar': ['tipo_1', 'tipo_2'],
+                    'Detallar': ['tipo_3'], 'Revisar': ['tipo_4']},
+        'inconsistencias': {'CUENTA_PROPIA': ['tipo_1'], 'PATRON': ['tipo_2'],
+                            'DETALLAR': ['tipo_3'], 'REVISAR': ['tipo_4']},
+        'titulo': 'DISTRIBUCIÓN DE "OTRO, ¿CUÁL?" (P6430=8) POR RAMA DE ACTIVIDAD',
+        'nota': 'Cambiar = A cuenta propia (5) o patrón (4) | Detallar = Caso ambiguo | Revisar = Posiblemente válido',
+        'semaforo_negrita': False,
+        'leyenda': [('🔴 ROJO = Cambiar posición', ROJO), ('🟡 AMARILLO = Detallar', AMARILLO),
+                    ('🔵 AZUL = Revisar', AZUL), ('🟢 VERDE = OK', VERDE)],
+        'colores': [(['Cambiar'], ROJO), (['Detallar'], AMARILLO), (['Revisar'], AZUL)],
+        'columnas_color': 5,
+        'formato_total': False,
+        'anchos': {'A': 70},
+        'titulo_inconsistencias': 'DISTRIBUCIÓN DE INCONSISTENCIAS POR RAMA Y TIPO',
+        'ancho_inconsistencias': 60,
+        'cols_revision': ['directorio', 'secuencia_p', 'orden', 'municipio',
+                          'p6370', 'p6380', 'p6430s1', 'p3069', 'g_p6390s2',
+                          'tipo_revision', 'pos_corregida', 'observacion'],
+    },
+}
+
+
+# =============================================================================
+# SEMÁFORO (reglas de formato condicional)
+# =============================================================================
+# El semáforo no se pinta celda por celda: se escribe como reglas de formato
+# condicional sobre el rango de la tabla (ver escritura.py), así colorear una
+# hoja de casos de cualquier tamaño cuesta lo mismo. La primera regla que se
+# cumple define el color.
+
+def _referencias(columnas, fila):
+    """{columna: referencia de Excel a esa columna en la fila (columna fija, fila relativa)}."""
+    return {col: f'${get_column_letter(i)}{fila}' for i, col in enumerate(columnas, 1)}
+
+
+def _condicion_registro(conteo, refs):
+    """Condición de Excel sobre un registro de la hoja de casos equivalente a una columna de conteo."""
+    if conteo.startswith('tipo_'):
+        return f"{refs['tipo_revision']}={conteo[len('tipo_'):]}"
+    if conteo == 'revision':
+        return f"{refs['tipo_revision']}>0"
+    if conteo == 'con_pos':
+        return f'{refs["pos_corregida"]}<>""'
+    if conteo == 'con_rama':
+        return f'{refs["rama_corregida"]}<>""'
+    raise KeyError(conteo)
+
+
+def reglas_semaforo_resumen(spec, columnas, fila):
+    """
+    Reglas del semáforo del Resumen desde su primera fila de datos: un grupo de
+    spec['colores'] se cumple si sus columnas suman más de 0; si ninguno, VERDE.
+    """
+    refs = _referencias(columnas, fila)
+    reglas = [(f"({'+'.join(refs[col] for col in grupo)})>0", {'relleno': color})
+              for grupo, color in spec['colores']]
+    return reglas + [('TRUE', {'relleno': VERDE})]
+
+
+def reglas_semaforo_casos(spec, columnas, fila):
+    """
+    Reglas del semáforo para resaltar registros en una hoja de casos, con el
+    mismo color que tendría su rama en el Resumen según tipo_revision,
+    pos_corregida y rama_corregida. Sin regla VERDE: la hoja solo tiene casos
+    a revisar. Se omiten las condiciones sobre columnas que la hoja no tiene.
+    """
+    refs = _referencias(columnas, fila)
+    reglas = []
+    for grupo, color in spec['colores']:
+        condiciones = []
+        for conteo in itertools.chain.from_iterable(spec['resumen'][col] for col in grupo):
+            try:
+                condiciones.append(_condicion_registro(conteo, refs))
+            except KeyError:
+                continue
+        if len(condiciones) == 1:
+            reglas.append((condiciones[0], {'relleno': color}))
+        elif condiciones:
+            reglas.append((f"OR({','.join(condiciones)})", {'relleno': color}))
+    return reglas
+
+
+# =============================================================================
+# FUNCIONES PARA GENERAR EXCEL
+# =============================================================================
+
+def _filas_encabezado_resumen(spec):
+    """Filas 1 a 3 del Resumen (título, nota y leyenda del semáforo): (valores, estilos)."""
+    leyenda = [texto for texto, _ in spec['leyenda']]
+    return [
+        ([spec['titulo']], [{'negrita': True, 'tamano': 14}]),
+        ([spec['nota']], [{'cursiva': True, 'tamano': 10}]),
+        (['SEMÁFORO:'] + leyenda,
+         [{'negrita': True} if spec['semaforo_negrita'] else None]
+         + [{'relleno': color} for _, color in spec['leyenda']]),
+    ]
+
+
+# Filas de datos por hoja: Excel admite 1.048.576 filas y una es el encabezado
+MAX_FILAS_HOJA = 1_048_575
+# Cómo repartir Casos_Completo en varias hojas, además del límite de filas
+PARTICIONES = ['departamento', 'municipio']
+# Máximo de hojas al repartir: con xlsxwriter (constant_memory) cada hoja tiene
+# un archivo temporal abierto hasta cerrar el libro, y los ~1.100 municipios de
+# una base nacional pasan el límite usual de archivos abiertos (ulimit -n 1024)
+MAX_HOJAS_PARTICION = 200
+
+
+def claves_particion(df, particion):
+    """
+    Hoja de cada registro al repartir por departamento o municipio: el código
+    DIVIPOLA de municipio con 5 dígitos, o sus 2 primeros para el departamento.
+    Los registros sin municipio van a 'sin_dato'.
+    """
+    codigo = pd.to_numeric(df['municipio'], errors='coerce')
+    ancho = 5
+    if particion == 'departamento':
+        codigo, ancho = codigo // 1000, 2
+    codigos, unicos = pd.factorize(codigo)
+    # El código -1 (nulo) toma el último nombre
+    nombres = np.array([f'{int(c):0{ancho}d}' for c in unicos] + ['sin_dato'], dtype=object)
+    return nombres[codigos]
+
+
+def hojas_particion(particion, municipios):
+    """
+    Claves de las hojas de la partición para estos códigos de municipio,
+    ordenadas por código DIVIPOLA y con 'sin_dato' al final.
+    """
+    claves = set(claves_particion(pd.DataFrame({'municipio': municipios}), particion))
+    return sorted(claves, key=lambda clave: (clave == 'sin_dato', len(clave), clave))
+
+
+def ajustar_particion(particion, municipios):
+    """
+    Partición que se puede usar con estos códigos de municipio: si la pedida
+    daría más de MAX_HOJAS_PARTICION hojas pasa a la anterior de PARTICIONES
+    (municipio → departamento → solo límite de filas), con un aviso.
+    municipios=None indica que la base no tiene la columna municipio: se
+    reparte solo por el límite de filas, también con un aviso.
+    """
+    if particion is not None and municipios is None:
+        warnings.warn(f"La base no tiene la columna municipio; Casos_Completo no se reparte por {particion}, "
+                      "solo por el límite de filas", stacklevel=2)
+        return None
+    while particion is not None:
+        n_hojas = len(hojas_particion(particion, municipios))
+        if n_hojas <= MAX_HOJAS_PARTICION:
+            return particion
+        indice = PARTICIONES.index(particion)
+        nueva = PARTICIONES[indice - 1] if indice > 0 else None
+        warnings.warn(f"Casos_Completo tendría {n_hojas:,} hojas por {particion} (máximo {MAX_HOJAS_PARTICION}); "
+                      f"se reparte {'por ' + nueva if nueva else 'solo por el límite de filas'}", stacklevel=2)
+        particion = nueva
+    return None
+
+
+class _HojasCasos:
+    """
+    Tabla de casos escrita en una o varias hojas a medida que llegan los
+    bloques. Con particion, cada departamento o municipio va en su hoja
+    ({nombre}_{código}); al llegar a MAX_FILAS_HOJA la tabla sigue en una hoja
+    nueva ({nombre}_2, {nombre}_3, ...). Cada hoja lleva el encabezado.
+    claves: hojas de la partición que se crean de entrada, en ese orden, para
+    que el libro no dependa del orden en que aparecen los registros (las
+    hojas que siguen por límite de filas quedan al final).
+    """
+
+    def __init__(self, escritor, nombre, columnas, particion=None, claves=()):
+        self.escritor = escritor
+        self.nombre = nombre
+        self.columnas = list(columnas)
+        self.particion = particion
+        # Todas las hojas como [hoja, filas escritas, número] y la hoja actual de cada clave
+        self.hojas = []
+        self._actual = {}
+        for clave in claves:
+            self._nueva_hoja(clave, 1)
+
+    def _nueva_hoja(self, clave, numero):
+        partes = [self.nombre] + ([clave] if clave is not None else []) + ([str(numero)] if numero > 1 else [])
+        hoja = self.escritor.agregar_hoja('_'.join(partes))
+        self.escritor.escribir_fila(hoja, self.columnas)
+        self._actual[clave] = [hoja, 0, numero]
+        self.hojas.append(self._actual[clave])
+
+    def _escribir(self, clave, df):
+        inicio = 0
+        while inicio < len(df):
+            if clave not in self._actual:
+                self._nueva_hoja(clave, 1)
+            elif self._actual[clave][1] >= MAX_FILAS_HOJA:
+                self._nueva_hoja(clave, self._actual[clave][2] + 1)
+            actual = self._actual[clave]
+            tramo = df.iloc[inicio:inicio + MAX_FILAS_HOJA - actual[1]]
+            for fila in filas_tabla(tramo):
+                self.escritor.escribir_fila(actual[0], fila)
+            actual[1] += len(tramo)
+            inicio += len(tramo)
+
+    def agregar(self, bloque):
+        """Escribe un bloque en la hoja que corresponde a cada registro."""
+        if self.particion is None:
+            self._escribir(None, bloque)
+            return
+        claves = claves_particion(bloque, self.particion)
+        for clave, posiciones in pd.Series(claves).groupby(claves, sort=False).indices.items():
+            self._escribir(clave, bloque.iloc[posiciones])
+
+    def cerrar(self):
+        """Sin registros queda una hoja con solo el encabezado. Retorna las filas escritas."""
+        if not self.hojas:
+            self._nueva_hoja(None, 1)
+        return sum(filas for _, filas, _ in self.hojas)
+
+
+def _escribir_tabla(escritor, hoja, columnas, bloques):
+    """Escribe encabezado y filas de una tabla a partir de un iterable de DataFrames. Retorna las filas escritas."""
+    escritor.escribir_fila(hoja, list(columnas))
+    n_filas = 0
+    for bloque in bloques:
+        for fila in filas_tabla(bloque):
+            escritor.escribir_fila(hoja, fila)
+        n_filas += len(bloque)
+    return n_filas
+
+
+def escribir_libro(spec, resumen, inconsistencias, bloques_revision, bloques_completo, motor=None,
+                   almacen=None, particion=None, municipios=None):
+    """
+    Escribe el libro de una posición (Resumen, Inconsistencias, Casos_Revision,
+    Casos_Completo) fila por fila con el motor indicado (ver escritura.py).
+    Las hojas de casos se reciben como iterables de DataFrames, así la memoria
+    no crece con la base.
+    Con almacen el libro se escribe en disco y se retorna su SalidaEnDisco (ver
+    almacen_salidas.py); sin él, se retorna un BytesIO.
+    Las hojas de casos pasan a varias hojas al llegar a MAX_FILAS_HOJA; con
+    particion ('departamento' o 'municipio') Casos_Completo va en una hoja por
+    cada uno, en orden de código DIVIPOLA (ver _HojasCasos). municipios: los
+    códigos de municipio de la base (None si no tiene la columna), con que la
+    partición se ajusta para no pasar de MAX_HOJAS_PARTICION hojas (ver
+    ajustar_particion).
+    """
+    particion = ajustar_particion(particion, municipios)
+    hojas = hojas_particion(particion, municipios) if particion is not None else []
+    argumentos = (spec, resumen, inconsistencias, bloques_revision, bloques_completo, motor, particion, hojas)
+    if almacen is not None:
+        salida = almacen.guardar('.xlsx', lambda ruta: _escribir_hojas(ruta, *argumentos))
+    else:
+        salida = BytesIO()
+        _escribir_hojas(salida, *argumentos)
+        salida.seek(0)
+    contar('bytes', tamano_salida(salida))
+    return salida
+
+
+def _escribir_hojas(destino, spec, resumen, inconsistencias, bloques_revision, bloques_completo, motor,
+                    particion, hojas_completo):
+    escritor = crear_escritor(destino, motor)
+
+    # HOJA 1: RESUMEN CON SEMÁFORO
+    ws = escritor.agregar_hoja('Resumen', spec['anchos'])
+    for valores, estilos in _filas_encabezado_resumen(spec):
+        escritor.escribir_fila(ws, valores, estilos)
+    escritor.escribir_fila(ws, [])
+    escritor.escribir_fila(ws, list(resumen.columns))
+
+    # Filas de ramas y, al final, TOTAL (ver _agregar_total)
+    fila_inicial = len(_filas_encabezado_resumen(spec)) + 3
+    n_ramas = 0
+    for rama, valores in zip(resumen['RAMA DE ACTIVIDAD ECONÓMICA'], filas_tabla(resumen)):
+        if rama != 'TOTAL':
+            escritor.escribir_fila(ws, valores)
+            n_ramas += 1
+        elif spec['formato_total']:
+            escritor.escribir_fila(ws, valores, [{'negrita': True, 'borde_total': True}] * 5)
+        else:
+            escritor.escribir_fila(ws, valores)
+    if n_ramas:
+        escritor.formato_condicional(
+            ws, f"A{fila_inicial}:{get_column_letter(spec['columnas_color'])}{fila_inicial + n_ramas - 1}",
+            reglas_semaforo_resumen(spec, resumen.columns, fila_inicial))
+
+    # HOJA 2: INCONSISTENCIAS (cuadro resumen)
+    if inconsistencias is not None:
+        ws2 = escritor.agregar_hoja('Inconsistencias', {'A': spec['ancho_inconsistencias']})
+        escritor.escribir_fila(ws2, [spec['titulo_inconsistencias']], [{'negrita': True, 'tamano': 12}])
+        escritor.escribir_fila(ws2, [])
+        _escribir_tabla(escritor, ws2, inconsistencias.columns, [inconsistencias])
+
+    # HOJA 3 Y 4: CASOS PARA REVISIÓN Y TODOS LOS CASOS (en varias hojas si pasan del límite de filas)
+    for nombre_hoja, bloques, particion_hoja, claves in [('Casos_Revision', bloques_revision, None, []),
+                                                         ('Casos_Completo', bloques_completo, particion, hojas_completo)]:
+        bloques = iter(bloques)
+        primero = next(bloques)
+        hojas = _HojasCasos(escritor, nombre_hoja, primero.columns, particion_hoja, claves)
+        for bloque in itertools.chain([primero], bloques):
+            hojas.agregar(bloque)
+        # Las filas de ambas hojas de casos se suman en el contador de la etapa
+        contar('filas', hojas.cerrar())
+        # Cada caso a revisar con el color del semáforo, en una regla por color para toda la hoja
+        reglas = reglas_semaforo_casos(spec, primero.columns, 2) if nombre_hoja == 'Casos_Revision' else []
+        for ws_casos, filas_hoja, _ in hojas.hojas:
+            if filas_hoja and reglas:
+                escritor.formato_condicional(
+                    ws_casos, f"A2:{get_column_letter(len(primero.columns))}{filas_hoja + 1}", reglas)
+
+    escritor.cerrar()
+
+
+def escribir_excel(spec, resumen, inconsistencias, df, motor=None, almacen=None, particion=None):
+    """
+    Escribe el libro de una posición a partir de la base clasificada completa.
+    Las hojas de casos se escriben por tandas de TAMANO_BLOQUE registros.
+    """
+    cols_disponibles = [c for c in spec['cols_revision'] if c in df.columns]
+    casos_rev = df.loc[df['tipo_revision'] > 0, cols_disponibles]
+    municipios = df['municipio'].unique() if 'municipio' in df.columns else None
+    return escribir_libro(spec, resumen, inconsistencias, _en_tandas(casos_rev), _en_tandas(df),
+                          motor, almacen, particion, municipios)
+
+
+def _en_tandas(df):
+    """Vistas de df de TAMANO_BLOQUE registros (al menos una, aunque df esté vacío)."""
+    yield df.iloc[:TAMANO_BLOQUE]
+    for inicio in range(TAMANO_BLOQUE, len(df), TAMANO_BLOQUE):
+        yield df.iloc[inicio:inicio + TAMANO_BLOQUE]
+
+
+def partir_por_posicion(df, tipos=None):
+    """
+    {tipo: registros de la posición} sin una copia por posición: la base se
+    ordena una vez por p6430 (orden estable, cada posición conserva el orden de
+    los registros) y cada posición es un tramo contiguo, que pandas entrega como
+    vista. Si la base ya viene ordenada no se copia nada. Las posiciones sin
+    registros quedan con un DataFrame vacío.
+    """
+    valores = df['p6430'].to_numpy(dtype='float64', na_value=np.nan)
+    if not (np.diff(valores) >= 0).all():
+        orden = np.argsort(valores, kind='stable')
+        df, valores = df.take(orden), valores[orden]
+    tramos = {}
+    for tipo in (POSICIONES if tipos is None else tipos):
+        p6430 = POSICIONES[tipo]['p6430']
+        tramos[tipo] = df.iloc[np.searchsorted(valores, p6430, 'left'):np.searchsorted(valores, p6430, 'right')]
+    return tramos
+
+
+def clasificar_posicion(tipo, df, usar_cache=True, diccionarios=None):
+    """
+    Retorna df con las columnas de clasificación de la posición. Las columnas de
+    df no se copian (copia superficial; con copy-on-write df no se modifica).
+    El clasificador se evalúa una vez por combinación única de entradas; con
+    usar_cache, solo para las que no están en el caché persistente
+    (ver cache_clasificacion.py). Todo el lote se clasifica con la misma
+    versión de los diccionarios (por defecto, la vigente al empezar).
+    """
+    spec = POSICIONES[tipo]
+    diccionarios = diccionarios or diccionarios_vigentes()
+    clasificador = partial(spec['clasificar'], diccionarios=diccionarios)
+    cache = cache_por_defecto() if usar_cache else None
+    with etapa('clasificación', tipo, len(df)):
+        if cache is None:
+            clasificaciones = clasificar_por_combinaciones(df, clasificador, spec['entradas'])
+        else:
+            clasificaciones = cache.clasificar(tipo, df, clasificador, spec['entradas'], diccionarios)
+    df = df.copy(deep=False)
+    for col in clasificaciones.columns:
+        df[col] = clasificaciones[col].to_numpy()
+    return df
+
+
+def resumir_posicion(tipo, conteos):
+    """Retorna (resumen, inconsistencias) de una posición a partir de sus conteos por rama."""
+    spec = POSICIONES[tipo]
+    resumen = armar_resumen(conteos, spec['resumen'])
+    inconsistencias = None
+    if spec['inconsistencias']:
+        inconsistencias = armar_inconsistencias(conteos, spec['inconsistencias'])
+    return resumen, inconsistencias
+
+
+def escribir_posicion(tipo, df, motor=None, almacen=None, particion=None):
+    """Resume y escribe el Excel de una posición ya clasificada (en disco si se da almacen)."""
+    with etapa('resumen', tipo, len(df)):
+        resumen, inconsistencias = resumir_posicion(tipo, contar_por_rama(df))
+    with etapa('escritura', tipo):
+        return escribir_excel(POSICIONES[tipo], resumen, inconsistencias, df, motor, almacen, particion)
+
+
+def generar_excel(tipo, df, motor=None):
+    """Clasifica, resume y escribe el Excel de una posición ocupacional."""
+    if len(df) == 0:
+        return None
+    return escribir_posicion(tipo, clasificar_posicion(tipo, df), motor)
+
+
+def generar_excel_gobierno(df_gob):
+    """Genera Excel para empleados del gobierno con estructura del notebook original."""
+    return generar_excel('gobierno', df_gob)
+
+
+def generar_excel_particular(df_part):
+    """Genera Excel para empleados particulares."""
+    return generar_excel('particular', df_part)
+
+
+def generar_excel_familiar(df_fam):
+    """Genera Excel para trabajadores familiares."""
+    return generar_excel('familiar', df_fam)
+
+
+def generar_excel_otro(df_otro):
+    """Genera Excel para 'Otro, ¿cuál?'."""
+    return generar_excel('otro', df_otro)
+
+
+def _tabla_para_parquet(df):
+    """Las columnas de texto con tipos mezclados (p. ej. 2 y 'x') se pasan a texto para Arrow."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
+    return df
+
+
+def escribir_parquet(spec, df, almacen=None):
+    """
+    Escribe las hojas Casos_Revision y Casos_Completo como Parquet.
+    Retorna {hoja: BytesIO}, o {hoja: SalidaEnDisco} si se da almacen.
+    """
+    cols_disponibles = [c for c in spec['cols_revision'] if c in df.columns]
+    salidas = {}
+    for hoja, tabla in [('Casos_Revision', df[df['tipo_revision'] > 0][cols_disponibles]),
+                        ('Casos_Completo', df)]:
+        tabla = _tabla_para_parquet(tabla)
+        if almacen is not None:
+            salidas[hoja] = almacen.guardar('.parquet', lambda ruta: tabla.to_parquet(ruta, index=False))
+            continue
+        output = BytesIO()
+        tabla.to_parquet(output, index=False)
+        output.seek(0)
+        salidas[hoja] = output
+    return salidas
+
+
+def escribir_parquet_posicion(tipo, df, almacen=None):
+    """Exporta en Parquet los casos de una posición ya clasificada."""
+    with etapa('parquet', tipo, len(df)) as medicion:
+        salidas = escribir_parquet(POSICIONES[tipo], df, almacen)
+        medicion['bytes'] = sum(tamano_salida(datos) for datos in salidas.values())
+    return salidas
+
+
+def generar_parquet(tipo, df):
+    """Clasifica una posición y exporta sus casos en Parquet; None si no hay casos."""
+    if len(df) == 0:
+        return None
+    return escribir_parquet_posicion(tipo, clasificar_posicion(tipo, df))
+
+
+# =============================================================================
+# PROCESAMIENTO POR BLOQUES (archivos muy grandes)
+# =============================================================================
+
+class AcumuladorPosicion:
+    """
+    Acumula, bloque a bloque, la clasificación de una posición ocupacional.
+    Guarda solo los conteos por rama; los casos clasificados se van a archivos
+    temporales y se leen de nuevo al escribir el Excel. Todos los bloques se
+    clasifican con la misma versión de los diccionarios.
+    """
+
+    def __init__(self, tipo, diccionarios=None):
+        self.tipo = tipo
+        self.spec = POSICIONES[tipo]
+        self.diccionarios = diccionarios or diccionarios_vigentes()
+        self.conteos = None
+        self.n_casos = 0
+        # Códigos de municipio vistos, para ajustar la partición de Casos_Completo
+        # (None si los bloques no traen la columna)
+        self.municipios = None
+        self.revision = tempfile.TemporaryFile()
+        self.completo = tempfile.TemporaryFile()
+
+    def agregar(self, bloque):
+        """Clasifica un bloque de la posición y acumula sus resultados."""
+        if len(bloque) == 0:
+            return
+        bloque = clasificar_posicion(self.tipo, bloque, diccionarios=self.diccionarios)
+        with etapa('resumen', self.tipo, len(bloque)):
+            self.conteos = acumular_conteos(self.conteos, contar_por_rama(bloque))
+        cols_disponibles = [c for c in self.spec['cols_revision'] if c in bloque.columns]
+        pickle.dump(bloque.loc[bloque['tipo_revision'] > 0, cols_disponibles], self.revision)
+        pickle.dump(bloque, self.completo)
+        if 'municipio' in bloque.columns:
+            if self.municipios is None:
+                self.municipios = set()
+            self.municipios.update(bloque['municipio'].unique())
+        self.n_casos += len(bloque)
+
+    @staticmethod
+    def _leer_bloques(archivo):
+        archivo.seek(0)
+        while True:
+            try:
+                yield pickle.load(archivo)
+            except EOFError:
+                return
+
+    def escribir(self, almacen=None, particion=None, motor=None):
+        """Genera el Excel de la posición; None si no hubo casos."""
+        if self.n_casos == 0:
+            return None
+        resumen, inconsistencias = resumir_posicion(self.tipo, self.conteos)
+        municipios = list(self.municipios) if self.municipios is not None else None
+        with etapa('escritura', self.tipo):
+            return escribir_libro(self.spec, resumen, inconsistencias,
+                                  self._leer_bloques(self.revision),
+                                  self._leer_bloques(self.completo),
+                                  motor, almacen, particion, municipios)
+
+    def escribir_parquet(self, almacen=None):
+        """
+        Exporta en Parquet Casos_Revision y Casos_Completo bloque a bloque;
+        None si no hubo casos. Retorna {hoja: BytesIO}, o {hoja: SalidaEnDisco}
+        si se da almacen.
+        """
+        if self.n_casos == 0:
+            return None
+        salidas = {}
+        with etapa('parquet', self.tipo, self.n_casos) as medicion:
+            for hoja, archivo in [('Casos_Revision', self.revision), ('Casos_Completo', self.completo)]:
+                def escribir(destino, archivo=archivo):
+                    _escribir_parquet_bloques(destino, lambda: self._leer_bloques(archivo))
+                if almacen is not None:
+                    salidas[hoja] = almacen.guardar('.parquet', escribir)
+                    continue
+                output = BytesIO()
+                escribir(output)
+                output.seek(0)
+                salidas[hoja] = output
+            medicion['bytes'] = sum(tamano_salida(datos) for datos in salidas.values())
+        return salidas
+
+    def cerrar(self):
+        self.revision.close()
+        self.completo.close()
+
+
+def _esquema_parquet(esquemas):
+    """
+    Esquema Arrow común a los esquemas de varios bloques: cada columna toma el
+    tipo que admite todos sus bloques (nulo → texto, entero → decimal) y pasa a
+    texto si sus tipos no son compatibles (un bloque con números y otro con texto).
+    """
+    campos = {}
+    for esquema in esquemas:
+        for campo in esquema:
+            campos.setdefault(campo.name, []).append(campo)
+    comunes = []
+    for nombre, variantes in campos.items():
+        try:
+            comunes.append(pa.unify_schemas([pa.schema([campo]) for campo in variantes],
+                                            promote_options='permissive').field(0))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            comunes.append(pa.field(nombre, pa.string()))
+    return pa.schema(comunes)
+
+
+def _escribir_parquet_bloques(destino, bloques):
+    """
+    Escribe en un Parquet los DataFrames de bloques() (se llama dos veces: una
+    para fijar el esquema común y otra para escribir), sin juntarlos en memoria.
+    """
+    esquema = _esquema_parquet(pa.Schema.from_pandas(_tabla_para_parquet(bloque), preserve_index=False)
+                               for bloque in bloques())
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for bloque in bloques():
+            tabla = pa.Table.from_pandas(_tabla_para_parquet(bloque), preserve_index=False)
+            escritor.write_table(tabla.cast(esquema))
+
+
+@contextmanager
+def acumular_por_bloques(archivo, nombre, tipos, tamano_bloque=TAMANO_BLOQUE, al_avanzar=None, diccionarios=None):
+    """
+    Lee la base por bloques y envía cada bloque según p6430 al acumulador de su
+    posición. Entrega {tipo: AcumuladorPosicion} con la base completa, para
+    escribir sus Excel o Parquet; sus archivos temporales se borran al salir.
+    al_avanzar(n_registros) se llama tras cada bloque. diccionarios: versión
+    con que se clasifica todo el archivo (por defecto, la vigente al empezar).
+    """
+    diccionarios = diccionarios or diccionarios_vigentes()
+    acumuladores = {tipo: AcumuladorPosicion(tipo, diccionarios) for tipo in tipos}
+    try:
+        n_registros = 0
+        for bloque in medir_iterable('lectura por bloques', leer_en_bloques(archivo, nombre, tamano_bloque)):
+            for tipo, bloque_tipo in partir_por_posicion(bloque, acumuladores).items():
+                acumuladores[tipo].agregar(bloque_tipo)
+            n_registros += len(bloque)
+            if al_avanzar:
+                al_avanzar(n_registros)
+        yield acumuladores
+    finally:
+        for acumulador in acumuladores.values():
+            acumulador.cerrar()
+
+
+def generar_excel_por_bloques(archivo, nombre, tipos, tamano_bloque=TAMANO_BLOQUE, al_avanzar=None,
+                              almacen=None, particion=None, diccionarios=None, motor=None):
+    """
+    Lee la base por bloques, envía cada bloque según p6430 al clasificador de su
+    posición y genera los Excel de las posiciones indicadas (ver
+    acumular_por_bloques).
+    Retorna dict {tipo: BytesIO (SalidaEnDisco si se da almacen) o None}.
+    """
+    with acumular_por_bloques(archivo, nombre, tipos, tamano_bloque, al_avanzar, diccionarios) as acumuladores:
+        return {tipo: acumulador.escribir(almacen, particion, motor) for tipo, acumulador in acumuladores.items()}
+
+
+# =============================================================================
+# GENERACIÓN EN PARALELO
+# =============================================================================
+
+def generar_en_paralelo(tareas, max_procesos=None, capturar_errores=False):
+    """
+    Ejecuta tareas de generación en un pool de procesos (la serialización del
+    Excel usa CPU y las posiciones no comparten estado).
+    tareas: lista de (clave, funcion, argumentos). Itera (clave, resultado) a
+    medida que cada tarea termina. Con capturar_errores, una tarea que falla
+    entrega su excepción como resultado en vez de detener las demás.
+    Con un solo proceso las tareas corren aquí mismo, sin pool.
+    Las mediciones de rendimiento de cada tarea se suman al registro activo.
+    """
+    if not tareas:
+        return
+    max_procesos = min(len(tareas), max_procesos or os.cpu_count() or 1)
+    if max_procesos == 1:
+        for clave, funcion, argumentos in tareas:
+            try:
+                resultado = funcion(*argumentos)
+            except Exception as e:
+                if not capturar_errores:
+                    raise
+                resultado = e
+            yield clave, resultado
+        return
+    # spawn: el proceso de Streamlit tiene hilos activos y no conviene hacer fork
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_procesos, mp_context=contexto) as pool:
+        futuros = {pool.submit(ejecutar_registrando, funcion, argumentos): clave
+                   for clave, funcion, argumentos in tareas}
+        for futuro in as_completed(futuros):
+            if capturar_errores and futuro.exception() is not None:
+                yield futuros[futuro], futuro.exception()
+                continue
+            resultado, mediciones = futuro.result()
+            incorporar(mediciones)
+            yield futuros[futuro], resultado
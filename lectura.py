@@ -0,0 +1,219 @@
+"""
+Lectura de la base de ocupados - GEIH
+Excel, CSV, Parquet y Feather/Arrow IPC, completa, proyectada o por bloques
+"""
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+from openpyxl import load_workbook
+
+from diccionarios import ORDEN_RAMAS
+from rendimiento import etapa, medir_iterable
+
+
+# =============================================================================
+# LECTURA DE LA BASE
+# =============================================================================
+
+FORMATOS_ENTRADA = ['xlsx', 'xls', 'csv', 'parquet', 'feather', 'arrow']
+TAMANO_BLOQUE = 50_000
+
+# Columnas que usan la clasificación y la hoja Casos_Revision
+COLUMNAS_LLAVE = ['directorio', 'secuencia_p', 'orden']
+COLUMNAS_CLASIFICACION = ['p6430', 'p6370', 'p6380', 'g_p6390s2', 'g_p6370s3',
+                          'p6400', 'p3069', 'p6430s1']
+COLUMNAS_REVISION = COLUMNAS_LLAVE + ['municipio'] + COLUMNAS_CLASIFICACION
+COLUMNAS_ENTERAS = ['p6430', 'p3069', 'p6400']
+
+
+def _extension(nombre):
+    return nombre.rsplit('.', 1)[-1].lower()
+
+
+def _columnas_presentes(archivo, extension, columnas):
+    """Filtra columnas a las que existen en un archivo Parquet o Feather/Arrow."""
+    if columnas is None:
+        return None
+    if extension == 'parquet':
+        nombres = pq.read_schema(archivo).names
+    else:
+        nombres = pa.ipc.open_file(archivo).schema.names
+    archivo.seek(0)
+    return [c for c in columnas if c in nombres]
+
+
+def leer_base(archivo, nombre, columnas=None):
+    """
+    Carga la base de ocupados según la extensión del archivo.
+    Con columnas solo se leen esas (las que no existan se ignoran); en Parquet y
+    Feather/Arrow IPC, que son columnares, el resto ni siquiera se lee del disco.
+    """
+    extension = _extension(nombre)
+    if extension == 'parquet':
+        return pd.read_parquet(archivo, columns=_columnas_presentes(archivo, extension, columnas))
+    if extension in ('feather', 'arrow'):
+        return pd.read_feather(archivo, columns=_columnas_presentes(archivo, extension, columnas))
+    usecols = None if columnas is None else (lambda c: c in columnas)
+    if extension == 'csv':
+        return pd.read_csv(archivo, usecols=usecols)
+    return pd.read_excel(archivo, usecols=usecols)
+
+
+def rama_categorica(serie):
+    """
+    Rama (g_p6390s2) como categórica con categorías fijas: ORDEN_RAMAS y después,
+    en orden alfabético, las ramas observadas que no están en la lista. Así el
+    código de cada rama de ORDEN_RAMAS es el mismo en cualquier base.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, observadas = serie.cat.codes.to_numpy(), serie.cat.categories
+    else:
+        codigos, observadas = pd.factorize(serie)
+    extras = sorted({rama for rama in observadas if rama not in ORDEN_RAMAS}, key=str)
+    categorias = pd.Index(ORDEN_RAMAS + extras)
+    # Código de cada rama observada en las categorías fijas (-1 = nulo)
+    nuevos = np.append(categorias.get_indexer(observadas), -1)[codigos]
+    return pd.Series(pd.Categorical.from_codes(nuevos, categories=categorias), index=serie.index, name=serie.name)
+
+
+def _tipos_compactos(df):
+    """Rama como categórica y códigos numéricos como enteros pequeños (nulos permitidos)."""
+    if 'g_p6390s2' in df.columns:
+        df['g_p6390s2'] = rama_categorica(df['g_p6390s2'])
+    for col in COLUMNAS_ENTERAS:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        valores = df[col].dropna()
+        if not (valores == valores.round()).all():
+            continue
+        for tipo in ['Int8', 'Int16', 'Int32']:
+            info = np.iinfo(tipo.lower())
+            if valores.empty or (valores.min() >= info.min and valores.max() <= info.max):
+                df[col] = df[col].astype(tipo)
+                break
+    return df
+
+
+def leer_base_proyectada(archivo, nombre):
+    """
+    Lectura rápida para la pantalla de resumen: solo las columnas de revisión,
+    con tipos compactos. La base completa se lee después con leer_base_posiciones.
+    """
+    with etapa('lectura resumen') as medicion:
+        df = _tipos_compactos(leer_base(archivo, nombre, COLUMNAS_REVISION))
+        medicion['filas'] = len(df)
+    return df
+
+
+def _filtrar_por_p6430(df, valores_p6430):
+    """
+    Registros de las posiciones indicadas ordenados por p6430 (orden estable),
+    con una sola copia que hace a la vez el filtro y el orden. Si df ya cumple,
+    se retorna sin copiar.
+    """
+    p6430 = df['p6430'].to_numpy(dtype='float64', na_value=np.nan)
+    incluidos = np.isin(p6430, valores_p6430)
+    if incluidos.all() and (np.diff(p6430) >= 0).all():
+        return df
+    filas = np.flatnonzero(incluidos)
+    return df.take(filas[np.argsort(p6430[filas], kind='stable')])
+
+
+def leer_base_posiciones(archivo, nombre, valores_p6430):
+    """
+    Lectura completa (todas las columnas) solo de los registros de las posiciones
+    indicadas, con tipos compactos y ordenados por p6430 (así partir_por_posicion
+    entrega cada posición como vista, sin copiarla). En Parquet el filtro se
+    aplica al leer; en CSV por bloques.
+    """
+    valores_p6430 = list(valores_p6430)
+    extension = _extension(nombre)
+    with etapa('lectura') as medicion:
+        if extension == 'parquet':
+            df = pd.read_parquet(archivo, filters=[('p6430', 'in', valores_p6430)])
+        elif extension == 'csv':
+            bloques = [b[b['p6430'].isin(valores_p6430)]
+                       for b in pd.read_csv(archivo, chunksize=TAMANO_BLOQUE)]
+            df = pd.concat(bloques)
+        else:
+            df = leer_base(archivo, nombre)
+        df = _tipos_compactos(_filtrar_por_p6430(df, valores_p6430))
+        medicion['filas'] = len(df)
+    return df
+
+
+def _bloque_como_read_excel(encabezado, filas):
+    """Arma el DataFrame de un bloque con la misma conversión de tipos que pd.read_excel."""
+    return TextParser([encabezado] + filas, header=0).read()
+
+
+def leer_en_bloques(archivo, nombre, tamano_bloque=TAMANO_BLOQUE, columnas=None):
+    """
+    Itera la base de ocupados en bloques de filas sin cargarla completa.
+    xlsx se lee con openpyxl en modo read_only, csv con chunksize, Parquet por
+    row groups y Feather/Arrow IPC por record batches. Los .xls (formato binario
+    antiguo) no admiten lectura parcial: se cargan y se parten.
+    Con columnas solo se leen esas columnas (las que no existan se ignoran).
+    """
+    extension = _extension(nombre)
+
+    if extension == 'csv':
+        usecols = None if columnas is None else (lambda c: c in columnas)
+        yield from pd.read_csv(archivo, chunksize=tamano_bloque, usecols=usecols)
+
+    elif extension == 'parquet':
+        columnas = _columnas_presentes(archivo, extension, columnas)
+        for lote in pq.ParquetFile(archivo).iter_batches(batch_size=tamano_bloque, columns=columnas):
+            yield lote.to_pandas()
+
+    elif extension in ('feather', 'arrow'):
+        columnas = _columnas_presentes(archivo, extension, columnas)
+        lector = pa.ipc.open_file(archivo)
+        for i in range(lector.num_record_batches):
+            lote = lector.get_batch(i)
+            if columnas is not None:
+                lote = lote.select(columnas)
+            for inicio in range(0, lote.num_rows, tamano_bloque):
+                yield lote.slice(inicio, tamano_bloque).to_pandas()
+
+    elif extension == 'xlsx':
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = wb.worksheets[0].iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            if encabezado is None:
+                return
+            indices = range(len(encabezado))
+            if columnas is not None:
+                indices = [i for i, c in enumerate(encabezado) if c in columnas]
+            encabezado = [encabezado[i] for i in indices]
+            bloque = []
+            for fila in filas:
+                if all(v is None for v in fila):
+                    continue
+                bloque.append([fila[i] if i < len(fila) else None for i in indices])
+                if len(bloque) == tamano_bloque:
+                    yield _bloque_como_read_excel(encabezado, bloque)
+                    bloque = []
+            if bloque:
+                yield _bloque_como_read_excel(encabezado, bloque)
+        finally:
+            wb.close()
+
+    else:
+        df = leer_base(archivo, nombre, columnas)
+        for inicio in range(0, len(df), tamano_bloque):
+            yield df.iloc[inicio:inicio + tamano_bloque]
+
+
+def contar_posiciones_por_bloques(archivo, nombre, tamano_bloque=TAMANO_BLOQUE):
+    """Cuenta registros por posición ocupacional (p6430) recorriendo la base por bloques."""
+    conteo = {}
+    bloques = leer_en_bloques(archivo, nombre, tamano_bloque, columnas=['p6430'])
+    for bloque in medir_iterable('lectura por bloques', bloques):
+        for valor, n in bloque['p6430'].value_counts().items():
+            conteo[valor] = conteo.get(valor, 0) + int(n)
+    return conteo
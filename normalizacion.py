@@ -0,0 +1,80 @@
+"""
+Normalización de textos para la búsqueda de palabras clave - GEIH
+
+Los textos de empresa, oficio y "otro, ¿cuál?" llegan con tildes o sin ellas,
+con puntuación y espacios variables y con la razón social escrita de varias
+formas ("S.A.S", "S. A. S.", "SAS"). Antes de buscar se llevan a una forma
+común: mayúsculas sin tildes, siglas sin puntos, puntuación como espacio y
+espacios colapsados. La Ñ se conserva: es otra letra, no una tilde
+('COMPAÑIA' no contiene 'ANI'). Las palabras de los diccionarios se
+normalizan igual, así que no hace falta escribir cada variante en las listas.
+
+Cada valor distinto se normaliza una sola vez (caché en memoria del proceso).
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# Siglas con puntos: S.A.S, S. A. S., I.E.D., E.S.P. La forma sin espacios va
+# primero para que 'I.E.D. S.A.S' quede como dos siglas y no como una
+_SIGLA = re.compile(r'\b[A-Z](?:\.[A-Z]\b)+\.?|\b[A-Z](?: ?\. ?[A-Z]\b)+\.?')
+# Razón social escrita con espacios entre letras
+_SIGLAS_ESPACIADAS = re.compile(r'\b(?:S A S|S A|E S P|E S E)\b')
+_NO_ALFANUMERICO = re.compile(r'[^\w\s]|_')
+_ESPACIOS = re.compile(r'\s+')
+
+# Valores distintos que se recuerdan por proceso
+MAX_TEXTOS_NORMALIZADOS = 500_000
+
+
+def _sin_marcas(caracter):
+    return ''.join(c for c in unicodedata.normalize('NFKD', caracter) if not unicodedata.combining(c))
+
+
+def plegar_acentos(texto):
+    """Quita tildes y diacríticos (descomposición NFKD) salvo en la Ñ: 'SECRETARÍA' → 'SECRETARIA'."""
+    if texto.isascii():
+        return texto
+    texto = unicodedata.normalize('NFC', texto)
+    return ''.join(c if c.isascii() or c in 'Ññ' else _sin_marcas(c) for c in texto)
+
+
+@lru_cache(maxsize=MAX_TEXTOS_NORMALIZADOS)
+def normalizar_texto(texto):
+    """Mayúsculas sin tildes, siglas sin puntos, puntuación como espacio y espacios colapsados."""
+    texto = plegar_acentos(texto.upper())
+    texto = _SIGLA.sub(lambda m: m.group(0).replace('.', '').replace(' ', ''), texto)
+    texto = _ESPACIOS.sub(' ', _NO_ALFANUMERICO.sub(' ', texto)).strip()
+    return _SIGLAS_ESPACIADAS.sub(lambda m: m.group(0).replace(' ', ''), texto)
+
+
+def texto_busqueda(texto):
+    """
+    Texto normalizado con un espacio a cada lado: las palabras de diccionario
+    con espacio en el borde (' SAS', 'CLINICA ') también coinciden al inicio o
+    al final del texto.
+    """
+    return f' {normalizar_texto(texto)} '
+
+
+def normalizar_palabra(palabra):
+    """
+    Palabra de diccionario normalizada como los textos. Conserva el espacio de
+    cada borde (límite de palabra). Si la palabra tiene puntuación en un borde
+    o es una sigla con puntos, queda como palabra completa en ambos lados
+    ('ICA-' → ' ICA ', 'S.A.' → ' SA '): sin ello 'ICA ' coincidiría con
+    'OLIMPICA ' y 'SA ' con 'EMPRESA '.
+    """
+    normal = normalizar_texto(palabra)
+    borde = palabra.strip(' ')
+    completa = (_SIGLA.search(plegar_acentos(palabra.upper())) is not None
+                or not borde[0].isalnum() or not borde[-1].isalnum())
+    inicio = ' ' if completa or palabra[0] == ' ' else ''
+    fin = ' ' if completa or palabra[-1] == ' ' else ''
+    return f'{inicio}{normal}{fin}'
+
+
+def normalizar_palabras(palabras):
+    """Lista de palabras normalizadas, sin las variantes que quedan repetidas."""
+    return list(dict.fromkeys(normalizar_palabra(p) for p in palabras if normalizar_texto(p)))
@@ -0,0 +1,215 @@
+"""
+Procesamiento por lotes de la Revisión de Ocupados - GEIH (sin Streamlit)
+
+Genera los archivos rev_*_{fecha}.xlsx de una o varias bases desde la línea
+de comandos. Cada base se procesa en un proceso aparte y al final se reporta
+el tiempo de cada etapa (lectura, clasificación, resumen y escritura por
+posición) con los registros por segundo.
+
+Uso:
+    python procesar_lote.py base_enero.xlsx base_febrero.parquet -o salidas
+    python procesar_lote.py base.csv --posiciones gobierno otro --parquet
+    python procesar_lote.py base_ronda2.xlsx --incremental --ronda geih_septiembre
+    python procesar_lote.py base_*.parquet -o salidas --zip /compartida/revision.zip
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from generacion import (
+    MAX_HOJAS_PARTICION,
+    PARTICIONES,
+    POSICIONES,
+    acumular_por_bloques,
+    clasificar_posicion,
+    escribir_posicion,
+    escribir_parquet_posicion,
+    generar_en_paralelo,
+    partir_por_posicion,
+)
+from escritura import MOTORES_EXCEL
+from almacen_salidas import PaqueteZip
+from diccionarios import diccionarios_vigentes
+from lectura import leer_base_posiciones
+from rendimiento import registrar
+from revision_incremental import ETIQUETAS_DELTA, RUTA_RONDAS, RondasRevision, nombre_ronda
+
+
+def _guardar(datos, ruta):
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(datos.getbuffer())
+
+
+def carpetas_por_base(rutas, salida):
+    """
+    Subcarpeta de salida de cada base (en el orden de rutas): el nombre sin
+    extensión; si dos bases lo comparten (base.csv y base.parquet) se agrega
+    la extensión, y si aún coinciden (misma base en otra carpeta), un número.
+    """
+    partes = [os.path.splitext(os.path.basename(ruta)) for ruta in rutas]
+    conteo = Counter(stem.lower() for stem, _ in partes)
+    carpetas = []
+    usados = set()
+    for stem, extension in partes:
+        nombre = f"{stem}_{extension.lstrip('.')}" if conteo[stem.lower()] > 1 and extension else stem
+        candidato, n = nombre, 1
+        while candidato.lower() in usados:
+            n += 1
+            candidato = f'{nombre}_{n}'
+        usados.add(candidato.lower())
+        carpetas.append(os.path.join(salida, candidato))
+    return carpetas
+
+
+def procesar_archivo(ruta, tipos, carpeta, fecha, motor=None, parquet=False, por_bloques=False, rondas=None,
+                     particion=None):
+    """
+    Genera los archivos de revisión de una base en la carpeta indicada.
+    Con rondas (RondasRevision) la clasificación es incremental frente a la
+    ronda anterior. Con particion, Casos_Completo va en una hoja por
+    departamento o municipio.
+    Retorna dict con registros por posición, archivos escritos, cambios frente
+    a la ronda anterior, versión de los diccionarios y la tabla de rendimiento
+    por etapa (ver rendimiento.py).
+    """
+    nombre = os.path.basename(ruta)
+    # Toda la base se clasifica con la misma versión de los diccionarios
+    diccionarios = diccionarios_vigentes()
+    informe = {'archivo': ruta, 'casos': {}, 'salidas': [], 'cambios': {},
+               'diccionarios': f'{diccionarios.version} ({diccionarios.huella})'}
+
+    with registrar() as rendimiento:
+        if por_bloques:
+            with open(ruta, 'rb') as archivo, \
+                    acumular_por_bloques(archivo, nombre, tipos, diccionarios=diccionarios) as acumuladores:
+                for tipo, acumulador in acumuladores.items():
+                    informe['casos'][tipo] = acumulador.n_casos
+                    excel = acumulador.escribir(particion=particion, motor=motor)
+                    if excel is None:
+                        continue
+                    salida = os.path.join(carpeta, f"{POSICIONES[tipo]['archivo']}_{fecha}.xlsx")
+                    _guardar(excel, salida)
+                    informe['salidas'].append(salida)
+                    if parquet:
+                        for hoja, datos in acumulador.escribir_parquet().items():
+                            salida = os.path.join(carpeta, f"{POSICIONES[tipo]['archivo']}_{fecha}_{hoja}.parquet")
+                            _guardar(datos, salida)
+                            informe['salidas'].append(salida)
+        else:
+            with open(ruta, 'rb') as archivo:
+                df = leer_base_posiciones(archivo, nombre, [POSICIONES[tipo]['p6430'] for tipo in tipos])
+
+            for tipo, df_tipo in partir_por_posicion(df, tipos).items():
+                informe['casos'][tipo] = len(df_tipo)
+                if len(df_tipo) == 0:
+                    continue
+
+                if rondas is not None:
+                    df_tipo, informe['cambios'][tipo] = rondas.clasificar(tipo, df_tipo, diccionarios, nombre)
+                else:
+                    df_tipo = clasificar_posicion(tipo, df_tipo, diccionarios=diccionarios)
+                salida = os.path.join(carpeta, f"{POSICIONES[tipo]['archivo']}_{fecha}.xlsx")
+                _guardar(escribir_posicion(tipo, df_tipo, motor, particion=particion), salida)
+                informe['salidas'].append(salida)
+                if parquet:
+                    for hoja, datos in escribir_parquet_posicion(tipo, df_tipo).items():
+                        salida = os.path.join(carpeta, f"{POSICIONES[tipo]['archivo']}_{fecha}_{hoja}.parquet")
+                        _guardar(datos, salida)
+                        informe['salidas'].append(salida)
+
+    informe['rendimiento'] = rendimiento.tabla()
+    return informe
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Genera los archivos de revisión de ocupados (GEIH) sin la interfaz web.')
+    parser.add_argument('archivos', nargs='+', help='Bases de ocupados (xlsx, xls, csv, parquet, feather)')
+    parser.add_argument('-o', '--salida', default='.',
+                        help='Carpeta de salida; con varias bases se crea una subcarpeta por base '
+                             '(con la extensión si dos bases tienen el mismo nombre)')
+    parser.add_argument('--posiciones', nargs='+', choices=list(POSICIONES), default=list(POSICIONES),
+                        help='Posiciones a generar (por defecto todas)')
+    parser.add_argument('--fecha', default=datetime.now().strftime('%Y%m%d'),
+                        help='Fecha de los nombres de archivo (AAAAMMDD, por defecto hoy)')
+    parser.add_argument('--procesos', type=int, default=None,
+                        help='Procesos en paralelo (por defecto uno por CPU)')
+    parser.add_argument('--motor', choices=MOTORES_EXCEL, default=None, help='Motor de escritura del Excel')
+    parser.add_argument('--parquet', action='store_true',
+                        help='Exportar también Casos_Revision y Casos_Completo en Parquet')
+    parser.add_argument('--por-bloques', action='store_true',
+                        help='Leer cada base por bloques (archivos muy grandes)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reclasificar solo los registros nuevos o modificados desde la ronda anterior')
+    parser.add_argument('--rondas', default=RUTA_RONDAS,
+                        help='Carpeta donde se guarda la última ronda (modo incremental)')
+    parser.add_argument('--ronda', default=None, metavar='NOMBRE',
+                        help='Nombre de la revisión con que se compara y se guarda esta ronda '
+                             '(por defecto el nombre del archivo, sin extensión)')
+    parser.add_argument('--partir-completo', choices=PARTICIONES, default=None,
+                        help='Casos_Completo en una hoja por departamento o municipio '
+                             '(siempre se continúa en otra hoja al llegar al límite de filas de Excel; '
+                             f'por municipio pasa a departamento si serían más de {MAX_HOJAS_PARTICION} hojas)')
+    parser.add_argument('--zip', default=None, metavar='RUTA',
+                        help='Escribir además un ZIP con todos los archivos generados (p. ej. en una carpeta compartida)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _argumentos(argv)
+    faltantes = [ruta for ruta in args.archivos if not os.path.isfile(ruta)]
+    if faltantes:
+        print(f"No se encontraron: {', '.join(faltantes)}", file=sys.stderr)
+        return 1
+    if args.incremental and (args.por_bloques or len(args.archivos) > 1):
+        print("El modo incremental procesa una base a la vez y sin --por-bloques", file=sys.stderr)
+        return 1
+    rondas = RondasRevision(args.ronda or nombre_ronda(args.archivos[0]), args.rondas) if args.incremental else None
+
+    tareas = []
+    carpetas = carpetas_por_base(args.archivos, args.salida) if len(args.archivos) > 1 else [args.salida]
+    for ruta, carpeta in zip(args.archivos, carpetas):
+        tareas.append((ruta, procesar_archivo,
+                       (ruta, args.posiciones, carpeta, args.fecha, args.motor, args.parquet, args.por_bloques,
+                        rondas, args.partir_completo)))
+
+    # Los archivos de cada base entran al ZIP apenas termina la base
+    paquete = PaqueteZip(ruta=args.zip) if args.zip else None
+
+    inicio = time.perf_counter()
+    errores = 0
+    for ruta, informe in generar_en_paralelo(tareas, args.procesos, capturar_errores=True):
+        if isinstance(informe, Exception):
+            errores += 1
+            print(f"✗ {ruta}: {informe}", file=sys.stderr)
+            continue
+        if paquete is not None:
+            for salida in informe['salidas']:
+                paquete.agregar(os.path.relpath(salida, args.salida), salida)
+        print(f"✓ {ruta} (diccionarios {informe['diccionarios']})")
+        for tipo, n in informe['casos'].items():
+            print(f"    {tipo:<12} {n:>10,} registros")
+        for tipo, delta in informe['cambios'].items():
+            print(f"    cambios {tipo} (ronda «{rondas.ronda}», anterior: {delta['anterior']}): "
+                  + ' | '.join(f"{ETIQUETAS_DELTA[k]} {v:,}" for k, v in delta.items() if k != 'anterior'))
+        for fila in informe['rendimiento'].itertuples():
+            etapa = f'{fila.etapa} {fila.posicion}'.strip()
+            velocidad = f'{fila.filas_por_segundo:14,.0f} reg/s' if fila.filas_por_segundo > 0 else ''
+            print(f"    {etapa:<30} {fila.segundos:8.2f} s {velocidad}")
+        for salida in informe['salidas']:
+            print(f"    → {salida}")
+    if paquete is not None and paquete.n_archivos:
+        print(f"ZIP con {paquete.n_archivos} archivos → {paquete.cerrar()}")
+    elif paquete is not None:
+        paquete.descartar()
+    print(f"Total: {len(tareas) - errores}/{len(tareas)} bases en {time.perf_counter() - inicio:.2f} s")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Medición de rendimiento por etapa - GEIH
+
+Las funciones de lectura, clasificación, resumen y escritura abren una etapa
+con `etapa(...)`. Si hay un registro activo (`registrar()`), cada etapa queda
+anotada con su duración, registros, bytes escritos y contadores; si no, no
+hace nada. Las tareas que corren en otros procesos devuelven sus mediciones y
+se suman al registro del proceso principal (ver ejecutar_registrando).
+"""
+
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+_REGISTRO = contextvars.ContextVar('registro_rendimiento', default=None)
+_ETAPA = contextvars.ContextVar('etapa_rendimiento', default=None)
+# Un perfil a la vez: desde Python 3.12 cProfile usa sys.monitoring, que admite
+# un solo perfilador activo por intérprete
+_PERFILANDO = threading.Lock()
+
+
+class Rendimiento:
+    """Lista de mediciones: dicts con etapa, posicion, segundos, filas, bytes y contadores."""
+
+    def __init__(self, mediciones=None):
+        self.mediciones = list(mediciones or [])
+
+    def tabla(self):
+        """Mediciones sumadas por etapa y posición, con registros por segundo."""
+        if not self.mediciones:
+            return pd.DataFrame(columns=['etapa', 'posicion', 'segundos', 'filas', 'filas_por_segundo', 'bytes'])
+        df = pd.DataFrame(self.mediciones)
+        df['posicion'] = df['posicion'].fillna('')
+        tabla = df.groupby(['etapa', 'posicion'], sort=False).sum(min_count=1).reset_index()
+        tabla['filas_por_segundo'] = (tabla['filas'] / tabla['segundos']).where(tabla['segundos'] > 0)
+        columnas = ['etapa', 'posicion', 'segundos', 'filas', 'filas_por_segundo', 'bytes']
+        return tabla[columnas + [c for c in tabla.columns if c not in columnas]]
+
+    @property
+    def segundos(self):
+        return sum(m['segundos'] for m in self.mediciones)
+
+
+@contextmanager
+def registrar():
+    """Activa un registro de rendimiento nuevo mientras dura el bloque."""
+    rendimiento = Rendimiento()
+    token = _REGISTRO.set(rendimiento)
+    try:
+        yield rendimiento
+    finally:
+        _REGISTRO.reset(token)
+
+
+@contextmanager
+def etapa(nombre, posicion=None, filas=None):
+    """
+    Mide una etapa. Entrega el dict de la medición para completar filas o bytes
+    al final (medicion['bytes'] = ...).
+    """
+    registro = _REGISTRO.get()
+    medicion = {'etapa': nombre, 'posicion': posicion, 'filas': filas, 'bytes': None}
+    if registro is None:
+        yield medicion
+        return
+    token = _ETAPA.set(medicion)
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    finally:
+        medicion['segundos'] = time.perf_counter() - inicio
+        _ETAPA.reset(token)
+        registro.mediciones.append(medicion)
+
+
+def contar(nombre, cantidad=1):
+    """Suma un contador (p. ej. combinaciones únicas, aciertos de caché) a la etapa abierta."""
+    medicion = _ETAPA.get()
+    if medicion is not None:
+        medicion[nombre] = (medicion.get(nombre) or 0) + cantidad
+
+
+def medir_iterable(nombre, iterable, posicion=None):
+    """Itera iterable y anota como una etapa el tiempo gastado en producir cada elemento."""
+    registro = _REGISTRO.get()
+    if registro is None:
+        yield from iterable
+        return
+    medicion = {'etapa': nombre, 'posicion': posicion, 'filas': 0, 'bytes': None, 'segundos': 0.0}
+    iterador = iter(iterable)
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                medicion['segundos'] += time.perf_counter() - inicio
+            medicion['filas'] += len(elemento)
+            yield elemento
+    finally:
+        registro.mediciones.append(medicion)
+
+
+def ejecutar_registrando(funcion, argumentos):
+    """Ejecuta funcion(*argumentos) con un registro propio. Retorna (resultado, mediciones)."""
+    with registrar() as rendimiento:
+        resultado = funcion(*argumentos)
+    return resultado, rendimiento.mediciones
+
+
+def incorporar(mediciones):
+    """Agrega mediciones hechas en otro proceso al registro activo."""
+    registro = _REGISTRO.get()
+    if registro is not None:
+        registro.mediciones.extend(mediciones)
+
+
+@contextmanager
+def perfilar(activo=True, lineas=30, al_esperar=None):
+    """
+    Perfila el bloque con cProfile. Entrega un dict que al terminar tiene
+    'texto' (funciones con más tiempo acumulado) y 'datos' (archivo .prof para
+    snakeviz o pstats). Si otro hilo está perfilando, espera a que termine
+    (llamando antes al_esperar(), si se da).
+    """
+    perfil = {}
+    if not activo:
+        yield perfil
+        return
+    if not _PERFILANDO.acquire(blocking=False):
+        if al_esperar:
+            al_esperar()
+        _PERFILANDO.acquire()
+    try:
+        perfilador = cProfile.Profile()
+        perfilador.enable()
+        try:
+            yield perfil
+        finally:
+            perfilador.disable()
+    finally:
+        _PERFILANDO.release()
+    texto = io.StringIO()
+    pstats.Stats(perfilador, stream=texto).sort_stats('cumulative').print_stats(lineas)
+    perfil['texto'] = texto.getvalue()
+    descriptor, ruta = tempfile.mkstemp(suffix='.prof')
+    os.close(descriptor)
+    try:
+        perfilador.dump_stats(ruta)
+        with open(ruta, 'rb') as f:
+            perfil['datos'] = f.read()
+    finally:
+        os.remove(ruta)
@@ -0,0 +1,247 @@
+"""
+Revisión incremental entre rondas - GEIH
+
+En cada ronda de validación se vuelve a subir casi la misma base, con
+correcciones en una parte de los registros. Aquí se guarda, por posición, el
+resultado de la última ronda para cada registro (directorio, secuencia_p,
+orden) junto con una huella de las entradas del clasificador. En la ronda
+siguiente solo se clasifican los registros nuevos o modificados y se reporta
+el cambio: casos resueltos, casos nuevos y casos que siguen pendientes.
+
+Las rondas se guardan por nombre (por defecto el del archivo de la base, ver
+nombre_ronda): otra base u otra persona con otro nombre de ronda no reemplaza
+la ronda anterior de esta revisión. Cada ronda guardada recuerda de qué
+archivo salió y cuándo, para mostrar contra qué se está comparando.
+
+Los resultados se reutilizan solo si la versión de reglas y diccionarios es la
+misma (ver version_cache en cache_clasificacion.py); si cambió, se reclasifica
+todo pero el reporte de cambios se sigue calculando, y los registros que solo
+se reclasificaron por la versión se cuentan aparte de los modificados.
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cache_clasificacion import TIPOS_RESULTADO, version_cache
+from clasificacion import llaves_entradas
+from diccionarios import diccionarios_vigentes
+from generacion import POSICIONES, clasificar_posicion
+from lectura import COLUMNAS_LLAVE
+from rendimiento import etapa
+
+# Carpeta con una subcarpeta por nombre de ronda y, dentro, un Parquet por
+# posición con los resultados de la última ronda
+RUTA_RONDAS = os.environ.get(
+    'REV_OCUPADOS_RONDAS',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rev_ocupados_geih', 'rondas'),
+)
+
+COLUMNAS_RESULTADO = ['tipo_revision', 'pos_corregida', 'rama_corregida', 'observacion']
+
+# Nombres para mostrar el reporte de cambios
+ETIQUETAS_DELTA = {
+    'anterior': 'Ronda anterior',
+    'registros': 'Registros',
+    'nuevos': 'Registros nuevos',
+    'modificados': 'Registros modificados',
+    'por_version': 'Reclasificados por cambio de reglas o diccionarios',
+    'reclasificados': 'Reclasificados',
+    'resueltos': 'Resueltos',
+    'nuevos_pendientes': 'Nuevos a revisar',
+    'siguen_pendientes': 'Siguen pendientes',
+    'ya_no_estan': 'Pendientes que ya no están en la base',
+}
+
+
+_ENTERO = re.compile(r'[+-]?\d+(?:\.0*)?')
+
+
+def _llave_texto(valor):
+    """
+    Valor de llave como texto normalizado: los números enteros sin decimales
+    ni ceros a la izquierda (123, 123.0 y '0123' → '123'), el resto como
+    texto sin espacios a los lados; None si es nulo o vacío.
+    """
+    if pd.isna(valor):
+        return None
+    if isinstance(valor, (int, float, np.integer, np.floating)) and float(valor).is_integer():
+        return str(int(valor))
+    texto = str(valor).strip()
+    if _ENTERO.fullmatch(texto):
+        return str(int(texto.split('.')[0]))
+    return texto or None
+
+
+def _llaves_registro(df):
+    """
+    MultiIndex (directorio, secuencia_p, orden) como texto normalizado (ver
+    _llave_texto), para cruzar rondas leídas de formatos distintos sin perder
+    las llaves que no son numéricas. Se normaliza una vez por valor distinto.
+    """
+    niveles = []
+    for col in COLUMNAS_LLAVE:
+        codigos, unicos = pd.factorize(df[col])
+        normalizados = np.array([_llave_texto(v) for v in unicos] + [None], dtype=object)
+        niveles.append(normalizados[codigos])
+    return pd.MultiIndex.from_arrays(niveles, names=COLUMNAS_LLAVE)
+
+
+def nombre_ronda(archivo):
+    """Nombre de ronda por defecto de una base: el nombre del archivo sin extensión."""
+    return os.path.splitext(os.path.basename(archivo))[0]
+
+
+def _carpeta_ronda(ronda):
+    """Nombre de carpeta seguro para un nombre de ronda."""
+    return re.sub(r'[^\w.-]+', '_', ronda).strip('._') or 'ronda'
+
+
+def describir_ronda(previa):
+    """Texto corto de una ronda guardada (ver RondasRevision.previa): archivo y fecha."""
+    if previa is None:
+        return 'Ninguna (esta ronda queda como la primera)'
+    return f"{previa['archivo']} · {previa['guardada']}"
+
+
+class RondasRevision:
+    """
+    Resultados por registro de la última ronda con ese nombre, en
+    {carpeta}/{ronda}/{tipo}.parquet, y de qué archivo salió cada una en
+    {tipo}.json. Sin version, se usa la de los diccionarios con que se clasifica.
+    """
+
+    def __init__(self, ronda, carpeta=RUTA_RONDAS, version=None):
+        self.ronda = ronda
+        self.carpeta = os.path.join(carpeta, _carpeta_ronda(ronda))
+        self.version = version
+
+    def _ruta(self, tipo, extension='.parquet'):
+        return os.path.join(self.carpeta, f'{tipo}{extension}')
+
+    def previa(self, tipo):
+        """{'ronda', 'archivo', 'guardada', 'registros'} de la ronda guardada de la posición; None si no hay."""
+        if not os.path.exists(self._ruta(tipo)):
+            return None
+        try:
+            with open(self._ruta(tipo, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'ronda': self.ronda, 'archivo': 'archivo sin registrar', 'guardada': 'fecha sin registrar',
+                    'registros': None}
+
+    def anterior(self, tipo):
+        """Resultados de la ronda anterior de la posición; None si no hay."""
+        ruta = self._ruta(tipo)
+        if not os.path.exists(ruta):
+            return None
+        anterior = pd.read_parquet(ruta)
+        return anterior if len(anterior) else None
+
+    def guardar(self, tipo, ronda, archivo=''):
+        """Reemplaza la ronda guardada de la posición (escritura atómica) y anota de qué archivo salió."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        temporal = self._ruta(tipo) + '.tmp'
+        ronda.to_parquet(temporal, index=False)
+        os.replace(temporal, self._ruta(tipo))
+        previa = {'ronda': self.ronda, 'archivo': archivo, 'registros': len(ronda),
+                  'guardada': datetime.now().strftime('%Y-%m-%d %H:%M')}
+        temporal = self._ruta(tipo, '.json.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(previa, f, ensure_ascii=False)
+        os.replace(temporal, self._ruta(tipo, '.json'))
+
+    def clasificar(self, tipo, df, diccionarios=None, archivo=''):
+        """
+        Clasifica los registros de una posición reutilizando los resultados de
+        la ronda anterior para los que no cambiaron, y guarda esta ronda.
+        diccionarios: versión con que se clasifica (por defecto, la vigente).
+        archivo: nombre de la base de esta ronda (se muestra en la siguiente).
+        Retorna (df con las columnas de clasificación, delta) donde delta es un
+        dict con las llaves de ETIQUETAS_DELTA; delta['anterior'] describe la
+        ronda con que se comparó.
+        """
+        diccionarios = diccionarios or diccionarios_vigentes()
+        version = self.version or version_cache(diccionarios)
+        faltan = [col for col in COLUMNAS_LLAVE if col not in df.columns]
+        if faltan:
+            raise ValueError(f"La revisión incremental necesita las columnas: {', '.join(faltan)}")
+
+        with etapa('comparación con ronda anterior', tipo, len(df)) as medicion:
+            llaves = _llaves_registro(df)
+            huellas = pd.util.hash_pandas_object(
+                llaves_entradas(df, POSICIONES[tipo]['entradas']), index=False).to_numpy()
+            previa = self.previa(tipo)
+            anterior = self.anterior(tipo)
+            if anterior is None:
+                previo = np.full(len(df), -1)
+                misma_huella = misma_version = np.zeros(len(df), dtype=bool)
+            else:
+                llaves_anteriores = _llaves_registro(anterior)
+                unicas = ~llaves_anteriores.duplicated(keep='last')
+                anterior, llaves_anteriores = anterior[unicas].reset_index(drop=True), llaves_anteriores[unicas]
+                previo = llaves_anteriores.get_indexer(llaves)
+                # Sin llave completa no hay cómo seguir el registro entre rondas
+                previo[llaves.to_frame().isna().any(axis=1).to_numpy()] = -1
+                misma_huella = (previo >= 0) & (anterior['huella'].to_numpy()[previo] == huellas)
+                misma_version = (previo >= 0) & (anterior['version'].to_numpy()[previo] == version)
+            reutilizar = misma_huella & misma_version
+            medicion['reutilizados'] = int(reutilizar.sum())
+
+        cambiados = np.flatnonzero(~reutilizar)
+        nuevos = clasificar_posicion(tipo, df.iloc[cambiados], diccionarios=diccionarios) if len(cambiados) else None
+
+        with etapa('guardar ronda', tipo, len(df)):
+            reutilizados = np.flatnonzero(reutilizar)
+            fuente = nuevos if nuevos is not None else anterior
+            df = df.copy(deep=False)
+            for col in [c for c in COLUMNAS_RESULTADO if c in fuente.columns]:
+                valores = np.empty(len(df), dtype=TIPOS_RESULTADO.get(col, object))
+                if len(reutilizados):
+                    valores[reutilizados] = anterior[col].to_numpy()[previo[reutilizados]]
+                if len(cambiados):
+                    valores[cambiados] = nuevos[col].to_numpy()
+                df[col] = valores
+
+            ronda = pd.DataFrame({col: llaves.get_level_values(col) for col in COLUMNAS_LLAVE})
+            ronda['huella'] = huellas
+            ronda['version'] = version
+            for col in [c for c in COLUMNAS_RESULTADO if c in df.columns]:
+                ronda[col] = df[col].to_numpy()
+            self.guardar(tipo, ronda.dropna(subset=COLUMNAS_LLAVE), archivo)
+
+        delta = self._delta(df, anterior, previo, reutilizar, misma_huella)
+        return df, {'anterior': describir_ronda(previa if anterior is not None else None), **delta}
+
+    @staticmethod
+    def _delta(df, anterior, previo, reutilizar, misma_huella):
+        """
+        Cambios frente a la ronda anterior (ver ETIQUETAS_DELTA). Los registros
+        con las mismas entradas que solo se reclasificaron porque cambió la
+        versión de reglas o diccionarios van en por_version, no en modificados.
+        """
+        pendiente = df['tipo_revision'].to_numpy() > 0
+        estaba = previo >= 0
+        pendiente_antes = np.zeros(len(df), dtype=bool)
+        ya_no_estan = 0
+        if anterior is not None:
+            pendientes_anteriores = anterior['tipo_revision'].to_numpy() > 0
+            pendiente_antes[estaba] = pendientes_anteriores[previo[estaba]]
+            presentes = np.zeros(len(anterior), dtype=bool)
+            presentes[previo[estaba]] = True
+            ya_no_estan = int((pendientes_anteriores & ~presentes).sum())
+        return {
+            'registros': len(df),
+            'nuevos': int((~estaba).sum()),
+            'modificados': int((estaba & ~misma_huella).sum()),
+            'por_version': int((misma_huella & ~reutilizar).sum()),
+            'reclasificados': int((~reutilizar).sum()),
+            'resueltos': int((pendiente_antes & ~pendiente).sum()),
+            'nuevos_pendientes': int((~pendiente_antes & pendiente).sum()),
+            'siguen_pendientes': int((pendiente_antes & pendiente).sum()),
+            'ya_no_estan': ya_no_estan,
+        }
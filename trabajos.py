@@ -0,0 +1,145 @@
+"""
+Cola de trabajos en segundo plano - GEIH
+
+La generación de los libros puede tardar minutos con bases grandes. En vez de
+correr en el hilo del script de Streamlit (que queda bloqueado hasta terminar),
+cada generación se envía como trabajo a un pool de hilos compartido por todas
+las sesiones. El trabajo informa su avance en el propio objeto Trabajo, la
+página lo consulta periódicamente, y los resultados terminados quedan en la
+tabla de trabajos hasta que se descartan por antigüedad o por cantidad.
+
+Las funciones de un trabajo no deben usar st.* (ni st.session_state ni las
+funciones con st.cache_data/st.cache_resource): corren fuera del script. Lo
+que calculan lo retornan en el resultado del trabajo, y lo que comparten entre
+trabajos va en un CacheCompartido.
+"""
+
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Trabajos que corren a la vez (el resto espera en cola)
+MAX_TRABAJOS_SIMULTANEOS = 2
+# Trabajos terminados que se conservan y por cuánto tiempo (segundos)
+MAX_TRABAJOS_TERMINADOS = 20
+VIDA_TRABAJO_TERMINADO = 2 * 60 * 60
+
+EN_COLA, EN_CURSO, TERMINADO, FALLIDO = 'en cola', 'en curso', 'terminado', 'fallido'
+
+
+class Trabajo:
+    """Estado, avance y resultado de un trabajo."""
+
+    def __init__(self, id_trabajo, descripcion):
+        self.id = id_trabajo
+        self.descripcion = descripcion
+        self.estado = EN_COLA
+        self.progreso = 0.0
+        self.mensaje = 'En cola...'
+        self.resultado = None
+        self.error = None
+        self.detalle_error = None
+        self.creado = time.time()
+        self.terminado = None
+
+    def avanzar(self, progreso, mensaje=None):
+        """Informa el avance (0 a 1) y, opcionalmente, un mensaje."""
+        self.progreso = min(max(progreso, 0.0), 1.0)
+        if mensaje is not None:
+            self.mensaje = mensaje
+
+    @property
+    def activo(self):
+        return self.estado in (EN_COLA, EN_CURSO)
+
+
+class ColaTrabajos:
+    """Pool de hilos con la tabla {id: Trabajo} de los trabajos enviados."""
+
+    def __init__(self, max_simultaneos=MAX_TRABAJOS_SIMULTANEOS, max_terminados=MAX_TRABAJOS_TERMINADOS,
+                 vida_terminado=VIDA_TRABAJO_TERMINADO):
+        self._pool = ThreadPoolExecutor(max_workers=max_simultaneos, thread_name_prefix='rev_ocupados')
+        self._trabajos = {}
+        self._candado = threading.Lock()
+        self._ids = itertools.count(1)
+        self.max_terminados = max_terminados
+        self.vida_terminado = vida_terminado
+
+    def enviar(self, descripcion, funcion, *argumentos):
+        """
+        Encola funcion(trabajo, *argumentos); lo que retorne queda en
+        trabajo.resultado. Retorna el Trabajo.
+        """
+        with self._candado:
+            self._depurar()
+            trabajo = Trabajo(f'{next(self._ids)}-{int(time.time())}', descripcion)
+            self._trabajos[trabajo.id] = trabajo
+        self._pool.submit(self._ejecutar, trabajo, funcion, argumentos)
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        """Trabajo con ese id; None si no existe o ya se descartó."""
+        with self._candado:
+            self._depurar()
+            return self._trabajos.get(id_trabajo)
+
+    @staticmethod
+    def _ejecutar(trabajo, funcion, argumentos):
+        trabajo.estado = EN_CURSO
+        trabajo.mensaje = 'Iniciando...'
+        try:
+            trabajo.resultado = funcion(trabajo, *argumentos)
+            trabajo.avanzar(1.0, '¡Completado!')
+            trabajo.estado = TERMINADO
+        except Exception as e:
+            trabajo.error = str(e) or type(e).__name__
+            trabajo.detalle_error = traceback.format_exc()
+            trabajo.estado = FALLIDO
+        finally:
+            trabajo.terminado = time.time()
+
+    def _depurar(self):
+        """Descarta trabajos terminados vencidos y los más antiguos sobre el máximo."""
+        ahora = time.time()
+        terminados = sorted((t for t in self._trabajos.values() if not t.activo), key=lambda t: t.terminado)
+        vencidos = [t for t in terminados if ahora - t.terminado > self.vida_terminado]
+        sobrantes = terminados[:max(len(terminados) - self.max_terminados, 0)]
+        for trabajo in vencidos + sobrantes:
+            self._trabajos.pop(trabajo.id, None)
+
+
+class CacheCompartido:
+    """
+    Resultados por llave compartidos entre trabajos, con los max_entradas
+    usados más recientemente. Cada llave se calcula una sola vez: si dos
+    trabajos la piden a la vez, el segundo espera el resultado del primero.
+    Si el cálculo falla, la llave no queda guardada.
+    """
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, llave, calcular):
+        """Resultado de la llave; si no está, lo calcula con calcular()."""
+        with self._candado:
+            futuro = self._entradas.get(llave)
+            propio = futuro is None
+            if propio:
+                futuro = self._entradas[llave] = Future()
+            self._entradas.move_to_end(llave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        if propio:
+            try:
+                futuro.set_result(calcular())
+            except BaseException as e:
+                with self._candado:
+                    if self._entradas.get(llave) is futuro:
+                        del self._entradas[llave]
+                futuro.set_exception(e)
+        return futuro.result()